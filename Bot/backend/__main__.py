@@ -0,0 +1,26 @@
+"""
+Server entry point - python -m backend (python -m backend.main runs this too).
+
+Starts uvicorn on $PORT: a single development server with reload, or with
+RAG_WORKERS>1 the forked production server (see backend.serving). The app
+module, backend.main, is only imported by the process that serves it, so its
+engine, worker pool and conversation store are built once per process.
+"""
+
+import os
+
+
+def run():
+    port = int(os.environ.get("PORT", 8000))
+    workers = int(os.environ.get("RAG_WORKERS", 1))
+    if workers > 1:
+        # Production mode: one shared read-only index, N forked workers
+        from backend.serving import serve
+        serve("0.0.0.0", port, workers)
+    else:
+        import uvicorn
+        uvicorn.run("backend.main:app", host="0.0.0.0", port=port, reload=True)
+
+
+if __name__ == "__main__":
+    run()
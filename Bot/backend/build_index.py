@@ -0,0 +1,123 @@
+"""
+Build Index - Offline command that builds the search index the server loads.
+
+Handles:
+- Parsing the knowledge base and fitting both TF-IDF vectorizers, with the
+  tokenizing spread over a process pool (backend.parallel_tfidf)
+- Fitting the dense projection too, for servers running RAG_RETRIEVAL=dense
+- Writing the index directory with its manifest: the knowledge base hash, vectorizer
+  and library versions, how it was built, and a SHA-256 checksum of every file
+- Verifying an existing index against its checksums and a knowledge base
+- Converting the legacy pickle index
+
+A server started with RAG_PREBUILT_INDEX=1 only loads this artifact and refuses
+to start if it does not match its knowledge base.
+
+Run as:
+    python -m backend.build_index [--kb PATH] [--out DIR] [--workers N]
+    python -m backend.build_index --verify [--kb PATH] [--out DIR]
+    python -m backend.build_index --convert-legacy
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from backend.defaults import DEFAULT_KB_PATH, INDEX_DIR
+from backend.dense_index import DEFAULT_OPTIONS as DENSE_DEFAULTS
+from backend.index_manifest import compare_manifests
+from backend.markdown_parser import iter_knowledge_base, parse_knowledge_base
+from backend.vector_store import RETRIEVAL_MODES, VectorStore
+
+
+def _dir_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def build(kb_path: str, index_dir: str, workers: int, retrieval: str = "brute", dense_options=None) -> dict:
+    """Build and save the index for `kb_path`. Returns the saved manifest's build info."""
+    started = time.perf_counter()
+    documents = parse_knowledge_base(kb_path)
+    parsed = time.perf_counter()
+    print(f"Parsed {len(documents)} Q&A pairs from {kb_path} in {parsed - started:.2f}s")
+
+    # Dense retrieval stores its projection with the index; the other modes
+    # derive everything else from the TF-IDF matrices when the index is loaded
+    store = VectorStore(retrieval="dense" if retrieval == "dense" else "brute", dense_options=dense_options)
+    store.build_index(documents, workers=workers)
+    fitted = time.perf_counter()
+
+    build_info = {
+        "tool": "backend.build_index",
+        "kb_path": kb_path,
+        "workers": workers,
+        "retrieval": retrieval,
+        "parse_seconds": round(parsed - started, 3),
+        "fit_seconds": round(fitted - parsed, 3),
+    }
+    with store.lock(index_dir):
+        store.save_index(index_dir, build_info=build_info)
+    build_info["save_seconds"] = round(time.perf_counter() - fitted, 3)
+
+    print(
+        f"Index version {store.kb_hash[:16]}: {store.ntotal} documents, "
+        f"{len(store.vectorizer.vocabulary_)} + {len(store.question_vectorizer.vocabulary_)} terms, "
+        f"{_dir_size(index_dir) / 1e6:.1f} MB in {index_dir}"
+    )
+    print(f"Built in {time.perf_counter() - started:.2f}s (fit {build_info['fit_seconds']}s, workers={workers})")
+    return build_info
+
+
+def verify(kb_path: str, index_dir: str) -> bool:
+    """Check the index files against their checksums and the manifest against the knowledge base."""
+    problem = VectorStore.verify_index(index_dir)
+    if problem:
+        print(f"{index_dir}: {problem}")
+        return False
+    stored = VectorStore.read_manifest(index_dir)
+    expected = VectorStore().manifest(iter_knowledge_base(kb_path))
+    reusable, reason = compare_manifests(stored, expected)
+    if not reusable:
+        print(f"{index_dir}: does not match {kb_path} ({reason})")
+        return False
+    print(f"{index_dir}: index version {stored['kb_hash'][:16]} matches {kb_path}, checksums OK")
+    return True
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build the search index for the knowledge base.")
+    parser.add_argument("--kb", default=os.environ.get("RAG_KB_PATH", DEFAULT_KB_PATH),
+                        help="Knowledge base: a Markdown file, a directory of .md shards, or a glob")
+    parser.add_argument("--out", default=os.environ.get("RAG_INDEX_DIR", INDEX_DIR), help="Index directory")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Tokenizing processes (default: one per CPU)")
+    parser.add_argument("--retrieval", choices=RETRIEVAL_MODES, default=os.environ.get("RAG_RETRIEVAL", "brute"),
+                        help="Retrieval mode of the servers; dense also fits the dense projection")
+    parser.add_argument("--dense-dim", type=int,
+                        default=int(os.environ.get("RAG_DENSE_DIM", DENSE_DEFAULTS["n_components"])))
+    parser.add_argument("--dense-dtype", default=os.environ.get("RAG_DENSE_DTYPE", DENSE_DEFAULTS["dtype"]))
+    parser.add_argument("--dense-nlist", type=int,
+                        default=int(os.environ.get("RAG_DENSE_NLIST", DENSE_DEFAULTS["nlist"])))
+    parser.add_argument("--verify", action="store_true", help="Verify an existing index instead of building one")
+    parser.add_argument("--convert-legacy", action="store_true", help="Convert the legacy pickle index")
+    args = parser.parse_args(argv)
+
+    if args.convert_legacy:
+        if not VectorStore().convert_legacy_index(args.out):
+            print("Nothing to convert.")
+        return 0
+    if args.verify:
+        return 0 if verify(args.kb, args.out) else 1
+
+    dense_options = {"n_components": args.dense_dim, "dtype": args.dense_dtype, "nlist": args.dense_nlist}
+    build(args.kb, args.out, max(1, args.workers), args.retrieval, dense_options)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
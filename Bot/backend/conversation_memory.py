@@ -0,0 +1,188 @@
+"""
+Conversation Memory - Per-user chat history for multi-turn conversations.
+
+Handles:
+- A bounded ring buffer of recent messages per user
+- Evicting idle users, and least-recently-active ones over the user or memory budget
+- Write-behind to a durable ConversationStore, and loading non-resident users from it
+  when their history is read (writes never wait for the store)
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from backend.conversation_store import ConversationStore
+
+
+# Rough per-message bookkeeping cost (dict, deque slot, strings) added to the text size
+MESSAGE_OVERHEAD_BYTES = 200
+
+
+class ConversationMemory:
+    """
+    In-memory conversation history per user (thread-safe).
+
+    Each user keeps a fixed-size ring buffer of the last `max_history` messages.
+    Users are kept in least-recently-active order and evicted when idle for
+    longer than `idle_ttl` seconds, or when there are more than `max_users`
+    of them or the histories exceed `max_bytes` in total.
+
+    With a durable `store`, this is the hot tier: writes go to the store in the
+    background and users who are not resident are loaded from it on demand.
+    A message for a non-resident user starts a partial buffer holding only the
+    new messages; the older ones are read from the store on the next
+    get_history, never on the write path.
+    """
+
+    def __init__(self, max_history: int = 20, max_users: int = 10000,
+                 idle_ttl: float = 3600.0, max_bytes: int = 64 * 1024 * 1024,
+                 store: Optional[ConversationStore] = None):
+        self.store = store
+        self.histories: "OrderedDict[str, deque]" = OrderedDict()
+        self.max_history = max_history
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.evictions = {"idle": 0, "lru": 0, "memory": 0}
+        self._last_seen: Dict[str, float] = {}
+        self._bytes: Dict[str, int] = {}
+        # Resident users whose older messages are still only in the store, with the
+        # number of messages added since they became resident
+        self._partial: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _message_size(message: Dict) -> int:
+        return len(message["text"]) + MESSAGE_OVERHEAD_BYTES
+
+    def _drop(self, user_id: str, reason: Optional[str] = None):
+        self.histories.pop(user_id, None)
+        self._last_seen.pop(user_id, None)
+        self._partial.pop(user_id, None)
+        self.total_bytes -= self._bytes.pop(user_id, 0)
+        if reason:
+            self.evictions[reason] += 1
+
+    def _evict(self, now: float, keep: Optional[str] = None):
+        """Evict idle users, then least-recently-active ones while over budget."""
+        while self.histories:
+            oldest = next(iter(self.histories))
+            if oldest == keep:
+                break
+            if self.idle_ttl and now - self._last_seen[oldest] > self.idle_ttl:
+                self._drop(oldest, "idle")
+            elif len(self.histories) > self.max_users:
+                self._drop(oldest, "lru")
+            elif self.total_bytes > self.max_bytes:
+                self._drop(oldest, "memory")
+            else:
+                break
+
+    def _make_resident(self, user_id: str, messages: List[Dict]) -> deque:
+        """Create the hot-tier ring buffer for a user (caller holds the lock)."""
+        history = self.histories[user_id] = deque(messages, maxlen=self.max_history)
+        size = sum(self._message_size(m) for m in history)
+        self._bytes[user_id] = size
+        self.total_bytes += size
+        return history
+
+    def add_message(self, user_id: str, role: str, text: str):
+        message = {"role": role, "text": text}
+        size = self._message_size(message)
+        now = time.monotonic()
+        with self._lock:
+            history = self.histories.get(user_id)
+            if history is None:
+                history = self._make_resident(user_id, [])
+                if self.store is not None:
+                    self._partial[user_id] = 0
+            else:
+                self.histories.move_to_end(user_id)
+
+            # The ring buffer drops its oldest message when full
+            if len(history) == history.maxlen:
+                dropped = self._message_size(history[0])
+                self._bytes[user_id] -= dropped
+                self.total_bytes -= dropped
+            history.append(message)
+            self._bytes[user_id] += size
+            self.total_bytes += size
+            self._last_seen[user_id] = now
+            if user_id in self._partial:
+                self._partial[user_id] += 1
+
+            self._evict(now, keep=user_id)
+
+            # Queued under the lock, so the store sees this user's writes in order
+            if self.store is not None:
+                self.store.append(user_id, role, text)
+
+    def add_exchanges(self, user_id: str, exchanges: Sequence[Tuple[str, str]]):
+        """
+        Record (question, answer) exchanges. One call for all of them, which is
+        one round trip when the memory is shared through a manager process.
+        """
+        for question, answer in exchanges:
+            self.add_message(user_id, "user", question)
+            self.add_message(user_id, "bot", answer)
+
+    def get_history(self, user_id: str, attempts: int = 3) -> List[Dict]:
+        for _ in range(attempts):
+            now = time.monotonic()
+            with self._lock:
+                history = self.histories.get(user_id)
+                if history is not None and self.idle_ttl and now - self._last_seen[user_id] > self.idle_ttl:
+                    self._drop(user_id, "idle")
+                    history = None
+                if history is not None:
+                    self.histories.move_to_end(user_id)
+                    self._last_seen[user_id] = now
+                    if user_id not in self._partial:
+                        return list(history)
+                if self.store is None:
+                    return []
+                added = self._partial.get(user_id)
+
+            # Not resident, or only its newest messages are: the store has the whole
+            # history, including the writes it has not committed yet
+            stored = self.store.load_history(user_id, self.max_history)
+            with self._lock:
+                if self._partial.get(user_id) != added:
+                    continue  # Written to during the read; read again
+                self._drop(user_id)
+                if stored:
+                    self._make_resident(user_id, stored)
+                    self._last_seen[user_id] = now
+                    self._evict(now, keep=user_id)
+                return stored
+
+        # Still being written to: return the newest messages only
+        with self._lock:
+            history = self.histories.get(user_id)
+            return list(history) if history is not None else []
+
+    def clear_history(self, user_id: str):
+        with self._lock:
+            self._drop(user_id)
+            if self.store is not None:
+                self.store.clear(user_id)
+
+    def close(self):
+        """Flush pending writes to the durable store, if any."""
+        if self.store is not None:
+            self.store.close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "store": self.store.stats() if self.store is not None else None,
+                "resident_users": len(self.histories),
+                "total_bytes": self.total_bytes,
+                "max_users": self.max_users,
+                "max_bytes": self.max_bytes,
+                "idle_ttl": self.idle_ttl,
+                "evictions": dict(self.evictions),
+            }
@@ -0,0 +1,223 @@
+"""
+Conversation Store - Durable backends behind ConversationMemory.
+
+Handles:
+- A storage interface (append / load recent history / clear) for conversation messages
+- An embedded SQLite backend in WAL mode
+- Batched, asynchronous writes on a background thread, off the request path
+- Read-your-writes for messages still queued, from a per-user overlay of pending writes
+- Trimming each user's stored history to the retained number of messages
+"""
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationStore:
+    """Interface for durable conversation storage."""
+
+    def append(self, user_id: str, role: str, text: str):
+        raise NotImplementedError
+
+    def load_history(self, user_id: str, limit: int) -> List[Dict]:
+        """Return up to `limit` most recent messages for a user, oldest first."""
+        raise NotImplementedError
+
+    def clear(self, user_id: str):
+        raise NotImplementedError
+
+    def flush(self):
+        """Block until all accepted writes are persisted."""
+
+    def close(self):
+        """Flush and release resources."""
+
+    def stats(self) -> Dict:
+        return {}
+
+
+_CLOSE = object()
+
+
+class SQLiteConversationStore(ConversationStore):
+    """
+    SQLite-backed store. Writes are queued and committed in batches by a
+    background thread, so request handlers never wait on the disk. Until a
+    write is committed it is also kept in a per-user overlay, which reads
+    apply on top of the database instead of waiting for the queue to drain.
+    """
+
+    def __init__(self, path: str, retain: int = 20, batch_size: int = 256,
+                 flush_interval: float = 0.05):
+        self.path = path
+        self.retain = retain
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.batches = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        # Queued, uncommitted operations per user, in queue order
+        self._pending: Dict[str, Deque[tuple]] = {}
+        self._pending_lock = threading.Lock()
+        # Held by reads and by the writer while it commits a batch and drops it from
+        # the overlay, so a read sees each operation exactly once
+        self._commit_lock = threading.Lock()
+
+        self._reader = self._connect()
+        self._reader.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                text TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_user ON messages (user_id, id);
+        """)
+
+        # Started on first write, so an idle store costs one open connection
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL: commits are durable across crashes of the process, and
+        # fsync happens at checkpoints rather than on every batch
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _submit(self, op: tuple):
+        with self._pending_lock:
+            self._pending.setdefault(op[1], deque()).append(op)
+        if self._writer is None:
+            with self._writer_lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(
+                        target=self._write_loop, name="conversation-writer", daemon=True
+                    )
+                    self._writer.start()
+        self._queue.put(op)
+
+    # --- Request path (non-blocking) ---
+
+    def append(self, user_id: str, role: str, text: str):
+        self._submit(("append", user_id, role, text, time.time()))
+
+    def clear(self, user_id: str):
+        self._submit(("clear", user_id))
+
+    def load_history(self, user_id: str, limit: int) -> List[Dict]:
+        with self._commit_lock:
+            with self._pending_lock:
+                pending = list(self._pending.get(user_id, ()))
+            if any(op[0] == "clear" for op in pending):
+                rows = []
+            else:
+                rows = self._reader.execute(
+                    "SELECT role, text FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                    (user_id, limit),
+                ).fetchall()
+        messages = [{"role": role, "text": text} for role, text in reversed(rows)]
+        # Apply the writes still waiting in the queue
+        for op in pending:
+            if op[0] == "append":
+                messages.append({"role": op[2], "text": op[3]})
+            else:
+                messages.clear()
+        return messages[-limit:] if limit else []
+
+    def flush(self):
+        self._queue.join()
+
+    def close(self):
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(_CLOSE)
+            self._writer.join()
+        self._reader.close()
+
+    def stats(self) -> Dict:
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "pending_writes": self._queue.unfinished_tasks,
+            "written": self.written,
+            "batches": self.batches,
+        }
+
+    # --- Background writer ---
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            ops = [self._queue.get()]
+            # Collect a batch: whatever arrives within flush_interval, up to batch_size
+            deadline = time.monotonic() + self.flush_interval
+            while len(ops) < self.batch_size and ops[-1] is not _CLOSE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    ops.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            closing = ops[-1] is _CLOSE
+            if closing:
+                ops.pop()
+            try:
+                with self._commit_lock:
+                    try:
+                        self._write_batch(conn, ops)
+                    finally:
+                        self._drop_pending(ops)
+            except sqlite3.Error:
+                logger.exception(f"Failed to persist {len(ops)} conversation operations")
+            finally:
+                for _ in range(len(ops) + closing):
+                    self._queue.task_done()
+            if closing:
+                conn.close()
+                return
+
+    def _drop_pending(self, ops: List[tuple]):
+        """Remove written (or failed) operations from the overlay; they are its oldest."""
+        with self._pending_lock:
+            for op in ops:
+                pending = self._pending[op[1]]
+                pending.popleft()
+                if not pending:
+                    del self._pending[op[1]]
+
+    def _write_batch(self, conn: sqlite3.Connection, ops: List[tuple]):
+        if not ops:
+            return
+        touched = set()
+        with conn:
+            for op in ops:
+                if op[0] == "append":
+                    _, user_id, role, text, created = op
+                    conn.execute(
+                        "INSERT INTO messages (user_id, role, text, created) VALUES (?, ?, ?, ?)",
+                        (user_id, role, text, created),
+                    )
+                    touched.add(user_id)
+                else:
+                    conn.execute("DELETE FROM messages WHERE user_id = ?", (op[1],))
+                    touched.discard(op[1])
+            # Keep only the most recent `retain` messages per user
+            for user_id in touched:
+                conn.execute(
+                    "DELETE FROM messages WHERE user_id = ? AND id <= ("
+                    "SELECT id FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    (user_id, user_id, self.retain),
+                )
+        self.written += len(ops)
+        self.batches += 1
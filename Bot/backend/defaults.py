@@ -0,0 +1,30 @@
+"""
+Defaults - Default file locations and question normalization.
+
+Handles:
+- Default locations of the knowledge base, the synonyms file and the persisted index
+- The name of an index directory's manifest file
+- Question normalization shared by the exact-match index, query expansion,
+  the answer cache and request coalescing
+
+Standard library only: the server imports this before it binds its port, and
+must not pull in numpy, scipy or scikit-learn to do so.
+"""
+
+import os
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+# Default knowledge base location (a file, a directory of .md shards, or a glob)
+DEFAULT_KB_PATH = os.path.join(DATA_DIR, "knowledge.md")
+
+DEFAULT_SYNONYMS_PATH = os.path.join(DATA_DIR, "synonyms.json")
+
+# Default location of the persisted index
+INDEX_DIR = os.path.join(DATA_DIR, "index")
+MANIFEST_NAME = "manifest.json"
+
+
+def normalize_question(user_question: str) -> str:
+    """Normalization shared by query expansion and the answer cache key."""
+    return user_question.lower().strip().rstrip("?").rstrip(".")
@@ -0,0 +1,262 @@
+"""
+Dense Index - Low-rank (LSA) retrieval over quantized document vectors.
+
+Handles:
+- Projecting the stacked question + document TF-IDF matrices into a low-rank space (truncated SVD)
+- Storing document vectors as int8 (with one scale per row) or float16
+- Scoring queries with contiguous block matrix products over the quantized rows
+- An optional coarse partitioning (IVF): rows are clustered with k-means and stored
+  partition by partition, and a query only scans its `nprobe` closest partitions
+- Persisting the projection next to the TF-IDF index (memory-mapped on load)
+
+Dense scores approximate the brute-force combined score. VectorStore uses them to
+pick the best `rerank` candidates and reports their exact score, so a confidence
+is never higher than brute force would give. With `rerank` set to 0 the dense
+scores are returned as they are.
+"""
+
+import json
+import os
+import shutil
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+DENSE_DIR = "dense"
+DENSE_FORMAT_VERSION = 1
+DTYPES = ("int8", "float16", "float32")
+
+# Rows dequantized per block while scanning (bounds the float32 scratch memory)
+BLOCK_ROWS = 32768
+
+DEFAULT_OPTIONS = {
+    "n_components": 128,
+    "dtype": "int8",
+    "nlist": 0,    # Number of IVF partitions (0 = scan every row)
+    "nprobe": 8,   # Partitions scanned per query
+    "rerank": 50,  # Best dense hits rescored with the exact TF-IDF formula (0 = dense scores only)
+}
+
+# Options that change the stored vectors; the others are query-time settings
+_STORED_OPTIONS = ("n_components", "dtype", "nlist")
+QUERY_OPTIONS = ("nprobe", "rerank")
+
+
+def stored_options(options: Dict) -> Dict:
+    """The `options` (over the defaults) that change the stored vectors."""
+    options = dict(DEFAULT_OPTIONS, **options)
+    return {key: options[key] for key in _STORED_OPTIONS}
+
+
+def _stack(doc_matrix: sp.spmatrix, question_matrix: Optional[sp.spmatrix]) -> sp.csr_matrix:
+    blocks = [question_matrix, doc_matrix] if question_matrix is not None else [doc_matrix]
+    return sp.hstack(blocks, format="csr")
+
+
+def _quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    return vectors.astype(dtype), None
+
+
+class DenseIndex:
+    """Quantized low-rank document vectors plus the projection used for queries."""
+
+    def __init__(self, components: np.ndarray, codes: np.ndarray, scales: Optional[np.ndarray],
+                 question_features: int, kb_hash: Optional[str], options: Dict,
+                 row_ids: Optional[np.ndarray] = None, centroids: Optional[np.ndarray] = None,
+                 offsets: Optional[np.ndarray] = None):
+        self.components = components          # (n_features, n_components) float32
+        self.codes = codes                    # (n_rows, n_components) int8/float16/float32
+        self.scales = scales                  # (n_rows,) float32 for int8, else None
+        self.question_features = question_features
+        self.kb_hash = kb_hash
+        self.options = dict(DEFAULT_OPTIONS, **options)
+        # IVF layout: stored row i is document row_ids[i]; partition p is rows offsets[p]:offsets[p+1]
+        self.row_ids = row_ids
+        self.centroids = centroids
+        self.offsets = offsets
+
+    @property
+    def n_components(self) -> int:
+        return self.components.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.components, self.codes, self.scales, self.row_ids, self.centroids, self.offsets)
+        return sum(a.nbytes for a in arrays if a is not None)
+
+    # --- Building ---
+
+    @classmethod
+    def fit(cls, doc_matrix: sp.spmatrix, question_matrix: Optional[sp.spmatrix],
+            kb_hash: Optional[str] = None, **options) -> "DenseIndex":
+        """Fit the projection (and IVF partitions) on the current matrices."""
+        from sklearn.decomposition import TruncatedSVD
+
+        options = dict(DEFAULT_OPTIONS, **options)
+        if options["dtype"] not in DTYPES:
+            raise ValueError(f"Unknown dense dtype: {options['dtype']!r} (expected one of {DTYPES})")
+        stacked = _stack(doc_matrix, question_matrix)
+        # Tiny corpora cannot support the requested rank
+        n_components = max(1, min(options["n_components"], min(stacked.shape) - 1))
+
+        print(f"Fitting {n_components}-dimensional dense projection...")
+        svd = TruncatedSVD(n_components=n_components, algorithm="randomized", random_state=0)
+        svd.fit(stacked)
+        components = np.ascontiguousarray(svd.components_.T, dtype=np.float32)
+
+        question_features = question_matrix.shape[1] if question_matrix is not None else 0
+        index = cls(components, np.empty((0, n_components), dtype=options["dtype"]), None,
+                    question_features, kb_hash, options)
+        vectors = index._project_rows(stacked)
+        if options["nlist"] > 0:
+            index.centroids = index._fit_partitions(vectors)
+        index._store_vectors(vectors)
+        return index
+
+    def refresh(self, doc_matrix: sp.spmatrix, question_matrix: Optional[sp.spmatrix],
+                kb_hash: Optional[str] = None) -> "DenseIndex":
+        """
+        Re-project changed matrices with the existing projection and partitions
+        (fold-in). Used after incremental updates, where the vocabulary is frozen.
+        """
+        index = DenseIndex(self.components, self.codes, self.scales, self.question_features,
+                           kb_hash, self.options, centroids=self.centroids)
+        index._store_vectors(index._project_rows(_stack(doc_matrix, question_matrix)))
+        return index
+
+    def _project_rows(self, stacked: sp.csr_matrix) -> np.ndarray:
+        return np.asarray(stacked @ self.components, dtype=np.float32)
+
+    def _fit_partitions(self, vectors: np.ndarray) -> np.ndarray:
+        from sklearn.cluster import MiniBatchKMeans
+
+        nlist = min(self.options["nlist"], len(vectors))
+        kmeans = MiniBatchKMeans(n_clusters=nlist, random_state=0, n_init=3, batch_size=4096)
+        kmeans.fit(self._normalize(vectors))
+        return self._normalize(kmeans.cluster_centers_.astype(np.float32))
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _store_vectors(self, vectors: np.ndarray):
+        if self.centroids is not None:
+            # Lay the rows out partition by partition so a probe is a contiguous slice
+            labels = np.argmax(self._normalize(vectors) @ self.centroids.T, axis=1)
+            self.row_ids = np.argsort(labels, kind="stable")
+            self.offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=len(self.centroids)))])
+            vectors = vectors[self.row_ids]
+        self.codes, self.scales = _quantize(vectors, self.options["dtype"])
+
+    # --- Querying ---
+
+    def project_queries(self, query_vecs: sp.spmatrix, q_vecs: Optional[sp.spmatrix],
+                        question_weight: float, doc_weight: float) -> np.ndarray:
+        """Latent vectors of already-vectorized queries, weighted like the combined score."""
+        # float32 queries, so only the touched component rows are read (a float64
+        # query would upcast the whole projection on every call)
+        query_vecs = query_vecs.astype(np.float32)
+        if q_vecs is None or not self.question_features:
+            return np.asarray(query_vecs @ self.components)
+        q_vecs = q_vecs.astype(np.float32)
+        latent = question_weight * (q_vecs @ self.components[:self.question_features])
+        latent += doc_weight * (query_vecs @ self.components[self.question_features:])
+        return np.asarray(latent, dtype=np.float32)
+
+    def _score_rows(self, latent: np.ndarray, start: int, end: int) -> np.ndarray:
+        """Scores of stored rows start:end for every query, shape (n_queries, end - start)."""
+        scores = np.empty((len(latent), end - start), dtype=np.float32)
+        for block in range(start, end, BLOCK_ROWS):
+            stop = min(block + BLOCK_ROWS, end)
+            block_scores = self.codes[block:stop].astype(np.float32) @ latent.T
+            if self.scales is not None:
+                block_scores *= self.scales[block:stop, None]
+            scores[:, block - start:stop - start] = block_scores.T
+        return scores
+
+    def search(self, latent: np.ndarray, top_k: int, select) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Top-k (document rows, scores) per query. `select(scores, top_k)` picks
+        the best positions of a score vector, best first.
+        """
+        if self.centroids is None:
+            scores = self._score_rows(latent, 0, len(self.codes))
+            results = []
+            for row in scores:
+                top = select(row, top_k)
+                results.append((top, row[top]))
+            return results
+
+        nprobe = min(self.options["nprobe"], len(self.centroids))
+        probes = np.argsort(-(latent @ self.centroids.T), axis=1, kind="stable")[:, :nprobe]
+        results = []
+        for query, partitions in zip(latent, probes):
+            parts = [self._score_rows(query[None, :], self.offsets[p], self.offsets[p + 1])[0]
+                     for p in np.sort(partitions)]
+            rows = np.concatenate([np.arange(self.offsets[p], self.offsets[p + 1]) for p in np.sort(partitions)])
+            scores = np.concatenate(parts) if parts else np.empty(0, dtype=np.float32)
+            # Select in document order so ties resolve like the other retrieval modes
+            docs = self.row_ids[rows]
+            order = np.argsort(docs, kind="stable")
+            docs, scores = docs[order], scores[order]
+            top = select(scores, top_k)
+            results.append((docs[top], scores[top]))
+        return results
+
+    # --- Persistence ---
+
+    def built_with(self, options: Dict) -> bool:
+        """True if the stored vectors were built with the same `options` (query-time ones aside)."""
+        return stored_options(self.options) == stored_options(options)
+
+    def save(self, directory: str):
+        """Write the index to `directory` (replaced atomically)."""
+        tmp_dir = f"{directory}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        arrays = {
+            "components": self.components, "codes": self.codes, "scales": self.scales,
+            "row_ids": self.row_ids, "centroids": self.centroids, "offsets": self.offsets,
+        }
+        for name, array in arrays.items():
+            if array is not None:
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(array))
+        meta = {
+            "format_version": DENSE_FORMAT_VERSION,
+            "kb_hash": self.kb_hash,
+            "question_features": self.question_features,
+            "options": self.options,
+            "arrays": sorted(name for name, array in arrays.items() if array is not None),
+        }
+        with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.rename(tmp_dir, directory)
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode: Optional[str] = "r") -> Optional["DenseIndex"]:
+        """Map a saved index, or return None if there is none (or it has another format)."""
+        try:
+            with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("format_version") != DENSE_FORMAT_VERSION:
+            return None
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in meta["arrays"]
+        }
+        return cls(
+            arrays["components"], arrays["codes"], arrays.get("scales"),
+            meta["question_features"], meta["kb_hash"], meta["options"],
+            row_ids=arrays.get("row_ids"), centroids=arrays.get("centroids"), offsets=arrays.get("offsets"),
+        )
@@ -0,0 +1,156 @@
+"""
+Exact Index - Fast path for questions that name an existing Q&A pair.
+
+Handles:
+- A hash index from normalized question text (and common variants) to the document
+- An optional character-trigram index for typo-tolerant lookups
+- Hit/miss counters, so the share of traffic that skips vector search is visible
+
+Keys are the question's words, lowercased and joined by single spaces, so case,
+punctuation and spacing do not matter ("Logging Out", "logging out?"). A question
+is also indexed without its leading question phrase ("How do I create a diary
+entry?" -> "create a diary entry"), unless several questions share that variant.
+"""
+
+import math
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from backend.defaults import normalize_question
+
+_WORD_RE = re.compile(r"\w+")
+
+# Leading phrases stripped to form the variant key (longest first)
+QUESTION_PREFIXES = tuple(sorted((
+    "how do i", "how can i", "how do you", "how to", "how does", "can i", "is it possible to",
+    "what is", "what are", "what does", "where is", "where can i", "why is", "why does",
+    "is there", "are there", "do i", "does",
+), key=len, reverse=True))
+
+# Dice similarity of character trigrams needed for a typo-tolerant match, and how
+# far ahead of the next question it must be (titles like "Blocking a User" and
+# "Unblocking a User" are closer to each other than most typos)
+TYPO_THRESHOLD = 0.75
+TYPO_MARGIN = 0.05
+
+# Shorter keys have too few trigrams to tell a typo from another question
+TYPO_MIN_LENGTH = 6
+
+# Marker for variant keys shared by several questions
+_AMBIGUOUS = -1
+
+
+def question_key(text: str) -> str:
+    return " ".join(_WORD_RE.findall(normalize_question(text)))
+
+
+def _strip_prefix(key: str) -> Optional[str]:
+    for prefix in QUESTION_PREFIXES:
+        if key.startswith(prefix + " "):
+            return key[len(prefix) + 1:]
+    return None
+
+
+def _trigrams(key: str) -> frozenset:
+    padded = f"  {key} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class ExactIndex:
+    """Normalized question -> document row, built from the rows of a VectorStore."""
+
+    def __init__(self, documents: Sequence, live_rows: Iterable[int], typo_tolerance: bool = False):
+        self.documents = documents
+        self.keys: Dict[str, int] = {}
+        self.variants: Dict[str, int] = {}
+        for row in live_rows:
+            key = question_key(documents[row]["question"])
+            if not key or key in self.keys:
+                continue  # Duplicate questions: the first row wins
+            self.keys[key] = row
+            variant = _strip_prefix(key)
+            if variant:
+                previous = self.variants.get(variant)
+                self.variants[variant] = row if previous is None or previous == row else _AMBIGUOUS
+
+        self.typo_tolerance = typo_tolerance
+        self._key_trigrams: List[frozenset] = []
+        self._key_rows: List[int] = []
+        self._postings: Dict[str, List[int]] = {}
+        if typo_tolerance:
+            for key, row in self.keys.items():
+                trigrams = _trigrams(key)
+                key_id = len(self._key_rows)
+                self._key_rows.append(row)
+                self._key_trigrams.append(trigrams)
+                for trigram in trigrams:
+                    self._postings.setdefault(trigram, []).append(key_id)
+
+        self.hits = 0
+        self.typo_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, user_question: str) -> Optional[Tuple[dict, float]]:
+        """(document, 1.0) if the question names an indexed question, else None."""
+        key = question_key(user_question)
+        row = self.keys.get(key)
+        if row is None:
+            row = self.variants.get(key)
+        if row is None:
+            variant = _strip_prefix(key)
+            if variant:
+                row = self.keys.get(variant, self.variants.get(variant))
+        if row is not None and row != _AMBIGUOUS:
+            with self._lock:
+                self.hits += 1
+            return self.documents[row], 1.0
+
+        if self.typo_tolerance and len(key) >= TYPO_MIN_LENGTH:
+            row = self._closest_row(key)
+            if row is not None:
+                with self._lock:
+                    self.typo_hits += 1
+                return self.documents[row], 1.0
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _closest_row(self, key: str) -> Optional[int]:
+        """The row whose question is a clear best trigram match above TYPO_THRESHOLD."""
+        trigrams = _trigrams(key)
+        # A match shares at least `needed` of the query's trigrams, so it contains
+        # one of its len - needed + 1 rarest ones (prefix filtering)
+        needed = math.ceil(TYPO_THRESHOLD * len(trigrams) / (2 - TYPO_THRESHOLD) - 1e-9)
+        rarest = sorted(trigrams, key=lambda t: len(self._postings.get(t, ())))
+        candidates = set()
+        for trigram in rarest[:len(trigrams) - needed + 1]:
+            candidates.update(self._postings.get(trigram, ()))
+
+        best_row, best_score, runner_up = None, 0.0, 0.0
+        for key_id in candidates:
+            other = self._key_trigrams[key_id]
+            score = 2 * len(trigrams & other) / (len(trigrams) + len(other))
+            if score > best_score:
+                best_row, best_score, runner_up = self._key_rows[key_id], score, best_score
+            elif score > runner_up:
+                runner_up = score
+        if best_score < TYPO_THRESHOLD or best_score - runner_up < TYPO_MARGIN:
+            return None
+        return best_row
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.typo_hits + self.misses
+        return {
+            "keys": len(self.keys),
+            "typo_tolerance": self.typo_tolerance,
+            "hits": self.hits,
+            "typo_hits": self.typo_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.typo_hits) / lookups, 3) if lookups else 0.0,
+        }
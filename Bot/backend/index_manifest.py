@@ -0,0 +1,132 @@
+"""
+Index Manifest - Describes exactly what a persisted index was built from.
+
+Handles:
+- Content hashes for each Q&A document and for the whole knowledge base
+- Recording vectorizer parameters and library versions
+- Deciding whether a persisted index can be reused, without unpickling it
+"""
+
+import hashlib
+import json
+import os
+import platform
+from typing import Any, Dict, List, Optional, Tuple
+
+
+MANIFEST_VERSION = 2
+
+# Vectorizer settings that change the fitted vocabulary or the vectors
+VECTORIZER_PARAM_KEYS = (
+    "lowercase", "token_pattern", "stop_words", "ngram_range", "max_features",
+    "min_df", "max_df", "sublinear_tf", "use_idf", "smooth_idf", "norm",
+)
+
+
+def document_hash(doc: Dict) -> str:
+    """Stable content hash of a single Q&A pair."""
+    digest = hashlib.sha256()
+    digest.update(doc["question"].encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(doc["answer"].encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def kb_hash(doc_hashes: List[str]) -> str:
+    """Hash of the whole knowledge base (document contents and order)."""
+    digest = hashlib.sha256()
+    for h in doc_hashes:
+        digest.update(h.encode("ascii"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def vectorizer_params(vectorizer) -> Dict:
+    params = vectorizer.get_params()
+    return {
+        key: list(params[key]) if isinstance(params[key], tuple) else params[key]
+        for key in VECTORIZER_PARAM_KEYS
+    }
+
+
+def library_versions() -> Dict[str, str]:
+    import numpy
+    import scipy
+    import sklearn
+
+    return {
+        "python": ".".join(platform.python_version_tuple()[:2]),
+        "numpy": numpy.__version__,
+        "scipy": scipy.__version__,
+        "scikit-learn": sklearn.__version__,
+    }
+
+
+def build_manifest(doc_hashes: List[Optional[str]], vectorizer, question_vectorizer,
+                   kb_digest: Optional[str] = None, **index_state: Any) -> Dict:
+    """
+    Describe an index whose rows have the given content hashes.
+    A None hash marks a tombstoned row; `kb_digest` defaults to the hash of the
+    live rows in order. Extra keyword arguments record incremental-update state.
+    """
+    live_hashes = [h for h in doc_hashes if h is not None]
+    return {
+        "manifest_version": MANIFEST_VERSION,
+        "kb_hash": kb_digest or kb_hash(live_hashes),
+        "document_count": len(live_hashes),
+        "document_hashes": doc_hashes,
+        "vectorizers": {
+            "document": vectorizer_params(vectorizer),
+            "question": vectorizer_params(question_vectorizer),
+        },
+        "libraries": library_versions(),
+        **index_state,
+    }
+
+
+def write_manifest(path: str, manifest: Dict):
+    """Write the manifest atomically so a half-written file is never read."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+
+def read_manifest(path: str) -> Optional[Dict]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _config_mismatch(stored: Optional[Dict], expected: Dict) -> Optional[str]:
+    if stored is None:
+        return "no manifest"
+    if stored.get("manifest_version") != MANIFEST_VERSION:
+        return "manifest format changed"
+    if stored.get("libraries") != expected["libraries"]:
+        return "library versions changed"
+    if stored.get("vectorizers") != expected["vectorizers"]:
+        return "vectorizer parameters changed"
+    return None
+
+
+def same_index_config(stored: Optional[Dict], expected: Dict) -> bool:
+    """True if only the KB content may differ, so the index can be updated in place."""
+    return _config_mismatch(stored, expected) is None
+
+
+def compare_manifests(stored: Optional[Dict], expected: Dict) -> Tuple[bool, str]:
+    """
+    Check whether an index described by `stored` can serve `expected`.
+    Returns (reusable, reason).
+    """
+    mismatch = _config_mismatch(stored, expected)
+    if mismatch:
+        return False, mismatch
+    if stored.get("kb_hash") != expected["kb_hash"]:
+        return False, "knowledge base content changed"
+    return True, "up to date"
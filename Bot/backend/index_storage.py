@@ -0,0 +1,280 @@
+"""
+Index Storage - Versioned, memory-mappable on-disk format for the TF-IDF index.
+
+Layout of an index directory (format version 2):
+  manifest.json                          - content manifest, array shapes, and the size and
+                                           SHA-256 checksum of every other file (written last)
+  <matrix>.{data,indices,indptr}.npy     - CSR arrays of the "tfidf" and "question" matrices
+  <vectorizer>.terms.{blob,offsets.npy}  - vocabulary, term i is feature column i
+  <vectorizer>.idf.npy                   - IDF weights
+  {questions,answers}.{blob,offsets.npy} - document text as an offset table into one blob
+  dense/                                 - optional low-rank projection (backend.dense_index)
+
+Everything is opened with np.load(mmap_mode=...), so loading does not copy the
+index into private heap memory and read-only pages are shared between worker
+processes through the OS page cache.
+"""
+
+import hashlib
+import os
+import shutil
+from collections.abc import Sequence
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+from backend.defaults import MANIFEST_NAME
+from backend.index_manifest import write_manifest, read_manifest
+from backend.markdown_parser import QAPair
+from backend.dense_index import DENSE_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development only
+    fcntl = None
+
+
+FORMAT_VERSION = 2
+
+# Read size when checksumming index files
+_CHECKSUM_CHUNK = 1 << 20
+
+# Copy-on-write mapping: pages stay shared until a process modifies them
+# (e.g. tombstoning rows during an incremental update).
+MMAP_MODE = "c"
+
+
+def _path(index_dir: str, name: str) -> str:
+    return os.path.join(index_dir, name)
+
+
+# --- Strings ---
+
+class StringTable(Sequence):
+    """Read-only sequence of strings stored as UTF-8 in one blob plus an offset table."""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+
+def write_strings(index_dir: str, name: str, strings: Iterable[str]):
+    offsets = [0]
+    with open(_path(index_dir, f"{name}.blob"), "wb") as f:
+        for text in strings:
+            encoded = text.encode("utf-8")
+            f.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+    np.save(_path(index_dir, f"{name}.offsets.npy"), np.asarray(offsets, dtype=np.int64))
+
+
+def read_strings(index_dir: str, name: str) -> StringTable:
+    offsets = np.load(_path(index_dir, f"{name}.offsets.npy"), mmap_mode="r")
+    blob_path = _path(index_dir, f"{name}.blob")
+    if os.path.getsize(blob_path) == 0:
+        blob = np.zeros(0, dtype=np.uint8)
+    else:
+        blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+    return StringTable(blob, offsets)
+
+
+class DocumentTable(Sequence):
+    """Lazily decoded Q&A documents, one per index row."""
+
+    def __init__(self, questions: StringTable, answers: StringTable):
+        self.questions = questions
+        self.answers = answers
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __getitem__(self, i):
+        return QAPair(self.questions[i], self.answers[i])
+
+
+# --- Sparse matrices ---
+
+def write_csr(index_dir: str, name: str, matrix) -> list:
+    matrix = sp.csr_matrix(matrix)
+    np.save(_path(index_dir, f"{name}.data.npy"), matrix.data)
+    np.save(_path(index_dir, f"{name}.indices.npy"), matrix.indices)
+    np.save(_path(index_dir, f"{name}.indptr.npy"), matrix.indptr)
+    return list(matrix.shape)
+
+
+def read_csr(index_dir: str, name: str, shape) -> sp.csr_matrix:
+    data = np.load(_path(index_dir, f"{name}.data.npy"), mmap_mode=MMAP_MODE)
+    indices = np.load(_path(index_dir, f"{name}.indices.npy"), mmap_mode=MMAP_MODE)
+    indptr = np.load(_path(index_dir, f"{name}.indptr.npy"), mmap_mode=MMAP_MODE)
+    return sp.csr_matrix((data, indices, indptr), shape=tuple(shape), copy=False)
+
+
+# --- Vectorizers ---
+
+def write_vectorizer(index_dir: str, name: str, vectorizer):
+    write_strings(index_dir, f"{name}.terms", vectorizer.get_feature_names_out())
+    np.save(_path(index_dir, f"{name}.idf.npy"), vectorizer.idf_)
+
+
+def read_vectorizer(index_dir: str, name: str, vectorizer):
+    """Restore vocabulary and IDF into an unfitted vectorizer with matching parameters."""
+    terms = read_strings(index_dir, f"{name}.terms")
+    vectorizer.vocabulary_ = {term: i for i, term in enumerate(terms)}
+    vectorizer.idf_ = np.load(_path(index_dir, f"{name}.idf.npy"), mmap_mode="r")
+    return vectorizer
+
+
+# --- Checksums ---
+
+def _file_checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHECKSUM_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _index_files(index_dir: str) -> Dict[str, str]:
+    """Path of every file in the index directory except the manifest, by relative path."""
+    files = {}
+    for root, _, names in os.walk(index_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, index_dir).replace(os.sep, "/")
+            if relative != MANIFEST_NAME:
+                files[relative] = path
+    return dict(sorted(files.items()))
+
+
+def file_checksums(index_dir: str) -> Dict[str, str]:
+    """SHA-256 of every file in the index directory except the manifest, by relative path."""
+    return {relative: _file_checksum(path) for relative, path in _index_files(index_dir).items()}
+
+
+def file_sizes(index_dir: str) -> Dict[str, int]:
+    """Size in bytes of every file in the index directory except the manifest, by relative path."""
+    return {relative: os.path.getsize(path) for relative, path in _index_files(index_dir).items()}
+
+
+def refresh_checksums(index_dir: str, **updates):
+    """
+    Re-record the file sizes and checksums after files were rewritten in place
+    (e.g. the dense projection), along with any manifest entries in `updates`.
+    """
+    manifest = read_index_manifest(index_dir)
+    if manifest is not None:
+        manifest = dict(manifest, **updates, sizes=file_sizes(index_dir), checksums=file_checksums(index_dir))
+        write_manifest(_path(index_dir, MANIFEST_NAME), manifest)
+
+
+def verify_index(index_dir: str, checksums: bool = True) -> Optional[str]:
+    """
+    None if every file matches its recorded checksum, else what is wrong.
+    Without `checksums`, only the presence and size of the files are checked
+    (which reads no data); an index that records no sizes is checksummed anyway.
+    """
+    manifest = read_index_manifest(index_dir)
+    if manifest is None:
+        return "no index"
+    if checksums or "sizes" not in manifest:
+        expected, actual, problem = manifest.get("checksums") or {}, file_checksums(index_dir), "checksum"
+    else:
+        expected, actual, problem = manifest["sizes"], file_sizes(index_dir), "size"
+    missing = sorted(set(expected) - set(actual))
+    if missing:
+        return f"missing files: {', '.join(missing)}"
+    changed = sorted(name for name in expected if actual[name] != expected[name])
+    if changed:
+        return f"{problem} mismatch: {', '.join(changed)}"
+    return None
+
+
+# --- Whole index ---
+
+@contextmanager
+def index_lock(index_dir: str):
+    """
+    Exclusive inter-process lock around checking/building/saving an index, so
+    concurrent reloads in several workers do not rebuild or swap it at once.
+    """
+    if fcntl is None:
+        yield
+        return
+    parent = os.path.dirname(os.path.abspath(index_dir))
+    os.makedirs(parent, exist_ok=True)
+    with open(f"{index_dir}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_index(index_dir: str, store, manifest: Dict):
+    """
+    Write `store` as a new index directory, replacing any existing one.
+    The directory is assembled next to the target and swapped in when complete.
+    """
+    parent = os.path.dirname(os.path.abspath(index_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = f"{index_dir}.tmp-{os.getpid()}"
+    old_dir = f"{index_dir}.old-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    shapes = {
+        "tfidf": write_csr(tmp_dir, "tfidf", store.tfidf_matrix),
+        "question": write_csr(tmp_dir, "question", store.question_matrix),
+    }
+    write_vectorizer(tmp_dir, "vectorizer", store.vectorizer)
+    write_vectorizer(tmp_dir, "question_vectorizer", store.question_vectorizer)
+    write_strings(tmp_dir, "questions", (doc["question"] for doc in store.documents))
+    write_strings(tmp_dir, "answers", (doc["answer"] for doc in store.documents))
+    if getattr(store, "dense_index", None) is not None:
+        store.dense_index.save(_path(tmp_dir, DENSE_DIR))
+
+    manifest = dict(manifest, format_version=FORMAT_VERSION, shapes=shapes,
+                    sizes=file_sizes(tmp_dir), checksums=file_checksums(tmp_dir))
+    write_manifest(_path(tmp_dir, MANIFEST_NAME), manifest)
+
+    if os.path.exists(index_dir):
+        os.rename(index_dir, old_dir)
+    os.rename(tmp_dir, index_dir)
+    # Processes still mapping the old files keep them alive until they let go
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def read_index_manifest(index_dir: str) -> Optional[Dict]:
+    manifest = read_manifest(_path(index_dir, MANIFEST_NAME))
+    if manifest is None or manifest.get("format_version") != FORMAT_VERSION:
+        return None
+    return manifest
+
+
+def read_index(index_dir: str, store) -> Optional[Dict]:
+    """Map an index directory into `store`. Returns its manifest, or None if absent."""
+    manifest = read_index_manifest(index_dir)
+    if manifest is None:
+        return None
+    shapes = manifest["shapes"]
+    store.tfidf_matrix = read_csr(index_dir, "tfidf", shapes["tfidf"])
+    store.question_matrix = read_csr(index_dir, "question", shapes["question"])
+    read_vectorizer(index_dir, "vectorizer", store.vectorizer)
+    read_vectorizer(index_dir, "question_vectorizer", store.question_vectorizer)
+    store.documents = DocumentTable(
+        read_strings(index_dir, "questions"), read_strings(index_dir, "answers")
+    )
+    return manifest
@@ -0,0 +1,127 @@
+"""
+Inverted Index - Sublinear candidate generation over the TF-IDF weights.
+
+Handles:
+- Posting lists (document ids + weights) per term, for both the question and the document vocabulary
+- Per-term maximum weights, giving an upper bound on each term's contribution to a score
+- MaxScore-style dynamic pruning: once the k-th best partial score exceeds what the remaining
+  terms could add, documents that have not been seen yet are skipped and the remaining terms
+  are only looked up for the surviving candidates
+
+The index returns a candidate set that is guaranteed to contain the exact top-k
+(ties included); VectorStore rescores those candidates with ScoringMatrix.rescore,
+so results match the brute-force path exactly.
+"""
+
+import numpy as np
+import scipy.sparse as sp
+
+from backend.scoring_matrix import ScoringMatrix
+
+# Slack for floating point differences between partial sums and exact scores
+# (the exact scores are accumulated in float32)
+SCORE_EPSILON = 1e-5
+
+# Fraction of the corpus above which candidate scores are accumulated densely
+DENSE_FRACTION = 0.05
+
+
+class InvertedIndex:
+    """
+    Term -> postings view of the combined score
+    ``question_weight * q.Q[d] + doc_weight * v.D[d]``.
+
+    The posting lists are those of a ScoringMatrix (term-major, sorted by
+    document id, blend weights folded in), shared rather than copied.
+    """
+
+    def __init__(self, scoring: ScoringMatrix):
+        matrix = scoring.matrix
+        self.n_documents = scoring.n_rows
+        self.indptr = matrix.indptr
+        self.indices = matrix.indices
+        self.data = matrix.data
+
+        lengths = np.diff(self.indptr)
+        self.max_weights = np.zeros(scoring.n_features, dtype=np.float64)
+        nonempty = lengths > 0
+        if nonempty.any():
+            self.max_weights[nonempty] = np.maximum.reduceat(self.data, self.indptr[:-1][nonempty])
+
+    @property
+    def nbytes(self) -> int:
+        """Memory of the per-term bounds (the postings belong to the ScoringMatrix)."""
+        return self.max_weights.nbytes
+
+    @staticmethod
+    def query_terms(query: sp.csr_matrix):
+        """Column ids and weights of one stacked query (ScoringMatrix.stack_queries)."""
+        return query.indices.astype(np.int64), query.data.astype(np.float64)
+
+    def candidates(self, terms: np.ndarray, weights: np.ndarray, top_k: int) -> np.ndarray:
+        """
+        Sorted document ids that can still be in the top_k for a query with the
+        given term weights. Every document scoring at least the k-th best score
+        is included.
+        """
+        if len(terms) == 0 or top_k <= 0:
+            return np.empty(0, dtype=np.int64)
+
+        # Most valuable terms first: they decide which documents are worth scoring
+        bounds = weights * self.max_weights[terms]
+        order = np.argsort(-bounds, kind="stable")
+        terms, weights, bounds = terms[order], weights[order], bounds[order]
+        # rest[i]: the most that terms i.. can still add to any document
+        rest = np.append(np.cumsum(bounds[::-1])[::-1], 0.0)
+
+        docs = np.empty(0, dtype=np.int64)
+        scores = np.empty(0, dtype=np.float64)
+        threshold = 0.0
+        i = 0
+
+        # Phase 1: union the postings of the essential terms. Unions are merged
+        # sparsely while small; past DENSE_FRACTION of the corpus a dense
+        # accumulator is cheaper (a column never repeats a document id)
+        dense = None
+        while i < len(terms):
+            start, end = self.indptr[terms[i]], self.indptr[terms[i] + 1]
+            postings, contributions = self.indices[start:end], weights[i] * self.data[start:end]
+            if dense is None and len(docs) + len(postings) > DENSE_FRACTION * self.n_documents:
+                dense = np.zeros(self.n_documents, dtype=np.float64)
+                dense[docs] = scores
+            if dense is not None:
+                dense[postings] += contributions
+                scores = dense
+            else:
+                docs, inverse = np.unique(np.concatenate([docs, postings]), return_inverse=True)
+                scores = np.bincount(
+                    inverse, weights=np.concatenate([scores, contributions]), minlength=len(docs)
+                )
+            i += 1
+            if len(scores) >= top_k:
+                threshold = np.partition(scores, -top_k)[-top_k]
+                if rest[i] + SCORE_EPSILON < threshold:
+                    break  # No unseen document can reach the top-k anymore
+
+        if dense is not None:
+            docs = np.flatnonzero(dense)
+            scores = dense[docs]
+
+        # Phase 2: refine the surviving candidates with the remaining terms
+        while i < len(terms):
+            keep = scores + rest[i] >= threshold - SCORE_EPSILON
+            docs, scores = docs[keep], scores[keep]
+            start, end = self.indptr[terms[i]], self.indptr[terms[i] + 1]
+            postings = self.indices[start:end]
+            if len(postings):
+                positions = np.searchsorted(postings, docs)
+                positions[positions == len(postings)] = 0
+                hits = postings[positions] == docs
+                scores[hits] += weights[i] * self.data[start:end][positions[hits]]
+            i += 1
+            if len(docs) >= top_k:
+                threshold = max(threshold, np.partition(scores, -top_k)[-top_k])
+
+        if len(docs) > top_k:
+            docs = docs[scores >= threshold - SCORE_EPSILON]
+        return docs
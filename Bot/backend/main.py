@@ -3,42 +3,426 @@ FastAPI Server - Chat API endpoint for the RAG assistant.
 
 Endpoints:
   POST /chat         - Send a question, get an answer
+  POST /chat/batch   - Answer many questions in one call
+  POST /chat/stream  - Stream an answer as server-sent events (sources first)
   POST /chat/history - Get conversation history for a user
   POST /chat/reset   - Clear conversation history for a user
   GET  /health       - Health check endpoint
+  GET  /metrics      - Prometheus metrics
+  POST /admin/reload - Reload the knowledge base without downtime (token protected)
+  /debug/...         - CPU profiles, allocation snapshots, slow requests (token protected)
 """
 
+import asyncio
+import hmac
+import json
 import os
 import sys
+import tempfile
+import time
 import logging
+import weakref
 from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Callable, List, Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 
 # Add parent directory to path so backend module imports work
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from backend.rag_engine import RAGEngine, ConversationMemory
+if __name__ == "__main__":
+    # Run as `python -m backend`, before any server global is built here: the server
+    # imports this module as backend.main, and a second copy built as __main__
+    # would hold its own engine, worker pool and conversation store
+    import runpy
+    runpy.run_module("backend", run_name="__main__", alter_sys=True)
+    sys.exit(0)
+
+from backend.conversation_memory import ConversationMemory
+from backend.defaults import DEFAULT_KB_PATH, DEFAULT_SYNONYMS_PATH, INDEX_DIR as DEFAULT_INDEX_DIR, MANIFEST_NAME
+from backend.markdown_parser import knowledge_base_files
+from backend.startup import StartupTracker
+from backend.worker_pool import WorkerPool, PoolSaturatedError
+from backend.micro_batcher import MicroBatcher
+from backend.engine_reloader import EngineReloader
+from backend.conversation_store import SQLiteConversationStore
+from backend import metrics
+from backend.profiling import (
+    MAX_PROFILE_SECONDS, AllocationTracer, LoopLagMonitor, SlowRequestLog, StackSampler,
+)
+
+if TYPE_CHECKING:
+    from backend.rag_engine import RAGEngine
 
 # Logging setup
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
-# Global instances
-rag_engine = RAGEngine()
-conversation_memory = ConversationMemory(max_history=20)
+# Worker pool configuration (RAG retrieval runs off the event loop)
+POOL_MODE = os.environ.get("RAG_POOL_MODE", "thread")
+POOL_WORKERS = int(os.environ.get("RAG_POOL_WORKERS", min(4, os.cpu_count() or 1)))
+POOL_QUEUE_SIZE = int(os.environ.get("RAG_POOL_QUEUE_SIZE", 32))
+
+# Answer cache configuration (0 entries disables the cache)
+CACHE_SIZE = int(os.environ.get("RAG_CACHE_SIZE", 1024))
+CACHE_TTL = float(os.environ.get("RAG_CACHE_TTL", 300))
+
+# Largest number of questions accepted by /chat/batch
+BATCH_MAX_QUESTIONS = int(os.environ.get("RAG_BATCH_MAX_QUESTIONS", 500))
+
+# Micro-batching: concurrent /chat (and /chat/stream) questions arriving within the
+# window are answered by one batched call (0 disables)
+BATCH_WINDOW_MS = float(os.environ.get("RAG_BATCH_WINDOW_MS", 0))
+BATCH_MAX_SIZE = int(os.environ.get("RAG_BATCH_MAX_SIZE", 64))
+
+# Approximate size of the answer text events sent by /chat/stream
+STREAM_CHUNK_CHARS = int(os.environ.get("RAG_STREAM_CHUNK_CHARS", 200))
+# How often a streaming request waiting for retrieval checks for a client disconnect
+DISCONNECT_POLL_SECONDS = 0.1
+
+# Conversation memory bounds
+HISTORY_MAX_USERS = int(os.environ.get("RAG_HISTORY_MAX_USERS", 10000))
+HISTORY_IDLE_TTL = float(os.environ.get("RAG_HISTORY_IDLE_TTL", 3600))
+HISTORY_MAX_MB = float(os.environ.get("RAG_HISTORY_MAX_MB", 64))
+# SQLite file for durable history (unset keeps history in memory only)
+HISTORY_DB = os.environ.get("RAG_HISTORY_DB")
+
+# Retrieval engine: "brute" scores every document, "inverted" prunes with posting lists
+# (same results, sublinear on large knowledge bases), "dense" scores low-rank vectors
+RETRIEVAL = os.environ.get("RAG_RETRIEVAL", "brute")
+DENSE_OPTIONS = {
+    "n_components": int(os.environ.get("RAG_DENSE_DIM", 128)),
+    "dtype": os.environ.get("RAG_DENSE_DTYPE", "int8"),
+    "nlist": int(os.environ.get("RAG_DENSE_NLIST", 0)),
+    "nprobe": int(os.environ.get("RAG_DENSE_NPROBE", 8)),
+}
+# Query expansion synonyms: a JSON object of term -> replacement, first match wins
+SYNONYMS_PATH = os.environ.get("RAG_SYNONYMS_PATH", DEFAULT_SYNONYMS_PATH)
+# Exact-match fast path for known question titles, optionally typo-tolerant
+EXACT_MATCH = os.environ.get("RAG_EXACT_MATCH", "1").lower() in ("1", "true", "yes")
+EXACT_TYPOS = os.environ.get("RAG_EXACT_TYPOS", "").lower() in ("1", "true", "yes")
+# Row shards searched by one process each (1 = unsharded; not with dense retrieval)
+SHARDS = int(os.environ.get("RAG_SHARDS", 1))
+# Blend of question-title and document similarity in the retrieval score
+QUESTION_WEIGHT = float(os.environ.get("RAG_QUESTION_WEIGHT", 0.6))
+DOC_WEIGHT = float(os.environ.get("RAG_DOC_WEIGHT", 0.4))
+
+# Knowledge base source: a Markdown file, a directory of .md shards, or a glob
+KB_PATH = os.environ.get("RAG_KB_PATH", DEFAULT_KB_PATH)
+# Index directory; with PREBUILT_INDEX the server only loads an index made by
+# `python -m backend.build_index` and refuses to start if it does not match the KB
+INDEX_DIR = os.environ.get("RAG_INDEX_DIR", DEFAULT_INDEX_DIR)
+PREBUILT_INDEX = os.environ.get("RAG_PREBUILT_INDEX", "").lower() in ("1", "true", "yes")
+# Checksum every prebuilt index file when it is loaded (the build and the smoke test
+# already do; by default loading checks the manifest and the file sizes only)
+VERIFY_INDEX = os.environ.get("RAG_VERIFY_INDEX", "").lower() in ("1", "true", "yes")
+
+# Knowledge base reloads (0 disables the file watcher; no token disables /admin/reload)
+KB_WATCH_INTERVAL = float(os.environ.get("RAG_KB_WATCH_INTERVAL", 5))
+ADMIN_TOKEN = os.environ.get("RAG_ADMIN_TOKEN")
+
+# Add a Server-Timing header with the per-stage breakdown to chat responses
+SERVER_TIMING = os.environ.get("RAG_SERVER_TIMING", "").lower() in ("1", "true", "yes")
+
+# Diagnostics (the /debug endpoints need ADMIN_TOKEN): event-loop lag probe period
+# (0 disables) and the slow-request threshold (unset = rolling p99 of recent requests)
+LOOP_LAG_INTERVAL = float(os.environ.get("RAG_LOOP_LAG_INTERVAL", 0.5))
+SLOW_REQUEST_MS = os.environ.get("RAG_SLOW_REQUEST_MS")
+
+# Fast start: bind the port at once and load the engine in the background. Until it is
+# ready, exact question matches are answered and other requests wait up to
+# STARTUP_WAIT seconds for it (then get a 503)
+FAST_START = os.environ.get("RAG_FAST_START", "").lower() in ("1", "true", "yes")
+STARTUP_WAIT = float(os.environ.get("RAG_STARTUP_WAIT", 10))
+
+
+def engine_options() -> dict:
+    """RAGEngine arguments from the configuration (plain values, so worker processes can receive them)."""
+    return dict(
+        kb_path=KB_PATH,
+        cache_size=CACHE_SIZE,
+        cache_ttl=CACHE_TTL,
+        retrieval=RETRIEVAL,
+        dense_options=DENSE_OPTIONS,
+        shards=SHARDS,
+        synonyms_path=SYNONYMS_PATH,
+        exact_match=EXACT_MATCH,
+        exact_typos=EXACT_TYPOS,
+        question_weight=QUESTION_WEIGHT,
+        doc_weight=DOC_WEIGHT,
+        index_dir=INDEX_DIR,
+        prebuilt_index=PREBUILT_INDEX,
+        verify_checksums=VERIFY_INDEX,
+    )
+
+
+def create_engine() -> "RAGEngine":
+    # Imported on first use: the engine modules pull in scikit-learn, which a
+    # fast start keeps off the path to binding the port
+    from backend.rag_engine import RAGEngine
+
+    return RAGEngine(**engine_options())
+
+
+def create_conversation_memory() -> ConversationMemory:
+    # In multi-worker mode this runs inside the manager process, so the SQLite
+    # writer lives next to the single shared hot tier
+    store = SQLiteConversationStore(HISTORY_DB, retain=20) if HISTORY_DB else None
+    return ConversationMemory(
+        max_history=20,
+        max_users=HISTORY_MAX_USERS,
+        idle_ttl=HISTORY_IDLE_TTL,
+        max_bytes=int(HISTORY_MAX_MB * 1024 * 1024),
+        store=store,
+    )
+
+
+def _watched_files() -> list:
+    """Files whose change triggers a reload: the KB, and a prebuilt index being replaced."""
+    files = knowledge_base_files(KB_PATH)
+    if PREBUILT_INDEX:
+        files.append(os.path.join(INDEX_DIR, MANIFEST_NAME))
+    return files
+
+
+def load_engine():
+    """Create and initialize the serving engine, reporting the startup phases."""
+    global rag_engine
+    startup.enter("importing")
+    engine = create_engine()
+    if FAST_START:
+        rag_engine = engine  # Answers exact question matches while the index loads
+    engine.initialize(on_phase=startup.enter, early_exact=FAST_START)
+    rag_engine = engine
+    startup.mark_ready()
+
+
+def _load_engine_and_watch():
+    load_engine()
+    rag_engine.start_shards()
+    engine_reloader.start_watcher(KB_WATCH_INTERVAL)
+
+
+def swap_engine(engine: "RAGEngine"):
+    """Atomically replace the serving engine; in-flight requests keep the old one."""
+    global rag_engine
+    engine.start_shards()
+    if rag_engine is not None:
+        retired_engines.add(rag_engine)
+    rag_engine = engine
+    if worker_pool.mode == "process":
+        # Worker processes hold their own engine; start fresh ones on the new index
+        worker_pool.restart()
+
+
+# Global instances (the engine is created by load_engine)
+rag_engine: Optional["RAGEngine"] = None
+# Engines replaced by a reload. Their search processes stop when they are garbage
+# collected, or at shutdown, since a server process started by multiprocessing
+# exits without atexit handlers and would wait for those processes forever
+retired_engines: "weakref.WeakSet[RAGEngine]" = weakref.WeakSet()
+startup = StartupTracker()
+conversation_memory = create_conversation_memory()
+worker_pool = WorkerPool(
+    lambda: rag_engine,
+    mode=POOL_MODE,
+    workers=POOL_WORKERS,
+    max_queue=POOL_QUEUE_SIZE,
+    engine_options=engine_options(),
+)
+engine_reloader = EngineReloader(create_engine, swap_engine, _watched_files)
+# Set by backend.serving in forked workers: the parent watches the knowledge base and
+# reloads it, then restarts the workers on the new engine, so they keep sharing one index
+request_parent_reload: Optional[Callable[[], None]] = None
+answer_batcher = MicroBatcher(
+    "answer", lambda questions: worker_pool.run("generate_answers", questions),
+    window=BATCH_WINDOW_MS / 1000.0, max_batch=BATCH_MAX_SIZE,
+)
+retrieve_batcher = MicroBatcher(
+    "retrieve", lambda questions: worker_pool.run("retrieve_many", questions),
+    window=BATCH_WINDOW_MS / 1000.0, max_batch=BATCH_MAX_SIZE,
+)
+loop_lag_monitor = LoopLagMonitor(LOOP_LAG_INTERVAL)
+slow_requests = SlowRequestLog(float(SLOW_REQUEST_MS) / 1000.0 if SLOW_REQUEST_MS else None)
+allocation_tracer = AllocationTracer()
+profile_lock = asyncio.Lock()  # One CPU profile at a time
+
+
+# --- Metrics ---
+
+requests_total = metrics.registry.counter(
+    "rag_requests_total", "Answered questions by endpoint and confidence band.", ("endpoint", "confidence")
+)
+rejected_total = metrics.registry.counter(
+    "rag_rejected_requests_total", "Requests rejected because the worker pool was saturated.", ("endpoint",)
+)
+request_seconds = metrics.registry.histogram(
+    "rag_request_seconds", "End-to-end handler latency.", ("endpoint",)
+)
+not_ready_total = metrics.registry.counter(
+    "rag_not_ready_requests_total", "Requests turned away because the engine was still starting.", ("endpoint",)
+)
+
+
+def _engine_gauge(read):
+    """Gauge fn reading the serving engine; no sample before it exists (fast start)."""
+    return lambda: read(rag_engine) if rag_engine is not None else None
+
+
+metrics.registry.gauge("rag_engine_ready", "1 once the RAG engine can serve requests.",
+                       fn=lambda: int(startup.ready))
+metrics.registry.gauge("rag_kb_info", "Version of the knowledge base being served.", ("kb_version",),
+                       fn=_engine_gauge(lambda engine: {(engine.kb_version or "",): 1}))
+metrics.registry.gauge("rag_index_documents", "Live documents in the search index.",
+                       fn=_engine_gauge(lambda engine: engine.vector_store.ntotal))
+metrics.registry.gauge("rag_answer_cache_entries", "Entries in the answer cache.",
+                       fn=_engine_gauge(lambda engine: len(engine.cache)))
+metrics.registry.gauge("rag_answer_cache_hits_total", "Answer cache hits since the engine was loaded.",
+                       fn=_engine_gauge(lambda engine: engine.cache.hits), kind="counter")
+metrics.registry.gauge("rag_answer_cache_misses_total", "Answer cache misses since the engine was loaded.",
+                       fn=_engine_gauge(lambda engine: engine.cache.misses), kind="counter")
+metrics.registry.gauge("rag_answer_cache_evictions_total", "Answer cache evictions since the engine was loaded.",
+                       fn=_engine_gauge(lambda engine: engine.cache.evictions), kind="counter")
+metrics.registry.gauge("rag_exact_lookups_total", "Exact-match index lookups by result (exact, typo, miss).",
+                       ("result",), kind="counter",
+                       fn=_engine_gauge(lambda engine: _exact_lookups(engine.exact_index)))
+metrics.registry.gauge("rag_startup_phase_seconds", "Duration of each startup phase of this process.", ("phase",),
+                       fn=lambda: {(phase,): seconds for phase, seconds in startup.status()["phase_seconds"].items()})
+metrics.registry.gauge("rag_time_to_ready_seconds", "Seconds from process start until the engine was ready.",
+                       fn=lambda: startup.seconds_to_ready)
+metrics.registry.gauge("rag_time_to_first_answer_seconds",
+                       "Seconds from process start until the first successful answer.",
+                       fn=lambda: startup.seconds_to_first_answer)
+metrics.registry.gauge("rag_pool_in_flight", "Worker pool jobs running or queued.",
+                       fn=lambda: worker_pool.in_flight)
+metrics.registry.gauge("rag_pool_queue_depth", "Worker pool jobs waiting for a worker.",
+                       fn=lambda: worker_pool.queue_depth)
+metrics.registry.gauge("rag_pool_capacity", "Jobs the worker pool accepts before rejecting.",
+                       fn=lambda: worker_pool.workers + worker_pool.max_queue)
+metrics.registry.gauge("rag_reloads_total", "Successful knowledge base reloads.",
+                       fn=lambda: engine_reloader.reload_count, kind="counter")
+metrics.registry.gauge("rag_last_reload_seconds", "Duration of the last knowledge base reload.",
+                       fn=lambda: engine_reloader.last_reload_seconds)
+
+
+def _exact_lookups(exact_index) -> Optional[dict]:
+    if exact_index is None:
+        return None
+    return {("exact",): exact_index.hits, ("typo",): exact_index.typo_hits, ("miss",): exact_index.misses}
+
+
+def _observe_request(endpoint: str, started: float, timings: dict, response: Optional[Response] = None,
+                     question: Optional[str] = None):
+    elapsed = time.perf_counter() - started
+    request_seconds.observe(elapsed, endpoint)
+    slow_requests.observe(endpoint, elapsed, timings, question)
+    if SERVER_TIMING and response is not None:
+        response.headers["Server-Timing"] = metrics.server_timing_header(timings, total=elapsed)
+
+
+def _early_match(user_question: str) -> Optional[tuple]:
+    """(document, 1.0) if the question names a Q&A pair, answerable before the index is loaded."""
+    engine = rag_engine
+    return engine.exact_matches([user_question])[0] if engine is not None else None
+
+
+async def _wait_until_ready(endpoint: str):
+    """Wait up to STARTUP_WAIT seconds for the engine to be ready; 503 if it is not."""
+    if await startup.wait(STARTUP_WAIT):
+        return
+    not_ready_total.inc(endpoint)
+    logger.warning(f"Rejecting {endpoint} request: engine {startup.phase}")
+    raise HTTPException(
+        status_code=503,
+        detail="Assistant failed to start." if startup.failed else "Assistant is starting up, please retry shortly.",
+        headers={"Retry-After": "5"},
+    )
+
+
+async def _answer(user_question: str) -> dict:
+    if not startup.ready:
+        match = _early_match(user_question)
+        if match is not None:
+            return rag_engine.compose_answer([match])
+        await _wait_until_ready("chat")
+    if BATCH_WINDOW_MS > 0:
+        return await answer_batcher.submit(user_question)
+    return await worker_pool.run("generate_answer", user_question)
+
+
+async def _retrieve(user_question: str) -> list:
+    if not startup.ready:
+        match = _early_match(user_question)
+        if match is not None:
+            return [match]
+        await _wait_until_ready("stream")
+    if BATCH_WINDOW_MS > 0:
+        return await retrieve_batcher.submit(user_question)
+    return await worker_pool.run("retrieve", user_question)
+
+
+async def _remember(user_id: str, exchanges: list):
+    """
+    Record (question, answer) exchanges in conversation memory. With several
+    workers the memory is a proxy to the manager process, so each call is a
+    blocking round trip: make one, off the event loop.
+    """
+    await asyncio.to_thread(conversation_memory.add_exchanges, user_id, exchanges)
+
+
+async def _run_while_connected(http_request: Request, work):
+    """
+    Await `work` (a coroutine) unless the client disconnects first, then
+    cancel it and return None. A pool job still waiting in the queue is
+    dropped; a micro-batch carries on for its other questions.
+    """
+    job = asyncio.ensure_future(work)
+    while True:
+        done, _ = await asyncio.wait({job}, timeout=DISCONNECT_POLL_SECONDS)
+        if done:
+            return job.result()
+        if await http_request.is_disconnected():
+            job.cancel()
+            return None
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Initialize the RAG engine on startup."""
-    logger.info("Starting RAG Engine initialization...")
-    rag_engine.initialize()
-    logger.info("RAG Engine ready.")
+    """Initialize the RAG engine on startup (in the background with FAST_START)."""
+    startup.bind(asyncio.get_running_loop())
+    worker_pool.start()
+    loop_lag_monitor.start()
+    # Forked workers (see backend.serving) inherit an engine loaded by the parent
+    if FAST_START and not startup.ready:
+        logger.info("Fast start: serving while the RAG Engine loads in the background...")
+        startup.load_in_background(_load_engine_and_watch)
+    else:
+        if not startup.ready:
+            logger.info("Starting RAG Engine initialization...")
+            load_engine()
+        # Per serving process: a forked worker must not share its parent's search processes
+        rag_engine.start_shards()
+        if request_parent_reload is None:
+            engine_reloader.start_watcher(KB_WATCH_INTERVAL)
+        logger.info(f"RAG Engine ready ({POOL_MODE} pool, {POOL_WORKERS} workers, queue {POOL_QUEUE_SIZE}).")
     yield
     logger.info("Shutting down.")
+    loop_lag_monitor.stop()
+    engine_reloader.stop()
+    worker_pool.shutdown()
+    for engine in [rag_engine, *retired_engines]:
+        if engine is not None:
+            engine.close()
+    # Forked workers share a manager-hosted memory that backend.serving closes
+    if isinstance(conversation_memory, ConversationMemory):
+        conversation_memory.close()
 
 
 app = FastAPI(
@@ -75,6 +459,12 @@ class ChatResponse(BaseModel):
     confidence: float = 0.0
 
 
+class BatchChatRequest(BaseModel):
+    questions: List[str]
+    userId: str = Field(default="anonymous")
+    remember: bool = Field(default=False)  # Also record each exchange in conversation memory
+
+
 class HistoryRequest(BaseModel):
     userId: str = "anonymous"
 
@@ -86,11 +476,14 @@ class ResetRequest(BaseModel):
 # --- API Endpoints ---
 
 @app.post("/chat")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, response: Response):
     """
     Send a question and get an AI-generated answer from the knowledge base.
     Supports both 'question' and 'message' fields for backwards compatibility.
     """
+    started = time.perf_counter()
+    timings = metrics.start_request_timings()
+
     # Support both field names from frontend
     user_question = request.question or request.message
     if not user_question or not user_question.strip():
@@ -101,16 +494,25 @@ async def chat(request: ChatRequest):
 
     logger.info(f"Chat request from {user_id}: {user_question[:100]}")
 
-    # Store user message in conversation memory
-    conversation_memory.add_message(user_id, "user", user_question)
-
-    # Generate answer using RAG pipeline
-    result = rag_engine.generate_answer(user_question)
-
-    # Store bot response in conversation memory
-    conversation_memory.add_message(user_id, "bot", result["answer"])
+    # Generate answer using RAG pipeline on the worker pool
+    try:
+        result = await _answer(user_question)
+    except PoolSaturatedError:
+        rejected_total.inc("chat")
+        logger.warning(f"Rejecting chat request from {user_id}: worker pool saturated")
+        raise HTTPException(
+            status_code=503,
+            detail="Assistant is busy, please retry shortly.",
+            headers={"Retry-After": "1"},
+        )
+
+    # Store the exchange in conversation memory (skipped for rejected requests)
+    await _remember(user_id, [(user_question, result["answer"])])
 
     logger.info(f"Response confidence: {result['confidence']}")
+    requests_total.inc("chat", metrics.confidence_band(result["confidence"]))
+    _observe_request("chat", started, timings, response, user_question)
+    startup.record_answer()
 
     # Return both 'answer' and 'response' for frontend compatibility
     return {
@@ -121,10 +523,129 @@ async def chat(request: ChatRequest):
     }
 
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """
+    Answer a question as server-sent events: a "sources" event with the sources
+    and confidence as soon as retrieval finishes, "answer" events with the text
+    in chunks, then "done". Work stops when the client disconnects.
+    """
+    started = time.perf_counter()
+    timings = metrics.start_request_timings()
+
+    user_question = request.question or request.message
+    if not user_question or not user_question.strip():
+        raise HTTPException(status_code=400, detail="Question/message is required.")
+
+    user_question = user_question.strip()
+    user_id = request.userId
+
+    logger.info(f"Streaming chat request from {user_id}: {user_question[:100]}")
+
+    try:
+        retrieved = await _run_while_connected(http_request, _retrieve(user_question))
+    except PoolSaturatedError:
+        rejected_total.inc("stream")
+        logger.warning(f"Rejecting streaming request from {user_id}: worker pool saturated")
+        raise HTTPException(
+            status_code=503,
+            detail="Assistant is busy, please retry shortly.",
+            headers={"Retry-After": "1"},
+        )
+    if retrieved is None:
+        logger.info(f"Client {user_id} disconnected before retrieval finished")
+        return Response(status_code=499)
+
+    engine = rag_engine
+    metadata = engine.answer_metadata(retrieved)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if SERVER_TIMING:
+        # Sent with the first event, so it covers retrieval only
+        headers["Server-Timing"] = metrics.server_timing_header(timings, total=time.perf_counter() - started)
+
+    async def events():
+        try:
+            yield _sse("sources", metadata)
+            answer = engine.answer_text(retrieved)
+            for chunk in engine.answer_chunks(answer, STREAM_CHUNK_CHARS):
+                if await http_request.is_disconnected():
+                    logger.info(f"Client {user_id} disconnected during streaming")
+                    return
+                yield _sse("answer", {"text": chunk})
+            yield _sse("done", {"confidence": metadata["confidence"]})
+
+            await _remember(user_id, [(user_question, answer)])
+            requests_total.inc("stream", metrics.confidence_band(metadata["confidence"]))
+            startup.record_answer()
+        finally:
+            _observe_request("stream", started, timings, question=user_question)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+
+@app.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest, response: Response):
+    """
+    Answer many questions at once (FAQ checks, pre-warming, bulk triage).
+    Retrieval for the whole batch runs as one vectorized pass.
+    """
+    started = time.perf_counter()
+    timings = metrics.start_request_timings()
+
+    questions = [q.strip() if q else "" for q in request.questions]
+    if not questions:
+        raise HTTPException(status_code=400, detail="At least one question is required.")
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many questions ({len(questions)}); the limit is {BATCH_MAX_QUESTIONS}.",
+        )
+    blank = [i for i, q in enumerate(questions) if not q]
+    if blank:
+        raise HTTPException(status_code=400, detail=f"Empty question at index {blank[0]}.")
+
+    logger.info(f"Batch chat request from {request.userId}: {len(questions)} questions")
+
+    if not startup.ready:
+        await _wait_until_ready("batch")
+    try:
+        results = await worker_pool.run("generate_answers", questions)
+    except PoolSaturatedError:
+        rejected_total.inc("batch")
+        logger.warning(f"Rejecting batch request from {request.userId}: worker pool saturated")
+        raise HTTPException(
+            status_code=503,
+            detail="Assistant is busy, please retry shortly.",
+            headers={"Retry-After": "1"},
+        )
+
+    if request.remember:
+        await _remember(request.userId, [(question, result["answer"]) for question, result in zip(questions, results)])
+
+    for result in results:
+        requests_total.inc("batch", metrics.confidence_band(result["confidence"]))
+    _observe_request("batch", started, timings, response)
+    startup.record_answer()
+
+    return {
+        "results": [
+            {
+                "question": question,
+                "answer": result["answer"],
+                "sources": result["sources"],
+                "confidence": result["confidence"],
+            }
+            for question, result in zip(questions, results)
+        ],
+        "count": len(results),
+    }
+
+
 @app.post("/chat/history")
 async def get_history(request: HistoryRequest):
     """Get conversation history for a user."""
-    history = conversation_memory.get_history(request.userId)
+    # May read the durable store; keep the disk (or the manager process) off the event loop
+    history = await asyncio.to_thread(conversation_memory.get_history, request.userId)
     return {
         "history": history,
         "count": len(history),
@@ -134,23 +655,182 @@ async def get_history(request: HistoryRequest):
 @app.post("/chat/reset")
 async def reset_conversation(request: ResetRequest):
     """Clear conversation history for a user."""
-    conversation_memory.clear_history(request.userId)
+    await asyncio.to_thread(conversation_memory.clear_history, request.userId)
     logger.info(f"Conversation reset for user: {request.userId}")
     return {"message": "Conversation reset successfully."}
 
 
 @app.get("/health")
-async def health_check():
-    """Health check endpoint - reports if RAG engine is ready."""
+async def health_check(response: Response):
+    """
+    Health check endpoint - reports if RAG engine is ready, and the startup
+    phases. Answers 503 only if startup failed, so a fast start is live at once.
+    """
+    engine = rag_engine
+    ready = startup.ready
+    if startup.failed:
+        response.status_code = 503
+    conversations = await asyncio.to_thread(conversation_memory.stats)  # A round trip with several workers
     return {
-        "status": "healthy" if rag_engine.is_ready else "initializing",
-        "model_loaded": rag_engine.is_ready,
-        "documents_loaded": len(rag_engine.documents),
-        "index_size": rag_engine.vector_store.index.ntotal if rag_engine.vector_store.index else 0,
+        "status": "healthy" if ready else "failed" if startup.failed else "initializing",
+        "worker_pid": os.getpid(),
+        "model_loaded": ready,
+        "startup": {"fast_start": FAST_START, **startup.status()},
+        "documents_loaded": engine.document_count if engine is not None else 0,
+        "index_size": engine.vector_store.index.ntotal if ready and engine.vector_store.index else 0,
+        "kb_version": engine.kb_version if engine is not None else None,
+        "retrieval": RETRIEVAL,
+        "shards": SHARDS,
+        "prebuilt_index": PREBUILT_INDEX,
+        "reload": engine_reloader.status(),
+        "answer_cache": engine.cache.stats() if engine is not None else None,
+        "exact_match": engine.exact_index.stats() if engine is not None and engine.exact_index is not None else None,
+        "conversations": conversations,
+        "worker_pool": {
+            "mode": worker_pool.mode,
+            "workers": worker_pool.workers,
+            "in_flight": worker_pool.in_flight,
+            "queue_depth": worker_pool.queue_depth,
+            "max_queue": worker_pool.max_queue,
+        },
     }
 
 
-if __name__ == "__main__":
-    import uvicorn
-    port = int(os.environ.get("PORT", 8000))
-    uvicorn.run("backend.main:app", host="0.0.0.0", port=port, reload=True)
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus text exposition of this process's metrics."""
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
+def _require_admin(x_admin_token: Optional[str]):
+    # Constant-time comparison, so response timing does not reveal the token
+    if not ADMIN_TOKEN or not hmac.compare_digest((x_admin_token or "").encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required.")
+
+
+@app.post("/admin/reload", status_code=202)
+async def reload_knowledge_base(x_admin_token: str = Header(default=None)):
+    """Re-parse and re-index the knowledge base in the background, then swap it in."""
+    _require_admin(x_admin_token)
+    if not startup.ready:
+        raise HTTPException(status_code=409, detail="The engine is still starting.")
+    if request_parent_reload is not None:
+        request_parent_reload()  # Coalesced with a reload already running there
+    elif not engine_reloader.reload_in_background():
+        raise HTTPException(status_code=409, detail="A reload is already in progress.")
+    logger.info("Knowledge base reload requested.")
+    return {"message": "Reload started.", "kb_version": rag_engine.kb_version}
+
+
+# --- Diagnostics (per process; see backend.profiling) ---
+
+def _download(content: bytes, filename: str, media_type: str = "application/octet-stream") -> Response:
+    return Response(content=content, media_type=media_type,
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@app.get("/debug/status")
+async def debug_status(x_admin_token: str = Header(default=None)):
+    """What the diagnostics of this worker process are doing."""
+    _require_admin(x_admin_token)
+    return {
+        "worker_pid": os.getpid(),
+        "profiling": profile_lock.locked(),
+        "tracemalloc": {
+            "tracing": allocation_tracer.tracing,
+            "has_snapshot": allocation_tracer.last is not None,
+        },
+        "event_loop_lag": loop_lag_monitor.stats(),
+        "slow_requests": slow_requests.stats(),
+    }
+
+
+@app.post("/debug/profile")
+async def debug_profile(seconds: float = 10.0, output: str = Query("pstats", alias="format"),
+                        interval_ms: float = 5.0, idle: bool = False, x_admin_token: str = Header(default=None)):
+    """
+    Sample the stacks of all threads for `seconds`, then return the profile:
+    a .pstats file (format=pstats), collapsed stacks for flame graphs
+    (format=collapsed) or the top functions as text (format=text), in that
+    format even when no busy thread was sampled.
+    """
+    _require_admin(x_admin_token)
+    if output not in ("pstats", "collapsed", "text"):
+        raise HTTPException(status_code=400, detail="format must be pstats, collapsed or text.")
+    if not 0 < seconds <= MAX_PROFILE_SECONDS or not 0.1 <= interval_ms <= 1000:
+        raise HTTPException(
+            status_code=400,
+            detail=f"seconds must be in (0, {MAX_PROFILE_SECONDS:g}] and interval_ms in [0.1, 1000].",
+        )
+    if profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already being captured.")
+
+    async with profile_lock:
+        sampler = StackSampler(interval=interval_ms / 1000.0, include_idle=idle)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile = sampler.stop()
+    logger.info(f"Captured a {seconds:g}s CPU profile ({profile.samples} samples).")
+
+    if output == "text":
+        return PlainTextResponse(profile.summary())
+    name = f"profile-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}"
+    if output == "pstats":
+        return _download(profile.pstats_bytes(), f"{name}.pstats")
+    return _download(profile.collapsed().encode("utf-8"), f"{name}.collapsed", "text/plain; charset=utf-8")
+
+
+@app.post("/debug/tracemalloc/start")
+async def debug_tracemalloc_start(frames: int = 10, x_admin_token: str = Header(default=None)):
+    """Start tracing allocations, keeping `frames` frames of traceback per allocation."""
+    _require_admin(x_admin_token)
+    if not 1 <= frames <= 100:
+        raise HTTPException(status_code=400, detail="frames must be between 1 and 100.")
+    allocation_tracer.start(frames)
+    return {"tracing": True}
+
+
+@app.post("/debug/tracemalloc/stop")
+async def debug_tracemalloc_stop(x_admin_token: str = Header(default=None)):
+    """Stop tracing allocations and drop the snapshots."""
+    _require_admin(x_admin_token)
+    allocation_tracer.stop()
+    return {"tracing": False}
+
+
+@app.get("/debug/tracemalloc")
+async def debug_tracemalloc(limit: int = 20, group: str = "lineno", x_admin_token: str = Header(default=None)):
+    """
+    Take a snapshot: the top allocation sites and the biggest changes since the
+    previous snapshot, grouped by line, file or whole traceback.
+    """
+    _require_admin(x_admin_token)
+    if group not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="group must be lineno, filename or traceback.")
+    if not allocation_tracer.tracing:
+        raise HTTPException(status_code=409, detail="tracemalloc is not tracing; POST /debug/tracemalloc/start.")
+    return await asyncio.to_thread(allocation_tracer.snapshot, max(1, limit), group)
+
+
+@app.get("/debug/tracemalloc/snapshot")
+async def debug_tracemalloc_snapshot(x_admin_token: str = Header(default=None)):
+    """Download the last snapshot, for tracemalloc.Snapshot.load()."""
+    _require_admin(x_admin_token)
+    if allocation_tracer.last is None:
+        raise HTTPException(status_code=404, detail="No snapshot taken yet; GET /debug/tracemalloc.")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "snapshot.tracemalloc")
+        await asyncio.to_thread(allocation_tracer.dump, path)
+        with open(path, "rb") as f:
+            content = f.read()
+    return _download(content, f"snapshot-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.tracemalloc")
+
+
+@app.get("/debug/slow-requests")
+async def debug_slow_requests(x_admin_token: str = Header(default=None)):
+    """The most recent requests above the slow-request threshold, newest first."""
+    _require_admin(x_admin_token)
+    return {**slow_requests.stats(), "requests": slow_requests.recent()}
+
@@ -1,68 +1,146 @@
 """
-Markdown Parser - Extracts Q&A pairs from the knowledge base markdown file.
+Markdown Parser - Extracts Q&A pairs from the knowledge base markdown file(s).
 
-Parses the markdown file with format:
+Parses markdown files with format:
 ### Question
 <question text>
 ### Answer
 <answer text>
 ---
 
-Converts each pair into a document string for embedding.
+The knowledge base can be a single file, a directory of .md shards, or a glob.
+Files are read line by line and records are yielded one at a time, so parsing
+itself uses constant memory however large the knowledge base is. Checking the
+knowledge base against a persisted index streams it this way (only a hash per
+record is kept); building or updating the index needs the records in a list
+(parse_knowledge_base). A `---` line only
+ends a record when it is followed by the next question (or the end of the
+file); otherwise it is kept as part of the answer.
 """
 
-import re
+import glob
 import os
-from typing import List, Dict
+import re
+from typing import Dict, Iterable, Iterator, List
+
+
+_HEADER_RE = re.compile(r"^###\s*(Question|Answer)\b", re.IGNORECASE)
+_SEPARATOR_RE = re.compile(r"^---+\s*$")
+_GLOB_CHARS = set("*?[")
 
 
-def parse_knowledge_base(filepath: str) -> List[Dict[str, str]]:
+class QAPair:
+    """
+    One Q&A record. Supports the doc["question"] / doc["answer"] / doc["document"]
+    access used across the backend; the combined document string is built on demand.
+    """
+
+    __slots__ = ("question", "answer")
+
+    def __init__(self, question: str, answer: str):
+        self.question = question
+        self.answer = answer
+
+    @property
+    def document(self) -> str:
+        """The combined string used for embedding."""
+        return f"Question: {self.question}\nAnswer: {self.answer}"
+
+    def __getitem__(self, key: str) -> str:
+        if key in ("question", "answer", "document"):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __eq__(self, other):
+        if isinstance(other, QAPair):
+            return (self.question, self.answer) == (other.question, other.answer)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.question, self.answer))
+
+    def __repr__(self):
+        return f"QAPair(question={self.question!r})"
+
+
+def knowledge_base_files(source: str) -> List[str]:
+    """Resolve a file, directory (all *.md inside, recursively) or glob into sorted file paths."""
+    if os.path.isdir(source):
+        files = glob.glob(os.path.join(source, "**", "*.md"), recursive=True)
+    elif _GLOB_CHARS & set(source):
+        files = glob.glob(source, recursive=True)
+    else:
+        files = [source] if os.path.exists(source) else []
+
+    files = sorted(path for path in files if os.path.isfile(path))
+    if not files:
+        raise FileNotFoundError(f"Knowledge base not found: {source}")
+    return files
+
+
+def _parse_file(filepath: str) -> Iterator[QAPair]:
+    state = None  # None, "question" or "answer"
+    question_lines: List[str] = []
+    answer_lines: List[str] = []
+    held_lines: List[str] = []  # A '---' (plus blank lines) that may or may not end the record
+
+    def make_record():
+        question = "".join(question_lines).strip()
+        answer = "".join(answer_lines).strip()
+        if question and answer:
+            return QAPair(question, answer)
+        return None
+
+    with open(filepath, "r", encoding="utf-8-sig") as f:
+        for line in f:
+            stripped = line.strip()
+            header = _HEADER_RE.match(stripped)
+
+            if header and header.group(1).lower() == "question":
+                record = make_record() if state == "answer" else None
+                if record:
+                    yield record
+                state = "question"
+                question_lines, answer_lines, held_lines = [], [], []
+            elif header and state == "question":
+                state = "answer"
+            elif state == "answer":
+                if _SEPARATOR_RE.match(stripped) or (held_lines and not stripped):
+                    held_lines.append(line)
+                else:
+                    # Content after a '---': it was part of the answer after all
+                    answer_lines.extend(held_lines)
+                    held_lines = []
+                    answer_lines.append(line)
+            elif state == "question":
+                if _SEPARATOR_RE.match(stripped):
+                    state = None  # Question without an answer
+                else:
+                    question_lines.append(line)
+
+    if state == "answer":
+        record = make_record()
+        if record:
+            yield record
+
+
+def iter_knowledge_base(source: str) -> Iterator[QAPair]:
+    """Yield Q&A pairs from a knowledge base file, directory or glob, one at a time."""
+    for filepath in knowledge_base_files(source):
+        yield from _parse_file(filepath)
+
+
+def parse_knowledge_base(filepath: str) -> List[QAPair]:
     """
     Parse the markdown knowledge base and extract Q&A pairs.
-    
-    Returns a list of dicts with 'question', 'answer', and 'document' keys.
+
+    Returns a list of QAPair records with 'question', 'answer', and 'document' keys.
     The 'document' field is the combined string used for embedding.
     """
-    if not os.path.exists(filepath):
-        raise FileNotFoundError(f"Knowledge base not found: {filepath}")
-
-    with open(filepath, "r", encoding="utf-8") as f:
-        content = f.read()
-
-    # Split by separator
-    blocks = re.split(r"---\s*", content)
-    
-    documents = []
-    for block in blocks:
-        block = block.strip()
-        if not block:
-            continue
-
-        # Extract question and answer using ### headers
-        question_match = re.search(
-            r"###\s*Question\s*\n+(.*?)(?=###\s*Answer)", block, re.DOTALL
-        )
-        answer_match = re.search(
-            r"###\s*Answer\s*\n+(.*)", block, re.DOTALL
-        )
-
-        if question_match and answer_match:
-            question = question_match.group(1).strip()
-            answer = answer_match.group(1).strip()
-
-            if question and answer:
-                # Create the document string for embedding
-                document = f"Question: {question}\nAnswer: {answer}"
-                documents.append({
-                    "question": question,
-                    "answer": answer,
-                    "document": document,
-                })
-
-    return documents
-
-
-def get_document_texts(documents: List[Dict[str, str]]) -> List[str]:
+    return list(iter_knowledge_base(filepath))
+
+
+def get_document_texts(documents: Iterable[Dict[str, str]]) -> List[str]:
     """Extract just the document strings for embedding."""
     return [doc["document"] for doc in documents]
 
@@ -71,10 +149,10 @@ if __name__ == "__main__":
     # Test the parser
     base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     kb_path = os.path.join(base_dir, "data", "knowledge.md")
-    
+
     docs = parse_knowledge_base(kb_path)
     print(f"Parsed {len(docs)} Q&A pairs from knowledge base.")
-    
+
     if docs:
         print(f"\nSample document:")
         print(f"  Question: {docs[0]['question']}")
@@ -0,0 +1,122 @@
+"""
+Micro Batcher - Groups concurrent requests into one batched engine call.
+
+Handles:
+- Collecting questions for a short window (or until a maximum batch size)
+  and running them as one call, e.g. RAGEngine.generate_answers, so that
+  concurrent requests share one sparse matrix product
+- Coalescing identical questions (same normalized text) that are pending or
+  in flight, so each is computed once
+- Batch size and wait time histograms for tuning the window
+
+Runs on the asyncio event loop; the batched call itself is whatever coroutine
+function is passed in (usually a worker pool job).
+"""
+
+import asyncio
+import contextvars
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from backend.metrics import STAGE_BUCKETS, record_stage, registry
+from backend.defaults import normalize_question
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+batch_size = registry.histogram(
+    "rag_batch_size", "Distinct questions per micro-batch.", ("batcher",), BATCH_SIZE_BUCKETS
+)
+batch_wait_seconds = registry.histogram(
+    "rag_batch_wait_seconds", "Time a question waited for its micro-batch to start.", ("batcher",), STAGE_BUCKETS
+)
+coalesced_total = registry.counter(
+    "rag_batch_coalesced_total", "Questions answered by an identical pending or in-flight question.", ("batcher",)
+)
+
+
+class MicroBatcher:
+    """
+    submit(question) resolves with run_batch([...])[i] for that question.
+    run_batch must return one result per question, in order. If it raises,
+    every question of the batch gets the exception.
+    """
+
+    def __init__(self, name: str, run_batch: Callable[[List[str]], Awaitable[List[Any]]],
+                 window: float = 0.002, max_batch: int = 64):
+        self.name = name
+        self.run_batch = run_batch
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._questions: List[str] = []
+        self._submitted: List[float] = []
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()  # Running batches (the loop only keeps weak references)
+
+    async def submit(self, question: str) -> Any:
+        key = normalize_question(question)
+        future = self._pending.get(key) or self._in_flight.get(key)
+        if future is not None:
+            coalesced_total.inc(self.name)
+        else:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[key] = future
+            self._questions.append(question)
+            self._submitted.append(time.perf_counter())
+            if len(self._questions) >= self.max_batch:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._flush)
+
+        started = time.perf_counter()
+        # shield: a handler that goes away must not cancel the batch for the others
+        result = await asyncio.shield(future)
+        record_stage("batch", time.perf_counter() - started)
+        return result
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _flush(self):
+        self._cancel_timer()
+        if not self._questions:
+            return
+        futures = list(self._pending.items())
+        questions, submitted = self._questions, self._submitted
+        self._pending, self._questions, self._submitted = {}, [], []
+        self._in_flight.update(futures)
+
+        now = time.perf_counter()
+        batch_size.observe(len(questions), self.name)
+        for queued_at in submitted:
+            batch_wait_seconds.observe(now - queued_at, self.name)
+        # Run outside the requests' contexts, so the batch's stage timings are
+        # not attributed to whichever request happened to start it
+        task = contextvars.Context().run(asyncio.ensure_future, self._run(futures, questions))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, futures: List, questions: List[str]):
+        try:
+            results = await self.run_batch(questions)
+        except asyncio.CancelledError:
+            for _, future in futures:
+                future.cancel()
+            raise
+        except Exception as exc:
+            for _, future in futures:
+                if not future.done():
+                    future.set_exception(exc)
+                    future.exception()  # Handlers may be gone; don't log it as unretrieved
+        else:
+            for (_, future), result in zip(futures, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            for key, future in futures:
+                if self._in_flight.get(key) is future:
+                    del self._in_flight[key]
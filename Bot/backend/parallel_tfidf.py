@@ -0,0 +1,165 @@
+"""
+Parallel TF-IDF - Fits TfidfVectorizers with the tokenizing spread over processes.
+
+Handles:
+- Counting n-grams for contiguous chunks of documents in forked worker processes
+- Merging the per-chunk counts into the global count matrix, with terms numbered
+  in order of first appearance exactly like CountVectorizer._count_vocab
+- Handing that matrix to the vectorizer's own fit_transform, so feature selection
+  (max_features), vocabulary sorting, IDF and normalization run unchanged
+
+The result (vocabulary_, idf_ and the matrix) is identical to a sequential
+fit_transform on the same texts. Handing over the counts relies on a private
+scikit-learn method (CountVectorizer._count_vocab); if it is missing, has a
+different signature, or is no longer what fit_transform calls, the plain
+sequential fit_transform is used instead.
+"""
+
+import inspect
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_all_start_methods, get_context
+from typing import List, Sequence, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+import sklearn.feature_extraction.text as sklearn_text
+
+# Below this many documents the process start-up costs more than it saves
+MIN_PARALLEL_DOCUMENTS = 2000
+
+# Chunks per worker, so uneven chunks still keep every worker busy
+CHUNKS_PER_WORKER = 4
+
+# Inherited by forked workers (never pickled)
+_job = None
+
+
+def _init_worker(documents: Sequence, jobs: List[Tuple]):
+    global _job
+    _job = (documents, jobs)
+
+
+def _count_chunk(job: int, start: int, end: int):
+    """CountVectorizer._count_vocab for documents[start:end], with chunk-local term ids."""
+    documents, jobs = _job
+    vectorizer, field = jobs[job]
+    analyze = vectorizer.build_analyzer()
+    vocabulary = {}
+    j_indices = array("q")
+    values = array("i")
+    indptr = array("q", [0])
+    for i in range(start, end):
+        feature_counter = {}
+        for feature in analyze(documents[i][field]):
+            feature_idx = vocabulary.setdefault(feature, len(vocabulary))
+            feature_counter[feature_idx] = feature_counter.get(feature_idx, 0) + 1
+        j_indices.extend(feature_counter.keys())
+        values.extend(feature_counter.values())
+        indptr.append(len(j_indices))
+    return (
+        list(vocabulary),
+        np.frombuffer(j_indices, dtype=np.int64),
+        np.frombuffer(values, dtype=np.intc),
+        np.frombuffer(indptr, dtype=np.int64),
+    )
+
+
+def _merge_counts(chunks: List[Tuple], dtype):
+    """Combine chunk counts into (vocabulary, X) as _count_vocab would return them."""
+    vocabulary = {}
+    j_parts, value_parts, indptr_parts = [], [], []
+    offset = 0
+    for terms, j_indices, values, indptr in chunks:
+        # Terms new in this chunk are numbered in their order of first appearance
+        remap = np.fromiter(
+            (vocabulary.setdefault(term, len(vocabulary)) for term in terms),
+            dtype=np.int64, count=len(terms),
+        )
+        j_parts.append(remap[j_indices])
+        value_parts.append(values)
+        indptr_parts.append(indptr[1:] + offset)
+        offset += indptr[-1]
+    if not vocabulary:
+        raise ValueError("empty vocabulary; perhaps the documents only contain stop words")
+
+    indices_dtype = np.int64 if offset > np.iinfo(np.int32).max else np.int32
+    j_indices = np.concatenate(j_parts).astype(indices_dtype)
+    indptr = np.concatenate([np.zeros(1, dtype=np.int64)] + indptr_parts).astype(indices_dtype)
+    values = np.concatenate(value_parts)
+
+    sparse_type = getattr(sp, "csr_array", sp.csr_matrix)
+    X = sparse_type((values, j_indices, indptr), shape=(len(indptr) - 1, len(vocabulary)), dtype=dtype)
+    X.sort_indices()
+    align = getattr(sklearn_text, "_align_api_if_sparse", None)
+    return vocabulary, align(X) if align is not None else sp.csr_matrix(X)
+
+
+def _count_vocab_hook_supported(vectorizer) -> bool:
+    """Whether the vectorizer has the _count_vocab(raw_documents, fixed_vocab) that _fit_from_counts replaces."""
+    count_vocab = getattr(type(vectorizer), "_count_vocab", None)
+    if count_vocab is None:
+        return False
+    try:
+        return list(inspect.signature(count_vocab).parameters) == ["self", "raw_documents", "fixed_vocab"]
+    except (TypeError, ValueError):
+        return False
+
+
+def _sequential_fit(vectorizer, field: str, documents: Sequence) -> sp.csr_matrix:
+    return sp.csr_matrix(vectorizer.fit_transform(doc[field] for doc in documents))
+
+
+def _fit_from_counts(vectorizer, vocabulary, X):
+    """Run the vectorizer's own fit_transform on precomputed counts."""
+    vectorizer._count_vocab = lambda raw_documents, fixed_vocab: (vocabulary, X)
+    try:
+        return sp.csr_matrix(vectorizer.fit_transform([]))
+    finally:
+        del vectorizer._count_vocab
+
+
+def parallel_fit_transform(jobs: List[Tuple], documents: Sequence, workers: int) -> List[sp.csr_matrix]:
+    """
+    Fit each (vectorizer, field) in `jobs` on `documents` and return the
+    transformed matrices, tokenizing chunks of documents in `workers` processes.
+
+    `documents` must be an indexable sequence of records supporting record[field].
+    Falls back to the plain sequential fit for small inputs, one worker,
+    platforms without fork, or a process running other threads (a reload in a
+    server), where a forked child could deadlock on a lock held by another thread.
+    """
+    if (workers <= 1 or len(documents) < MIN_PARALLEL_DOCUMENTS
+            or "fork" not in get_all_start_methods() or threading.active_count() > 1
+            or not all(_count_vocab_hook_supported(vectorizer) for vectorizer, _ in jobs)):
+        return [_sequential_fit(vectorizer, field, documents) for vectorizer, field in jobs]
+
+    n_chunks = min(len(documents), workers * CHUNKS_PER_WORKER)
+    bounds = np.linspace(0, len(documents), n_chunks + 1).astype(int)
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=get_context("fork"),
+        initializer=_init_worker,
+        initargs=(documents, jobs),
+    ) as pool:
+        futures = [
+            [pool.submit(_count_chunk, job, bounds[i], bounds[i + 1]) for i in range(n_chunks)]
+            for job in range(len(jobs))
+        ]
+        chunk_counts = [[f.result() for f in job_futures] for job_futures in futures]
+
+    matrices = []
+    for (vectorizer, field), counts in zip(jobs, chunk_counts):
+        vocabulary, X = _merge_counts(counts, vectorizer.dtype)
+        try:
+            matrix = _fit_from_counts(vectorizer, vocabulary, X)
+            problem = None if matrix.shape[0] == len(documents) else f"{matrix.shape[0]} rows"
+        except (AttributeError, TypeError, ValueError) as e:
+            problem = f"{type(e).__name__}: {e}"
+        if problem is not None:
+            # fit_transform did not take the merged counts (scikit-learn internals changed)
+            print(f"Fitting from merged counts failed ({problem}); fitting sequentially.")
+            matrix = _sequential_fit(vectorizer, field, documents)
+        matrices.append(matrix)
+    return matrices
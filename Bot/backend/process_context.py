@@ -0,0 +1,26 @@
+"""
+Process Context - How the server starts its helper processes.
+
+Handles:
+- The multiprocessing context for the process worker pool and the search shards
+- Importing the engine modules once, in the forkserver, rather than in every process
+
+The server already runs threads (the event loop lag monitor, the knowledge base
+watcher, background loads and reloads) when it starts these processes, and
+forking a threaded process can deadlock the child on a lock another thread held.
+They are therefore started by a forkserver, or spawned where there is none, and
+receive everything they need as picklable arguments.
+"""
+
+from multiprocessing import get_all_start_methods, get_context
+
+# Imported once by the forkserver rather than by every process it starts
+PRELOAD_MODULES = ["backend.rag_engine", "backend.sharded_store", "backend.vector_store", "backend.worker_pool"]
+
+
+def process_context():
+    if "forkserver" in get_all_start_methods():
+        context = get_context("forkserver")
+        context.set_forkserver_preload(PRELOAD_MODULES)  # No effect once the server runs
+        return context
+    return get_context("spawn")
@@ -0,0 +1,362 @@
+"""
+Profiling - On-demand diagnostics for a running server.
+
+Handles:
+- Time-bounded CPU profiles of every thread (event loop and pool workers) by
+  stack sampling, exported as .pstats (pstats, snakeviz) or collapsed stacks
+  (flame graphs)
+- tracemalloc snapshots: top allocation sites, the diff against the previous
+  snapshot, and the raw snapshot for tracemalloc.Snapshot.load()
+- Event-loop lag: how late a periodic timer fires, as a histogram
+- Slow-request samples: requests above the rolling p99 (or a fixed threshold)
+  are kept with their stage breakdown
+
+Sampling rather than cProfile: a sampler sees all threads at once, costs the
+same whatever the code does, and needs no hook in the code being profiled
+(cProfile traces only the thread that enables it, and on Python 3.12 only one
+profiler may be active per process). Everything here is per process: with
+RAG_WORKERS>1 a request reaches one worker, and with RAG_POOL_MODE=process the
+pipeline itself runs in worker processes that the sampler does not see.
+"""
+
+import asyncio
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from backend.metrics import STAGE_BUCKETS, registry
+
+# Longest CPU profile one request may ask for
+MAX_PROFILE_SECONDS = 60.0
+
+# Leaf frames of a thread that is waiting, not working (file name, function)
+IDLE_FRAMES = frozenset({
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),  # Thread.join
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),  # concurrent.futures worker blocked on its queue
+    ("queue.py", "get"),
+})
+
+loop_lag_seconds = registry.histogram(
+    "rag_event_loop_lag_seconds", "How late the event loop ran a periodic timer.", buckets=STAGE_BUCKETS
+)
+slow_requests_total = registry.counter(
+    "rag_slow_requests_total", "Requests slower than the slow-request threshold.", ("endpoint",)
+)
+
+_Func = Tuple[str, int, str]  # pstats function key: (file, first line, name)
+
+# The one entry of a profile without samples, since pstats refuses an empty one
+# ("~" is the file cProfile gives built-in functions)
+_NO_SAMPLES: _Func = ("~", 0, "<no samples>")
+
+
+def _func_key(code) -> _Func:
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+# --- CPU profiling ---
+
+class SampledProfile:
+    """Stacks collected by a StackSampler, root first, with their sample counts."""
+
+    def __init__(self, stacks: Counter, interval: float, seconds: float, threads: Dict[str, int]):
+        self.stacks = stacks
+        self.interval = interval
+        self.seconds = seconds
+        self.threads = threads  # Samples per thread name
+
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def pstats_dict(self) -> Dict:
+        """
+        The profile in pstats' marshalled form. Sample counts stand in for call
+        counts; self and cumulative times are samples times the interval.
+        Without samples it holds one zero-count entry, so pstats can still load it.
+        """
+        if not self.stacks:
+            return {_NO_SAMPLES: (0, 0, 0.0, 0.0, {})}
+        own: Counter = Counter()
+        total: Counter = Counter()
+        edges: Counter = Counter()  # (caller, callee) -> samples
+        edge_own: Counter = Counter()
+        for (_, frames), count in self.stacks.items():
+            own[frames[-1]] += count
+            for func in set(frames):
+                total[func] += count
+            for caller, callee in set(zip(frames, frames[1:])):
+                edges[caller, callee] += count
+            if len(frames) > 1:
+                edge_own[frames[-2], frames[-1]] += count
+
+        callers: Dict[_Func, Dict] = {func: {} for func in total}
+        for (caller, callee), n in edges.items():
+            callers[callee][caller] = (n, n, edge_own[caller, callee] * self.interval, n * self.interval)
+        return {
+            func: (count, count, own[func] * self.interval, count * self.interval, callers[func])
+            for func, count in total.items()
+        }
+
+    def pstats_bytes(self) -> bytes:
+        """A .pstats file (marshal format), as pstats.Stats.dump_stats writes it."""
+        return marshal.dumps(self.pstats_dict())
+
+    def collapsed(self) -> str:
+        """Collapsed stacks ("thread;outer;inner count" lines) for flamegraph.pl or speedscope."""
+        lines = []
+        for (thread, frames), count in sorted(self.stacks.items(), key=lambda item: -item[1]):
+            names = ";".join(f"{name} ({os.path.basename(path)}:{line})" for path, line, name in frames)
+            lines.append(f"{thread};{names} {count}")
+        return "".join(f"{line}\n" for line in lines)
+
+    def summary(self, limit: int = 30, sort: str = "cumulative") -> str:
+        """The top functions as pstats prints them."""
+        stream = io.StringIO()
+        stream.write(f"{self.samples} samples every {self.interval * 1000:g} ms over {self.seconds:.1f}s\n")
+        if not self.stacks:  # pstats refuses an empty profile
+            stream.write("No busy threads were sampled.\n")
+            return stream.getvalue()
+        stats = pstats.Stats(_LoadedStats(self.pstats_dict()), stream=stream)
+        stats.sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+
+class _LoadedStats:
+    """Adapter that lets pstats.Stats take a stats dict instead of a file or profiler."""
+
+    def __init__(self, stats: Dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class StackSampler:
+    """
+    Samples the Python stack of every other thread every `interval` seconds
+    from a background thread. start() begins a capture, stop() returns it.
+    """
+
+    def __init__(self, interval: float = 0.005, include_idle: bool = False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self._stacks: Counter = Counter()
+        self._threads: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            raise RuntimeError("A profile is already being captured")
+        self._stacks.clear()
+        self._threads.clear()
+        self._stop.clear()
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> SampledProfile:
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+        return SampledProfile(
+            Counter(self._stacks), self.interval, time.perf_counter() - self._started, dict(self._threads)
+        )
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                if not self.include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                frames = []
+                while frame is not None:
+                    frames.append(_func_key(frame.f_code))
+                    frame = frame.f_back
+                thread = names.get(thread_id, str(thread_id))
+                self._stacks[thread, tuple(reversed(frames))] += 1
+                self._threads[thread] += 1
+
+
+# --- Allocation tracing ---
+
+class AllocationTracer:
+    """tracemalloc control plus snapshots diffed against the previous one."""
+
+    def __init__(self):
+        self.last: Optional[tracemalloc.Snapshot] = None
+        self.last_at: Optional[float] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 10):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.last = self.last_at = None
+
+    def stop(self):
+        tracemalloc.stop()
+        self.last = self.last_at = None
+
+    def snapshot(self, limit: int = 20, key_type: str = "lineno") -> Dict:
+        """Top allocation sites now and the biggest changes since the previous snapshot."""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not tracing; start it first")
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        report = {
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "top": [self._stat(stat) for stat in snapshot.statistics(key_type)[:limit]],
+            "diff": None,
+            "seconds_since_previous": None,
+        }
+        if self.last is not None:
+            report["diff"] = [self._stat(stat) for stat in snapshot.compare_to(self.last, key_type)[:limit]]
+            report["seconds_since_previous"] = round(time.time() - self.last_at, 3)
+        self.last, self.last_at = snapshot, time.time()
+        return report
+
+    @staticmethod
+    def _stat(stat) -> Dict:
+        entry = {
+            "where": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+            "size_bytes": stat.size,
+            "count": stat.count,
+        }
+        if hasattr(stat, "size_diff"):
+            entry["size_diff_bytes"] = stat.size_diff
+            entry["count_diff"] = stat.count_diff
+        return entry
+
+    def dump(self, path: str):
+        """Write the last snapshot in tracemalloc's own format (tracemalloc.Snapshot.load)."""
+        if self.last is None:
+            raise RuntimeError("No snapshot taken yet")
+        self.last.dump(path)
+
+
+# --- Event-loop lag ---
+
+class LoopLagMonitor:
+    """Measures how late a timer scheduled every `interval` seconds fires on the event loop."""
+
+    def __init__(self, interval: float = 0.5, window: int = 120):
+        self.interval = interval
+        self.recent: Deque[float] = deque(maxlen=window)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            self.recent.append(lag)
+            loop_lag_seconds.observe(lag)
+
+    def stats(self) -> Dict:
+        recent = sorted(self.recent)
+        if not recent:
+            return {"interval": self.interval, "samples": 0}
+        return {
+            "interval": self.interval,
+            "samples": len(recent),
+            "last_ms": round(self.recent[-1] * 1000, 3),
+            "p50_ms": round(recent[len(recent) // 2] * 1000, 3),
+            "max_ms": round(recent[-1] * 1000, 3),
+        }
+
+
+# --- Slow requests ---
+
+class SlowRequestLog:
+    """
+    Keeps the last `max_samples` requests slower than `threshold` seconds, or,
+    without a fixed threshold, slower than the p99 of the last `window`
+    requests (once `min_requests` have been seen).
+    """
+
+    def __init__(self, threshold: Optional[float] = None, max_samples: int = 50,
+                 window: int = 1000, min_requests: int = 100):
+        self.fixed_threshold = threshold
+        self.min_requests = min_requests
+        self.durations: Deque[float] = deque(maxlen=window)
+        self.samples: Deque[Dict] = deque(maxlen=max_samples)
+        self._p99: Optional[float] = None
+        self._since_update = 0
+        self._lock = threading.Lock()
+
+    @property
+    def threshold(self) -> Optional[float]:
+        return self.fixed_threshold if self.fixed_threshold is not None else self._p99
+
+    def observe(self, endpoint: str, seconds: float, timings: Optional[Dict] = None,
+                question: Optional[str] = None):
+        with self._lock:
+            threshold = self.threshold
+            self.durations.append(seconds)
+            self._since_update += 1
+            # Re-rank the window every 1% of it rather than on every request
+            if (self.fixed_threshold is None and len(self.durations) >= self.min_requests
+                    and self._since_update * 100 >= len(self.durations)):
+                ranked = sorted(self.durations)
+                self._p99 = ranked[min(len(ranked) - 1, int(len(ranked) * 0.99))]
+                self._since_update = 0
+            if threshold is None or seconds <= threshold:
+                return
+            self.samples.append({
+                "at": time.time(),
+                "endpoint": endpoint,
+                "seconds": round(seconds, 6),
+                "threshold": round(threshold, 6),
+                "stages": {name: round(value, 6) for name, value in (timings or {}).items()},
+                "question": question[:200] if question else None,
+            })
+        slow_requests_total.inc(endpoint)
+
+    def stats(self) -> Dict:
+        threshold = self.threshold
+        return {
+            "threshold_ms": round(threshold * 1000, 3) if threshold is not None else None,
+            "auto_threshold": self.fixed_threshold is None,
+            "requests_seen": len(self.durations),
+            "samples": len(self.samples),
+        }
+
+    def recent(self) -> List[Dict]:
+        with self._lock:
+            return list(reversed(self.samples))
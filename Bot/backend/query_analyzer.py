@@ -0,0 +1,266 @@
+"""
+Query Analyzer - Precompiled query expansion and shared tokenization.
+
+Handles:
+- Query expansion ("How to ...", "What is ...", key terms, one synonym rewrite),
+  with the stop words and the synonym automaton built once at startup
+- Synonyms loaded from a JSON config file (data/synonyms.json) and matched with an
+  Aho-Corasick automaton: one pass over the question, whatever the number of synonyms
+- Tokenizing each question once and deriving the tokens of every variant from it
+- Building the sparse TF-IDF vectors of pre-tokenized variants for both fitted
+  vectorizers (n-grams formed once, identical variants vectorized once)
+
+The vectors are identical to TfidfVectorizer.transform on the variant strings:
+only the counting is replaced, IDF weighting and normalization are sklearn's own.
+"""
+
+import json
+import re
+from collections import deque
+from itertools import islice
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfTransformer
+
+from backend.defaults import DEFAULT_SYNONYMS_PATH, normalize_question
+
+# Words dropped from the key-terms variant
+KEY_TERM_STOP_WORDS = frozenset({
+    "i", "me", "my", "we", "our", "you", "your", "the", "a", "an",
+    "is", "are", "was", "were", "be", "been", "being", "have", "has",
+    "had", "do", "does", "did", "will", "would", "could", "should",
+    "can", "may", "might", "shall", "to", "of", "in", "for", "on",
+    "with", "at", "by", "from", "as", "into", "about", "between",
+    "through", "during", "before", "after", "it", "this", "that",
+    "these", "those", "there", "here", "where", "when", "how", "what",
+    "which", "who", "if", "not", "no", "so", "but", "and", "or",
+})
+
+# Maximal runs of word characters; sklearn's default token_pattern keeps those of 2+ characters
+_WORD_RE = re.compile(r"\w+")
+_SKLEARN_TOKEN_PATTERN = r"(?u)\b\w\w+\b"
+
+
+def _tokens(words: List[str]) -> Tuple[str, ...]:
+    return tuple([word for word in words if len(word) > 1])
+
+
+def load_synonyms(path: Optional[str] = DEFAULT_SYNONYMS_PATH) -> List[Tuple[str, str]]:
+    """(term, replacement) pairs in file order; the first matching term wins."""
+    if not path:
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        synonyms = json.load(f)
+    if not isinstance(synonyms, dict):
+        raise ValueError(f"{path}: expected a JSON object of term -> replacement")
+    for term, replacement in synonyms.items():
+        if not term or not isinstance(replacement, str):
+            raise ValueError(f"{path}: invalid synonym {term!r} -> {replacement!r}")
+    return list(synonyms.items())
+
+
+class SynonymMatcher:
+    """
+    Aho-Corasick automaton over the synonym terms. find() returns the pair
+    that comes first in the config among the terms occurring anywhere in the
+    text (plain substring match), in one pass over the text.
+    """
+
+    def __init__(self, synonyms: Sequence[Tuple[str, str]]):
+        self.synonyms = list(synonyms)
+        goto: List[Dict[str, int]] = [{}]
+        # Best (lowest) synonym position among the terms ending in each state
+        best: List[Optional[int]] = [None]
+        for position, (term, _) in enumerate(self.synonyms):
+            state = 0
+            for char in term:
+                if char not in goto[state]:
+                    goto.append({})
+                    best.append(None)
+                    goto[state][char] = len(goto) - 1
+                state = goto[state][char]
+            if best[state] is None:
+                best[state] = position
+
+        # Breadth-first: fail links, inherited matches, then complete transitions (a DFA)
+        fail = [0] * len(goto)
+        transitions: List[Dict[str, int]] = [dict(goto[0])] + [None] * (len(goto) - 1)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            inherited = best[fail[state]]
+            if inherited is not None and (best[state] is None or inherited < best[state]):
+                best[state] = inherited
+            transitions[state] = dict(transitions[fail[state]])
+            for char, child in goto[state].items():
+                fail[child] = transitions[fail[state]].get(char, 0)
+                transitions[state][char] = child
+                queue.append(child)
+        self._transitions = transitions
+        self._best = best
+
+    def find(self, text: str) -> Optional[Tuple[str, str]]:
+        transitions, best = self._transitions, self._best
+        found = None
+        state = 0
+        for char in text:
+            state = transitions[state].get(char, 0)
+            position = best[state]
+            if position is not None and (found is None or position < found):
+                found = position
+                if found == 0:
+                    break
+        return self.synonyms[found] if found is not None else None
+
+
+class QueryVariant:
+    """One expanded search query: its text and its lowercased word tokens (2+ characters)."""
+
+    __slots__ = ("text", "tokens")
+
+    def __init__(self, text: str, tokens: Tuple[str, ...]):
+        self.text = text
+        self.tokens = tokens
+
+    def __repr__(self):
+        return f"QueryVariant({self.text!r})"
+
+
+class QueryAnalyzer:
+    """Expands a question into search variants, tokenizing it once."""
+
+    def __init__(self, synonyms: Optional[Sequence[Tuple[str, str]]] = None,
+                 synonyms_path: Optional[str] = DEFAULT_SYNONYMS_PATH):
+        if synonyms is None:
+            synonyms = load_synonyms(synonyms_path)
+        self.synonyms = SynonymMatcher(synonyms)
+
+    def expand(self, user_question: str) -> List[str]:
+        """The variant strings, as RAGEngine.expand_query returns them."""
+        return [variant.text for variant in self.analyze(user_question)]
+
+    def analyze(self, user_question: str) -> List[QueryVariant]:
+        normalized = normalize_question(user_question)
+        words = _WORD_RE.findall(normalized)
+        # Lowercasing and stripping "?", "." and whitespace never changes the word tokens
+        tokens = _tokens(words)
+        variants = [QueryVariant(user_question, tokens)]
+
+        # Variation 1: Rewrite as "How to" instruction
+        if not normalized.startswith("how"):
+            variants.append(QueryVariant(f"How to {normalized}", ("how", "to") + tokens))
+
+        # Variation 2: Rewrite as "What is" question
+        if not normalized.startswith("what"):
+            variants.append(QueryVariant(f"What is {normalized}", ("what", "is") + tokens))
+
+        # Variation 3: Extract key terms and search
+        key_terms = tuple([w for w in words if w not in KEY_TERM_STOP_WORDS and len(w) > 2])
+        if key_terms:
+            variants.append(QueryVariant(" ".join(key_terms), key_terms))
+
+        # Variation 4: One synonym replacement (the first matching term of the config)
+        synonym = self.synonyms.find(normalized)
+        if synonym is not None:
+            modified = normalized.replace(*synonym)
+            variants.append(QueryVariant(modified, _tokens(_WORD_RE.findall(modified))))
+
+        return variants
+
+
+class QueryVectorizer:
+    """
+    Sparse TF-IDF vectors of pre-tokenized queries for fitted TfidfVectorizers
+    that share their stop words. Use from_vectorizers(), which returns None
+    when a vectorizer tokenizes differently (queries then go through transform()).
+
+    The weighting reuses the vectorizer's private TfidfTransformer (_tfidf);
+    from_vectorizers() also returns None when that is missing or when a probe
+    query does not come out exactly as the vectorizer's own transform().
+    """
+
+    # Vocabulary unigrams per vectorizer in the probe query
+    PROBE_TERMS = 4
+
+    def __init__(self, vectorizers: Sequence, stop_words: frozenset):
+        self.vectorizers = list(vectorizers)
+        self.stop_words = stop_words
+        self.max_n = max(vectorizer.ngram_range[1] for vectorizer in self.vectorizers)
+
+    @classmethod
+    def from_vectorizers(cls, vectorizers: Sequence) -> Optional["QueryVectorizer"]:
+        stop_words = None
+        for vectorizer in vectorizers:
+            if not (vectorizer.analyzer == "word" and vectorizer.input == "content"
+                    and vectorizer.tokenizer is None and vectorizer.preprocessor is None
+                    and vectorizer.lowercase and vectorizer.strip_accents is None
+                    and vectorizer.token_pattern == _SKLEARN_TOKEN_PATTERN and not vectorizer.binary
+                    and hasattr(vectorizer, "vocabulary_")
+                    and isinstance(getattr(vectorizer, "_tfidf", None), TfidfTransformer)):
+                return None
+            words = frozenset(vectorizer.get_stop_words() or ())
+            if stop_words is not None and words != stop_words:
+                return None
+            stop_words = words
+        if not vectorizers:
+            return None
+        query_vectorizer = cls(vectorizers, stop_words)
+        return query_vectorizer if query_vectorizer._matches_transform() else None
+
+    def _matches_transform(self) -> bool:
+        """Whether a probe query gets the same vectors as from each vectorizer's transform()."""
+        probe = []
+        for vectorizer in self.vectorizers:
+            unigrams = (term for term in vectorizer.vocabulary_ if " " not in term)
+            probe.extend(islice(unigrams, self.PROBE_TERMS))
+        try:
+            matrices = self.transform([self.key(probe)])
+            for vectorizer, X in zip(self.vectorizers, matrices):
+                expected = vectorizer.transform([" ".join(probe)])
+                if X.shape != expected.shape or abs(X - expected).max() > 1e-12:
+                    return False
+        except (AttributeError, TypeError, ValueError):
+            return False
+        return True
+
+    def key(self, tokens: Sequence[str]) -> Tuple[str, ...]:
+        """Tokens left after stop-word removal; variants with the same key get the same vectors."""
+        stop_words = self.stop_words
+        return tuple([token for token in tokens if token not in stop_words])
+
+    def _ngrams(self, tokens: Tuple[str, ...]) -> List[List[str]]:
+        """n-grams of the stop-word-filtered tokens, grouped by n (1..max_n)."""
+        grams = [list(tokens)]
+        for n in range(2, self.max_n + 1):
+            grams.append([" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1)])
+        return grams
+
+    def transform(self, keys: Sequence[Tuple[str, ...]]) -> List:
+        """One matrix per vectorizer, with a row per key (see key())."""
+        grams = [self._ngrams(key) for key in keys]
+        matrices = []
+        for vectorizer in self.vectorizers:
+            vocabulary = vectorizer.vocabulary_
+            min_n, max_n = vectorizer.ngram_range
+            j_indices, values, indptr = [], [], [0]
+            for by_n in grams:
+                counts: Dict[int, int] = {}
+                for n in range(min_n, max_n + 1):
+                    for gram in by_n[n - 1]:
+                        index = vocabulary.get(gram)
+                        if index is not None:
+                            counts[index] = counts.get(index, 0) + 1
+                j_indices.extend(counts)
+                values.extend(counts.values())
+                indptr.append(len(j_indices))
+            X = sp.csr_matrix(
+                (np.asarray(values, dtype=np.intc), np.asarray(j_indices, dtype=np.int32),
+                 np.asarray(indptr, dtype=np.int32)),
+                shape=(len(keys), len(vocabulary)), dtype=vectorizer.dtype,
+            )
+            X.sort_indices()
+            # The vectorizer's own IDF weighting, sublinear tf and normalization
+            matrices.append(vectorizer._tfidf.transform(X, copy=False))
+        return matrices
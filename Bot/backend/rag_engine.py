@@ -2,138 +2,223 @@
 RAG Engine - Core Retrieval-Augmented Generation pipeline.
 
 Handles:
-- Query expansion (generate multiple search queries from user input)
+- Query expansion (generate multiple search queries from user input, see backend.query_analyzer)
+- Exact-match fast path for questions that name an existing Q&A pair
 - Retrieval from vector store
 - Context assembly from retrieved documents
 - Answer generation using the retrieved context
+- Caching of retrieval/answer results per knowledge base version
 """
 
-import os
-import re
-from typing import List, Dict, Optional
-from backend.vector_store import VectorStore
-from backend.markdown_parser import parse_knowledge_base
+from typing import Callable, Iterator, List, Dict, Optional
+from backend.defaults import DEFAULT_KB_PATH, DEFAULT_SYNONYMS_PATH, INDEX_DIR, normalize_question
+from backend.vector_store import DOC_WEIGHT, QUESTION_WEIGHT, VectorStore
+from backend.query_analyzer import QueryAnalyzer
+from backend.markdown_parser import iter_knowledge_base, parse_knowledge_base
+from backend.answer_cache import AnswerCache
+from backend.exact_index import ExactIndex
+from backend.index_manifest import compare_manifests, same_index_config
+from backend.metrics import stage
 
 
 class RAGEngine:
     """RAG pipeline: query expansion -> retrieval -> context building -> answer generation."""
 
-    def __init__(self):
-        self.vector_store = VectorStore()
-        self.documents = []
+    def __init__(self, kb_path: str = DEFAULT_KB_PATH, cache_size: int = 1024, cache_ttl: float = 300.0,
+                 retrieval: str = "brute", dense_options: Optional[Dict] = None, shards: int = 1,
+                 synonyms_path: Optional[str] = DEFAULT_SYNONYMS_PATH,
+                 exact_match: bool = True, exact_typos: bool = False,
+                 question_weight: float = QUESTION_WEIGHT, doc_weight: float = DOC_WEIGHT,
+                 index_dir: str = INDEX_DIR, prebuilt_index: bool = False, verify_checksums: bool = False):
+        self.kb_path = kb_path
+        self.index_dir = index_dir
+        # Only load an index built offline (python -m backend.build_index), never fit one
+        self.prebuilt_index = prebuilt_index
+        # Checksum every prebuilt index file on load, rather than checking their sizes
+        self.verify_checksums = verify_checksums
+        self.exact_match = exact_match
+        self.exact_typos = exact_typos
+        self.exact_index: Optional[ExactIndex] = None  # Built with the vector index
+        self.query_analyzer = QueryAnalyzer(synonyms_path=synonyms_path)
+        self.vector_store = VectorStore(
+            retrieval=retrieval, dense_options=dense_options, shards=shards,
+            question_weight=question_weight, doc_weight=doc_weight,
+        )
+        self.document_count = 0  # Q&A pairs in the knowledge base
         self.is_ready = False
+        self.kb_version = None  # Fingerprint of the knowledge base the index was built from
+        self.cache = AnswerCache(max_size=cache_size, ttl=cache_ttl)
         self._similarity_threshold = 0.25  # Minimum similarity score to include
 
-    def initialize(self):
-        """Load knowledge base and build/load the vector index."""
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        kb_path = os.path.join(base_dir, "data", "knowledge.md")
+    def initialize(self, on_phase: Optional[Callable[[str], None]] = None, early_exact: bool = False):
+        """
+        Load knowledge base and build/load the vector index. `on_phase` is told
+        when parsing and index loading start. With `early_exact`, questions that
+        name a Q&A pair are answered from the parsed knowledge base while the
+        index is still loading (see exact_matches).
+
+        The knowledge base is streamed to check it against the persisted index,
+        keeping only a hash per Q&A pair; it is parsed into memory only when the
+        index has to be updated or rebuilt (or for `early_exact`).
+        """
+        report = on_phase or (lambda phase: None)
 
         # Parse the knowledge base
-        self.documents = parse_knowledge_base(kb_path)
-        print(f"Loaded {len(self.documents)} Q&A pairs from knowledge base.")
-
-        # Try to load existing index, otherwise build new one
-        if self.vector_store.load_index():
-            # Verify index matches current documents
-            if self.vector_store.index.ntotal == len(self.documents):
-                print("Using cached FAISS index.")
+        report("parsing")
+        documents = None
+        if self.exact_match and early_exact:
+            documents = parse_knowledge_base(self.kb_path)
+            self.exact_index = ExactIndex(documents, range(len(documents)), typo_tolerance=self.exact_typos)
+        expected = self.vector_store.manifest(documents if documents is not None else iter_knowledge_base(self.kb_path))
+        self.document_count = expected["document_count"]
+        print(f"Loaded {self.document_count} Q&A pairs from knowledge base.")
+
+        report("loading_index")
+        index_dir = self.index_dir
+        with self.vector_store.lock(index_dir):
+            if self.prebuilt_index:
+                self._load_prebuilt_index(expected)
             else:
-                print("Knowledge base changed. Rebuilding index...")
-                self.vector_store.build_index(self.documents)
-                self.vector_store.save_index()
-        else:
-            print("No cached index found. Building new index...")
-            self.vector_store.build_index(self.documents)
-            self.vector_store.save_index()
+                # Older deployments persisted pickles; convert them once
+                self.vector_store.convert_legacy_index(index_dir)
+
+                # Reuse the persisted index only if its manifest matches this exact KB;
+                # if only the content changed, patch the changed documents in place
+                stored = self.vector_store.read_manifest(index_dir)
+                reusable, reason = compare_manifests(stored, expected)
+                if reusable and self.vector_store.load_index(index_dir):
+                    print("Using cached TF-IDF index.")
+                else:
+                    if documents is None:
+                        documents = parse_knowledge_base(self.kb_path)
+                    if (same_index_config(stored, expected)
+                            and self.vector_store.load_index(index_dir)
+                            and self.vector_store.update_index(documents)):
+                        self.vector_store.save_index(index_dir)
+                    else:
+                        print(f"Building new index ({reason})...")
+                        self.vector_store.build_index(documents)
+                        self.vector_store.save_index(index_dir)
+                    # The files may have changed since they were hashed
+                    self.document_count = self.vector_store.ntotal
+
+        if self.exact_match:
+            store = self.vector_store
+            live_rows = [row for row, doc_hash in enumerate(store.doc_hashes) if doc_hash is not None]
+            self.exact_index = ExactIndex(store.documents, live_rows, typo_tolerance=self.exact_typos)
+
+        # New index -> new version; drop anything cached against the old one
+        self.kb_version = self.vector_store.kb_hash[:16]
+        self.cache.clear()
 
         self.is_ready = True
         print("RAG Engine initialized and ready.")
 
+    def _load_prebuilt_index(self, expected: Dict):
+        """Load the offline-built index, refusing one that does not match this KB or is damaged."""
+        rebuild = "rebuild it with: python -m backend.build_index"
+        stored = self.vector_store.read_manifest(self.index_dir)
+        reusable, reason = compare_manifests(stored, expected)
+        if not reusable:
+            raise RuntimeError(
+                f"Prebuilt index in {self.index_dir} does not match the knowledge base ({reason}); {rebuild}"
+            )
+        built_dense, wanted_dense = stored.get("dense"), expected["dense"]
+        if wanted_dense is not None and built_dense != wanted_dense:
+            built_for = f"dense options {built_dense}" if built_dense else "retrieval without a dense projection"
+            raise RuntimeError(
+                f"Prebuilt index in {self.index_dir} was built for {built_for}, not dense options "
+                f"{wanted_dense}; {rebuild} --retrieval dense and the same RAG_DENSE_* settings"
+            )
+        problem = self.vector_store.verify_index(self.index_dir, checksums=self.verify_checksums)
+        if problem:
+            raise RuntimeError(f"Prebuilt index in {self.index_dir} is damaged ({problem}); {rebuild}")
+        if not self.vector_store.load_index(self.index_dir, read_only=True):
+            raise RuntimeError(f"Prebuilt index in {self.index_dir} could not be loaded; {rebuild}")
+        print("Using prebuilt TF-IDF index.")
+
+    normalize_question = staticmethod(normalize_question)
+
     def expand_query(self, user_question: str) -> List[str]:
         """
         Expand the user query into multiple search variations.
         This improves retrieval by searching with different phrasings.
         """
-        queries = [user_question]
-
-        normalized = user_question.lower().strip().rstrip("?").rstrip(".")
-
-        # Variation 1: Rewrite as "How to" instruction
-        if not normalized.startswith("how"):
-            queries.append(f"How to {normalized}")
-
-        # Variation 2: Rewrite as "What is" question
-        if not normalized.startswith("what"):
-            queries.append(f"What is {normalized}")
-
-        # Variation 3: Extract key terms and search
-        stop_words = {
-            "i", "me", "my", "we", "our", "you", "your", "the", "a", "an",
-            "is", "are", "was", "were", "be", "been", "being", "have", "has",
-            "had", "do", "does", "did", "will", "would", "could", "should",
-            "can", "may", "might", "shall", "to", "of", "in", "for", "on",
-            "with", "at", "by", "from", "as", "into", "about", "between",
-            "through", "during", "before", "after", "it", "this", "that",
-            "these", "those", "there", "here", "where", "when", "how", "what",
-            "which", "who", "if", "not", "no", "so", "but", "and", "or",
-        }
-        words = re.findall(r'\b\w+\b', normalized)
-        key_terms = [w for w in words if w not in stop_words and len(w) > 2]
-        if key_terms:
-            queries.append(" ".join(key_terms))
-
-        # Variation 4: Common synonym replacements for SoulSpace features
-        synonym_map = {
-            "diary": "journal entry",
-            "journal": "diary entry",
-            "post": "community post",
-            "message": "chat message",
-            "dm": "direct message",
-            "pic": "profile picture",
-            "avatar": "profile picture",
-            "dark theme": "dark mode",
-            "night mode": "dark mode",
-            "points": "leaderboard",
-            "rank": "leaderboard",
-            "stats": "analytics",
-            "metrics": "analytics",
-            "sign up": "creating an account",
-            "register": "creating an account",
-            "login": "logging in",
-            "sign in": "logging in",
-            "delete account": "account deletion",
-            "remove account": "account deletion",
-            "password": "changing password",
-            "friends": "followers",
-            "connect": "following a user",
-            "ai help": "ai features",
-            "grammar": "ai grammar check",
-            "writing help": "ai writing suggestions",
-        }
-
-        for term, replacement in synonym_map.items():
-            if term in normalized:
-                modified = normalized.replace(term, replacement)
-                queries.append(modified)
-                break  # Only one synonym expansion
-
-        return queries
+        return self.query_analyzer.expand(user_question)
 
     def retrieve(self, user_question: str, top_k: int = 5) -> List[Dict]:
         """
         Retrieve relevant documents using query expansion and multi-search.
         """
+        return self.retrieve_many([user_question], top_k=top_k)[0]
+
+    def exact_matches(self, user_questions: List[str]) -> List[Optional[tuple]]:
+        """(document, 1.0) for each question that names an indexed question, else None."""
+        if self.exact_index is None:
+            return [None] * len(user_questions)
+        with stage("exact"):
+            return [self.exact_index.lookup(user_question) for user_question in user_questions]
+
+    def retrieve_many(self, user_questions: List[str], top_k: int = 5) -> List[List]:
+        """
+        Retrieve documents for several questions at once.
+        Exact question matches skip vector search. All expanded queries of
+        the other uncached questions are scored in a single vectorized pass;
+        identical (normalized) questions are computed once.
+        """
+        results: List[Optional[List]] = [None] * len(user_questions)
+        searched = []
+        for i, match in enumerate(self.exact_matches(user_questions)):
+            if match is not None:
+                results[i] = [match]
+            else:
+                searched.append(i)
+        if searched:
+            found = self._search_many([user_questions[i] for i in searched], top_k)
+            for i, retrieved in zip(searched, found):
+                results[i] = retrieved
+        return results
+
+    def _search_many(self, user_questions: List[str], top_k: int) -> List[List]:
+        """Cached, batched vector retrieval (the part of retrieve_many after exact matches)."""
         if not self.is_ready:
             raise RuntimeError("RAG Engine not initialized. Call initialize() first.")
 
-        # Step 1: Expand the query
-        expanded_queries = self.expand_query(user_question)
+        results: List[Optional[List]] = [None] * len(user_questions)
+        pending: Dict[tuple, List[int]] = {}
+        for i, user_question in enumerate(user_questions):
+            cache_key = ("retrieve", self.normalize_question(user_question), top_k, self.kb_version)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                results[i] = list(cached)
+            else:
+                pending.setdefault(cache_key, []).append(i)
+
+        if pending:
+            # Step 1: Expand every uncached question (tokenized once, shared by all variants)
+            keys = list(pending)
+            with stage("expand"):
+                expansions = [self.query_analyzer.analyze(user_questions[pending[key][0]]) for key in keys]
+
+            # Step 2: Search all expanded queries in one batch
+            flat_queries = [variant for variants in expansions for variant in variants]
+            hits = self.vector_store.batch_search_variants(flat_queries, top_k=top_k)
+
+            offset = 0
+            with stage("merge"):
+                for key, queries in zip(keys, expansions):
+                    merged = self.vector_store.merge_results(hits[offset:offset + len(queries)], top_k=top_k)
+                    offset += len(queries)
 
-        # Step 2: Multi-search with expanded queries
-        results = self.vector_store.multi_search(expanded_queries, top_k=top_k)
+                    # Step 3: Filter by similarity threshold
+                    filtered = self._apply_threshold(merged)
+                    self.cache.put(key, filtered)
+                    for i in pending[key]:
+                        results[i] = list(filtered)
 
-        # Step 3: Filter by similarity threshold
+        return results
+
+    def _apply_threshold(self, results: List) -> List:
         filtered = [
             (doc, score) for doc, score in results
             if score >= self._similarity_threshold
@@ -169,15 +254,61 @@ class RAGEngine:
         
         Returns a dict with 'answer', 'sources', and 'confidence'.
         """
-        # Retrieve relevant documents
-        retrieved = self.retrieve(user_question, top_k=5)
+        return self.generate_answers([user_question])[0]
+
+    def generate_answers(self, user_questions: List[str]) -> List[Dict]:
+        """
+        Answer many questions in one call (one dict per question, in order).
+        Cached answers are reused and the rest share one batched retrieval pass.
+        """
+        answers: List[Optional[Dict]] = [None] * len(user_questions)
+        missing: Dict[tuple, List[int]] = {}
+        exact = self.exact_matches(user_questions)
+        for i, user_question in enumerate(user_questions):
+            if exact[i] is not None:
+                # Names an existing question: its answer, with full confidence
+                answers[i] = self.compose_answer([exact[i]])
+                continue
+            cache_key = ("answer", self.normalize_question(user_question), self.kb_version)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                answers[i] = dict(cached)
+            else:
+                missing.setdefault(cache_key, []).append(i)
 
+        if missing:
+            keys = list(missing)
+            retrieved_lists = self._search_many(
+                [user_questions[missing[key][0]] for key in keys], top_k=5
+            )
+            with stage("answer"):
+                for key, retrieved in zip(keys, retrieved_lists):
+                    result = self.compose_answer(retrieved)
+                    self.cache.put(key, result)
+                    for i in missing[key]:
+                        answers[i] = dict(result)
+
+        return answers
+
+    def compose_answer(self, retrieved: List) -> Dict:
+        """Turn retrieved (document, score) pairs into the answer payload."""
+        return {"answer": self.answer_text(retrieved), **self.answer_metadata(retrieved)}
+
+    @staticmethod
+    def answer_metadata(retrieved: List) -> Dict:
+        """Sources and confidence of an answer, known as soon as retrieval finishes."""
+        if not retrieved:
+            return {"sources": [], "confidence": 0.0}
+        sources = [
+            {"question": doc["question"], "score": round(score, 3)}
+            for doc, score in retrieved[:3]
+        ]
+        return {"sources": sources, "confidence": round(retrieved[0][1], 3)}
+
+    def answer_text(self, retrieved: List) -> str:
+        """The answer text for retrieved (document, score) pairs."""
         if not retrieved:
-            return {
-                "answer": "I'm sorry, I don't have information about that in my knowledge base. Could you try rephrasing your question about SoulSpace?",
-                "sources": [],
-                "confidence": 0.0,
-            }
+            return "I'm sorry, I don't have information about that in my knowledge base. Could you try rephrasing your question about SoulSpace?"
 
         # Build context
         context = self.build_context(retrieved)
@@ -202,38 +333,25 @@ class RAGEngine:
                 f"If this doesn't answer your question, try asking in a different way."
             )
 
-        sources = [
-            {"question": doc["question"], "score": round(score, 3)}
-            for doc, score in retrieved[:3]
-        ]
-
-        return {
-            "answer": answer,
-            "sources": sources,
-            "confidence": round(best_score, 3),
-        }
-
-
-# Conversation memory for multi-turn chat
-class ConversationMemory:
-    """Simple in-memory conversation history per user."""
-
-    def __init__(self, max_history: int = 20):
-        self.histories: Dict[str, List[Dict]] = {}
-        self.max_history = max_history
-
-    def add_message(self, user_id: str, role: str, text: str):
-        if user_id not in self.histories:
-            self.histories[user_id] = []
-
-        self.histories[user_id].append({"role": role, "text": text})
-
-        # Trim old messages
-        if len(self.histories[user_id]) > self.max_history:
-            self.histories[user_id] = self.histories[user_id][-self.max_history:]
-
-    def get_history(self, user_id: str) -> List[Dict]:
-        return self.histories.get(user_id, [])
-
-    def clear_history(self, user_id: str):
-        self.histories.pop(user_id, None)
+        return answer
+
+    @staticmethod
+    def answer_chunks(answer: str, chunk_chars: int = 200) -> Iterator[str]:
+        """Split an answer into pieces of about chunk_chars, at spaces where possible."""
+        start = 0
+        while start < len(answer):
+            end = start + chunk_chars
+            if end < len(answer):
+                space = answer.rfind(" ", start + 1, end + 1)
+                if space > start:
+                    end = space
+            yield answer[start:end]
+            start = end
+
+    def start_shards(self):
+        """Start the sharded search processes before the first query needs them."""
+        self.vector_store.start_shards()
+
+    def close(self):
+        """Release the processes held by the vector store (sharded search)."""
+        self.vector_store.close()
@@ -0,0 +1,103 @@
+"""
+Scoring Matrix - Fused, pre-weighted float32 form of the TF-IDF index for scoring.
+
+Handles:
+- Compiling the question and document matrices into one float32 matrix with the
+  blend weights folded in, so a combined score is a single sparse dot product
+- Storing it term-major (one posting list per term, sorted by row), so a query only
+  touches the postings of its own terms
+- Scoring query batches in blocks, keeping only the rows each query matched, so
+  top-k selection runs over those instead of a dense score per row
+- Rescoring candidate rows (inverted index, dense rerank) with results bit-identical
+  to the full product
+
+The TF-IDF rows are already L2-normalized by TfidfVectorizer, so the dot product
+is the cosine similarity; the compiled matrix is derived data and is rebuilt
+whenever the index is loaded or changes (it is never persisted).
+"""
+
+from typing import Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+# Default weights of question-level and document-level similarity in the combined score
+QUESTION_WEIGHT = 0.6
+DOC_WEIGHT = 0.4
+
+# Queries scored per sparse product (bounds the memory of one product's result)
+BLOCK_QUERIES = 16
+
+
+class ScoringMatrix:
+    """
+    ``question_weight * q.Q[d] + doc_weight * v.D[d]`` as one product: a query
+    stacked as [q | v] times ``matrix``, the transposed [question_weight * Q |
+    doc_weight * D] in CSR (term-major). Without a question matrix the score is
+    the plain document similarity.
+    """
+
+    def __init__(self, doc_matrix: sp.spmatrix, question_matrix: Optional[sp.spmatrix] = None,
+                 question_weight: float = QUESTION_WEIGHT, doc_weight: float = DOC_WEIGHT):
+        if question_matrix is not None:
+            blocks = [question_weight * question_matrix, doc_weight * doc_matrix]
+            self.question_features = question_matrix.shape[1]
+        else:
+            blocks = [doc_matrix]
+            self.question_features = 0
+        self.question_weight = question_weight
+        self.doc_weight = doc_weight
+        stacked = sp.hstack(blocks, format="csc", dtype=np.float32)
+        stacked.eliminate_zeros()  # Tombstoned rows are zeroed in place
+        stacked.sort_indices()
+        self.n_rows, self.n_features = stacked.shape
+        # The CSC arrays of the stacked matrix are the CSR arrays of its transpose
+        self.matrix = sp.csr_matrix(
+            (stacked.data, stacked.indices, stacked.indptr), shape=(self.n_features, self.n_rows), copy=False
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes
+
+    def stack_queries(self, query_vecs: sp.spmatrix, q_vecs: Optional[sp.spmatrix]) -> sp.csr_matrix:
+        """Queries as float32 rows of the stacked term space (float64 would upcast the matrix)."""
+        if self.question_features:
+            return sp.hstack([q_vecs, query_vecs], format="csr", dtype=np.float32)
+        return sp.csr_matrix(query_vecs, dtype=np.float32)
+
+    def score_block(self, queries: sp.csr_matrix) -> sp.csr_matrix:
+        """
+        Scores of at most BLOCK_QUERIES stacked queries as a (n_queries, n_rows)
+        CSR matrix: each query row holds only the rows it matched, sorted by row.
+        """
+        if queries.shape[0] > BLOCK_QUERIES:
+            raise ValueError(f"At most {BLOCK_QUERIES} queries per block, got {queries.shape[0]}")
+        scores = queries @ self.matrix
+        scores.sort_indices()
+        return scores
+
+    def scores(self, queries: sp.csr_matrix) -> np.ndarray:
+        """Dense (n_queries, n_rows) scores of stacked queries (a new array)."""
+        return (queries @ self.matrix).toarray()
+
+    def rescore(self, query: sp.csr_matrix, rows: np.ndarray) -> np.ndarray:
+        """
+        Scores of one stacked query against sorted `rows`, bit-identical to the
+        matching entries of scores(): the same float32 products, added in the
+        same term order as the sparse product.
+        """
+        result = np.zeros(len(rows), dtype=np.float32)
+        if not len(rows):
+            return result
+        indptr, indices, data = self.matrix.indptr, self.matrix.indices, self.matrix.data
+        for term, weight in zip(query.indices, query.data):
+            start, end = indptr[term], indptr[term + 1]
+            postings = indices[start:end]
+            if not len(postings):
+                continue
+            positions = np.searchsorted(postings, rows)
+            positions[positions == len(postings)] = 0
+            hits = postings[positions] == rows
+            result[hits] += weight * data[start:end][positions[hits]]
+        return result
@@ -0,0 +1,180 @@
+"""
+Serving - Multi-worker production server sharing one read-only index.
+
+The parent process loads the RAG index once, binds the listening socket and then
+forks the uvicorn workers. Workers inherit the already-initialized engine, so the
+index is neither rebuilt nor copied per worker: the memory-mapped index files and
+the parent's heap pages are shared copy-on-write. Conversation history lives in a
+single ConversationMemory hosted by a manager process, so every worker sees the
+same state (and owns the durable history store, if configured).
+
+Knowledge base reloads happen in the parent too: it watches the files (and takes
+SIGHUP, which /admin/reload in any worker sends), builds the new engine, then
+replaces the workers one at a time with processes forked from it. Every worker
+serves the same index, shared between them, and it is rebuilt once rather than
+once per worker.
+
+Run with:  RAG_WORKERS=4 python -m backend
+"""
+
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+from multiprocessing import get_context
+from multiprocessing.managers import BaseManager
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+# Minimum seconds between restarts of a crashed worker
+RESTART_BACKOFF = 1.0
+
+# Seconds a worker replaced after a reload gets to finish its requests
+ROLL_TIMEOUT = 30.0
+
+
+class ConversationManager(BaseManager):
+    """Manager process hosting the conversation memory shared by all workers."""
+
+
+def _bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _request_reload():
+    """In a worker: ask the parent to reload the knowledge base and restart the workers."""
+    os.kill(os.getppid(), signal.SIGHUP)
+
+
+def _stop_worker(proc, timeout: float):
+    if proc.is_alive():
+        os.kill(proc.pid, signal.SIGTERM)
+    proc.join(timeout=timeout)
+    if proc.is_alive():
+        proc.kill()
+
+
+def _run_worker(server_module, sock: socket.socket):
+    config = uvicorn.Config(server_module.app, lifespan="on", log_level="info")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve(host: str, port: int, workers: int):
+    """Load the index once, then serve it from `workers` forked processes."""
+    from backend import main as server_module
+
+    ctx = get_context("fork")
+
+    # Shared conversation state, started before the index so it forks small
+    ConversationManager.register("ConversationMemory", server_module.create_conversation_memory)
+    manager = ConversationManager(ctx=ctx)
+    manager.start()
+    server_module.conversation_memory.close()
+    server_module.conversation_memory = manager.ConversationMemory()
+
+    # The index is loaded before forking, so RAG_FAST_START does not apply here
+    logger.info("Loading RAG index in parent process...")
+    server_module.load_engine()
+
+    # Reloads are built here, without threads, since the workers are forked from this
+    # process; the workers inherit this reloader's status and ask it to reload
+    def _swap_engine(engine):
+        server_module.rag_engine = engine
+
+    from backend.engine_reloader import EngineReloader
+
+    reloader = EngineReloader(server_module.create_engine, _swap_engine, server_module._watched_files)
+    server_module.engine_reloader = reloader
+    server_module.request_parent_reload = _request_reload
+    watch_interval = server_module.KB_WATCH_INTERVAL
+    reloader.poll()  # Records the files the engine was built from
+
+    sock = _bind_socket(host, port)
+    logger.info(f"Serving on http://{host}:{port} with {workers} workers")
+
+    # Keep the loaded objects out of the GC's reach so collections in the
+    # workers do not touch (and un-share) the inherited pages
+    gc.collect()
+    gc.freeze()
+
+    stopping = False
+    reload_requested = False
+
+    def _stop(signum, _frame):
+        nonlocal stopping
+        stopping = True
+
+    def _reload(signum, _frame):
+        nonlocal reload_requested
+        reload_requested = True
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    signal.signal(signal.SIGHUP, _reload)
+
+    def _spawn():
+        proc = ctx.Process(target=_run_worker, args=(server_module, sock), daemon=False)
+        proc.start()
+        return proc
+
+    def _roll():
+        """Replace the workers one at a time; each old one finishes its requests first."""
+        logger.info("Restarting workers on the new engine...")
+        for i, old in enumerate(procs):
+            if stopping:
+                return
+            procs[i] = _spawn()
+            _stop_worker(old, ROLL_TIMEOUT)
+
+    procs = [_spawn() for _ in range(workers)]
+    last_restart = 0.0
+    next_poll = time.monotonic() + watch_interval
+    try:
+        while not stopping:
+            time.sleep(0.5)
+            reloaded = False
+            if reload_requested:
+                reload_requested = False
+                logger.info("Knowledge base reload requested.")
+                reloaded = reloader.reload()
+            elif watch_interval > 0 and time.monotonic() >= next_poll:
+                next_poll = time.monotonic() + watch_interval
+                reloaded = reloader.poll()
+            if reloaded and not stopping:
+                # Let the replaced engine be collected, then share the new one like the first
+                gc.unfreeze()
+                gc.collect()
+                gc.freeze()
+                _roll()
+            for i, proc in enumerate(procs):
+                if proc.is_alive() or stopping:
+                    continue
+                wait = RESTART_BACKOFF - (time.monotonic() - last_restart)
+                if wait > 0:
+                    time.sleep(wait)
+                logger.warning(f"Worker {proc.pid} exited with code {proc.exitcode}, restarting")
+                procs[i] = _spawn()
+                last_restart = time.monotonic()
+    finally:
+        logger.info("Stopping workers...")
+        for proc in procs:
+            if proc.is_alive():
+                os.kill(proc.pid, signal.SIGTERM)
+        for proc in procs:
+            _stop_worker(proc, 30)
+        sock.close()
+        try:
+            server_module.conversation_memory.close()
+        except (OSError, EOFError):
+            # A signal sent to the whole process group also stopped the manager
+            logger.warning("Conversation manager already stopped; pending history writes may be lost")
+        manager.shutdown()
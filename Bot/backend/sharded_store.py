@@ -0,0 +1,100 @@
+"""
+Sharded Store - Scatter-gather search over row shards of one VectorStore.
+
+Handles:
+- Splitting the index rows into contiguous shards that share one vocabulary and IDF
+- One search process per shard, so queries are scored on several cores
+- Merging the per-shard top-k into the global top-k
+
+Every shard scores its rows with exactly the same formula (and returns its ties
+in row order), so the merged result is identical to searching the whole store.
+
+The search processes are started without forking the threaded server (see
+backend.process_context), and each receives only its own rows, pickled once
+when it starts.
+"""
+
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from backend.metrics import stage
+from backend.process_context import process_context
+
+# The shard owned by each search process
+_shard = None
+
+
+def _init_shard(shard_args: Dict):
+    """Process initializer: build this process's shard from its rows."""
+    from backend.vector_store import VectorStore
+
+    global _shard
+    _shard = VectorStore.from_rows(**shard_args)
+
+
+def _search_shard(query_vecs, q_vecs, top_k: int):
+    return _shard.search_rows(query_vecs, q_vecs, top_k)
+
+
+def _ping():
+    return True
+
+
+def _shutdown(executors: List[ProcessPoolExecutor], wait: bool = False):
+    for executor in executors:
+        executor.shutdown(wait=wait, cancel_futures=True)
+
+
+class ShardPool:
+    """Search processes for `n_shards` contiguous row ranges of `store`."""
+
+    def __init__(self, store, n_shards: int):
+        n_rows = store.tfidf_matrix.shape[0]
+        n_shards = max(1, min(n_shards, n_rows))
+        self.bounds = np.linspace(0, n_rows, n_shards + 1).astype(np.int64)
+        context = process_context()
+        self._executors = [
+            ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=context,
+                initializer=_init_shard,
+                initargs=(store.shard_rows(int(self.bounds[i]), int(self.bounds[i + 1])),),
+            )
+            for i in range(n_shards)
+        ]
+        # Start the processes (and build each shard's structures) now rather than on the first query
+        for future in [executor.submit(_ping) for executor in self._executors]:
+            future.result()
+        self._finalizer = weakref.finalize(self, _shutdown, self._executors)
+
+    @property
+    def n_shards(self) -> int:
+        return len(self._executors)
+
+    def search(self, query_vecs, q_vecs, top_k: int = 5) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Global top-k (row indices, scores) per query, as VectorStore.search_rows returns them."""
+        with stage("shard_search"):
+            futures = [executor.submit(_search_shard, query_vecs, q_vecs, top_k) for executor in self._executors]
+            shard_hits = [future.result() for future in futures]
+
+        hits = []
+        with stage("shard_merge"):
+            for per_shard in zip(*shard_hits):
+                rows = np.concatenate([ids + start for (ids, _), start in zip(per_shard, self.bounds)])
+                scores = np.concatenate([scores for _, scores in per_shard])
+                # Best score first, ties by row index, like the unsharded selection
+                top = np.lexsort((rows, -scores))[:top_k]
+                hits.append((rows[top], scores[top]))
+        return hits
+
+    def shutdown(self):
+        """
+        Stop the search processes and wait for them to exit. Without the wait,
+        a process that is itself exiting may close the queues before the stop
+        message is sent, and then wait forever for a search process.
+        """
+        if self._finalizer.detach() is not None:
+            _shutdown(self._executors, wait=True)
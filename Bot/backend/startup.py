@@ -0,0 +1,144 @@
+"""
+Startup - Readiness of the serving engine, for fast cold starts.
+
+Handles:
+- Loading the engine on a background thread, so the server binds its port
+  before the heavy imports and the index load
+- Startup phases (starting, importing, parsing, loading_index, ready or failed)
+  and how long each one took
+- Letting requests wait for readiness for a bounded time
+- Time from process start to readiness and to the first successful answer
+
+Times are measured from the start of the process (read from /proc on Linux,
+from the import of this module elsewhere), so they include interpreter startup
+and imports, which is what a cold start costs.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PHASES = ("starting", "importing", "parsing", "loading_index", "ready", "failed")
+
+
+def _process_age() -> Optional[float]:
+    """Seconds since this process started, or None where /proc is not available."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Field 22 (starttime, in clock ticks since boot); the command name may contain spaces
+            started_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - started_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# time.monotonic() at process start
+PROCESS_STARTED = time.monotonic() - (_process_age() or 0.0)
+
+
+class StartupTracker:
+    """Startup phase of this process's engine, with waits for it to become ready."""
+
+    def __init__(self):
+        self.phase = "starting"
+        self.phase_seconds: Dict[str, float] = {}
+        self.error: Optional[str] = None
+        self.seconds_to_ready: Optional[float] = None
+        self.seconds_to_first_answer: Optional[float] = None
+        self.first_answer_before_ready: Optional[bool] = None
+        self._phase_started = PROCESS_STARTED
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ready_event: Optional[asyncio.Event] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.phase == "ready"
+
+    @property
+    def failed(self) -> bool:
+        return self.phase == "failed"
+
+    def enter(self, phase: str):
+        """Record the end of the current phase and the start of `phase`."""
+        if phase not in PHASES:
+            raise ValueError(f"Unknown startup phase: {phase!r} (expected one of {PHASES})")
+        with self._lock:
+            now = time.monotonic()
+            self.phase_seconds[self.phase] = round(now - self._phase_started, 3)
+            self.phase, self._phase_started = phase, now
+            if phase == "ready":
+                self.seconds_to_ready = round(now - PROCESS_STARTED, 3)
+        if phase in ("ready", "failed"):
+            self._done.set()
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.call_soon_threadsafe(self._ready_event.set)
+        logger.info(f"Startup phase: {phase} ({now - PROCESS_STARTED:.2f}s since process start)")
+
+    def mark_ready(self):
+        self.enter("ready")
+
+    def mark_failed(self, error: str):
+        self.error = error
+        self.enter("failed")
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """Let coroutines on `loop` wait for readiness (call from the loop's thread)."""
+        self._ready_event = asyncio.Event()
+        self._loop = loop
+        if self._done.is_set():
+            self._ready_event.set()
+
+    def load_in_background(self, load: Callable[[], None]):
+        """Run `load` (which calls mark_ready) on a thread; an exception marks the startup failed."""
+        def _run():
+            try:
+                load()
+            except Exception as e:
+                logger.exception("Engine startup failed.")
+                self.mark_failed(f"{type(e).__name__}: {e}")
+
+        threading.Thread(target=_run, name="engine-startup", daemon=True).start()
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait up to `timeout` seconds for readiness. Returns whether the engine is ready."""
+        if self._done.is_set() or self._ready_event is None:
+            return self.ready
+        try:
+            await asyncio.wait_for(self._ready_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.ready
+
+    def record_answer(self):
+        """Note a successful answer; the first one sets the time to first answer."""
+        if self.seconds_to_first_answer is not None:
+            return
+        with self._lock:
+            if self.seconds_to_first_answer is not None:
+                return
+            self.seconds_to_first_answer = round(time.monotonic() - PROCESS_STARTED, 3)
+            self.first_answer_before_ready = not self.ready
+        logger.info(f"First answer {self.seconds_to_first_answer}s after process start.")
+
+    def status(self) -> Dict:
+        with self._lock:
+            phases = dict(self.phase_seconds)
+            if self.phase not in ("ready", "failed"):
+                phases[self.phase] = round(time.monotonic() - self._phase_started, 3)
+            return {
+                "phase": self.phase,
+                "phase_seconds": phases,
+                "seconds_to_ready": self.seconds_to_ready,
+                "seconds_to_first_answer": self.seconds_to_first_answer,
+                "first_answer_before_ready": self.first_answer_before_ready,
+                "error": self.error,
+            }
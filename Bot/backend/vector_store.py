@@ -3,28 +3,89 @@ Vector Store - TF-IDF based vector search for semantic retrieval.
 
 Handles:
 - Generating TF-IDF vectors using scikit-learn
-- Building and persisting the vectorizer + matrix
-- Searching for similar documents using cosine similarity
+- Building and persisting the vectorizer + matrix (memory-mapped, with a content manifest)
+- Incremental updates (append / tombstone rows) against the frozen vocabulary
+- Searching for similar documents using cosine similarity (single or batched queries),
+  scored against a fused float32 matrix with configurable blend weights (see backend.scoring_matrix)
+- Optional inverted-index retrieval that prunes the corpus but returns the exact same top-k
+- Optional dense low-rank retrieval over quantized vectors (approximate)
+- Optional sharding: the TF-IDF fit is spread over processes and queries are
+  scored by one process per shard (see backend.sharded_store), with the same results
 """
 
 import os
 import pickle
+import threading
+import time
+from collections import Counter
 import numpy as np
+import scipy.sparse as sp
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from typing import List, Tuple
+from typing import Iterable, List, Tuple, Optional, Dict
+from backend.defaults import DATA_DIR, INDEX_DIR
+from backend.index_manifest import build_manifest, document_hash, kb_hash
+from backend.index_storage import (
+    write_index, read_index, read_index_manifest, index_lock,
+    refresh_checksums, verify_index,
+)
+from backend.inverted_index import InvertedIndex
+from backend.dense_index import DenseIndex, DENSE_DIR, QUERY_OPTIONS, stored_options
+from backend.metrics import stage
+from backend.parallel_tfidf import parallel_fit_transform
+from backend.query_analyzer import QueryVariant, QueryVectorizer
+from backend.scoring_matrix import BLOCK_QUERIES, DOC_WEIGHT, QUESTION_WEIGHT, ScoringMatrix
 
 
-# Paths for persisted index
-INDEX_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
-INDEX_PATH = os.path.join(INDEX_DIR, "tfidf_index.pkl")
-DOCS_PATH = os.path.join(INDEX_DIR, "documents.pkl")
+# Pickle format used by older versions (loaded and converted once)
+LEGACY_INDEX_PATH = os.path.join(DATA_DIR, "tfidf_index.pkl")
+LEGACY_DOCS_PATH = os.path.join(DATA_DIR, "documents.pkl")
+LEGACY_MANIFEST_PATH = os.path.join(DATA_DIR, "index_manifest.json")
+
+# Incremental update thresholds (fractions of the rows of the last full fit)
+MAX_DRIFT = 0.25       # Changed documents before a full refit is required
+MAX_TOMBSTONES = 0.10  # Dead rows before they are compacted away
+# Words outside the fitted vocabulary (fraction of its size) before a full refit is required
+MAX_NEW_TERMS = 0.01
+
+# How queries are scored: "brute" scores every row, "inverted" prunes via posting lists,
+# "dense" scores low-rank quantized vectors (approximate, see backend.dense_index)
+RETRIEVAL_MODES = ("brute", "inverted", "dense")
+
+
+def _row_window(matrix: sp.csr_matrix, start: int, end: int) -> sp.csr_matrix:
+    """Rows start:end of a CSR matrix, sharing its data and indices arrays."""
+    lo, hi = matrix.indptr[start], matrix.indptr[end]
+    return sp.csr_matrix(
+        (matrix.data[lo:hi], matrix.indices[lo:hi], matrix.indptr[start:end + 1] - lo),
+        shape=(end - start, matrix.shape[1]), copy=False,
+    )
 
 
 class VectorStore:
     """TF-IDF vector store with cosine similarity search."""
 
-    def __init__(self):
+    def __init__(self, retrieval: str = "brute", dense_options: Optional[Dict] = None, shards: int = 1,
+                 question_weight: float = QUESTION_WEIGHT, doc_weight: float = DOC_WEIGHT):
+        if retrieval not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {retrieval!r} (expected one of {RETRIEVAL_MODES})")
+        if shards < 1:
+            raise ValueError(f"shards must be at least 1, got {shards}")
+        if shards > 1 and retrieval == "dense":
+            raise ValueError("Sharding is not supported with dense retrieval")
+        if question_weight < 0 or doc_weight < 0 or question_weight + doc_weight <= 0:
+            raise ValueError(f"Invalid blend weights: question {question_weight}, document {doc_weight}")
+        self.retrieval = retrieval
+        # Weights of question-level and document-level similarity in the combined score
+        self.question_weight = question_weight
+        self.doc_weight = doc_weight
+        self.scoring_matrix: Optional[ScoringMatrix] = None  # Compiled from the matrices
+        self.shards = shards
+        self._shard_pool = None  # Started on the first sharded search
+        self._shard_lock = threading.Lock()
+        self.inverted_index: Optional[InvertedIndex] = None
+        self.dense_options = dict(dense_options or {})
+        self.dense_index: Optional[DenseIndex] = None
+        self.query_vectorizer: Optional[QueryVectorizer] = None  # Vectors of pre-tokenized queries
         self.vectorizer = TfidfVectorizer(
             max_features=10000,
             ngram_range=(1, 3),
@@ -42,101 +103,551 @@ class VectorStore:
         self.documents = []
         self.index = None  # Compatibility attribute (stores ntotal-like count)
 
+        # Incremental update state: one content hash per matrix row (None = tombstone)
+        self.doc_hashes: List[Optional[str]] = []
+        self.kb_hash = None
+        self.fitted_count = 0       # Rows in the last full fit
+        self.changes_since_fit = 0  # Documents added/removed since then
+
     @property
     def ntotal(self):
-        return len(self.documents) if self.tfidf_matrix is not None else 0
+        if self.tfidf_matrix is None:
+            return 0
+        return len(self.documents) - self.doc_hashes.count(None)
+
+    def _index_changed(self, refit: bool = False) -> bool:
+        """
+        Rebuild the structures derived from the matrices after they change.
+        `refit` means the vocabulary changed too. Returns True if the dense
+        index was recomputed (and should be persisted).
+        """
+        self.scoring_matrix = None
+        self.inverted_index = None
+        self.query_vectorizer = None
+        self._close_shard_pool()  # Shard processes hold a copy of the old matrices
+        if self.tfidf_matrix is None:
+            return False
+        vectorizers = [self.vectorizer]
+        if self.question_matrix is not None:
+            vectorizers.append(self.question_vectorizer)
+        self.query_vectorizer = QueryVectorizer.from_vectorizers(vectorizers)
+        if self.shards == 1:  # Sharded stores score in the shard processes
+            self._build_scoring()
+        if self.retrieval != "dense":
+            self.dense_index = None
+            return False
+
+        if refit or self._dense_outdated():
+            with stage("build_dense"):
+                self.dense_index = DenseIndex.fit(
+                    self.tfidf_matrix, self.question_matrix, self.kb_hash, **self.dense_options
+                )
+            return True
+        # Query-time settings are not tied to the stored vectors
+        for key in QUERY_OPTIONS:
+            if key in self.dense_options:
+                self.dense_index.options[key] = self.dense_options[key]
+        if self.dense_index.kb_hash != self.kb_hash:
+            # Same vocabulary, changed rows: fold them in with the existing projection
+            with stage("build_dense"):
+                self.dense_index = self.dense_index.refresh(self.tfidf_matrix, self.question_matrix, self.kb_hash)
+            return True
+        return False
+
+    def _dense_outdated(self) -> bool:
+        """True if the dense projection is missing or does not fit the matrices and options."""
+        n_features = self.tfidf_matrix.shape[1] + self.question_matrix.shape[1]
+        return (self.dense_index is None
+                or self.dense_index.components.shape[0] != n_features
+                or not self.dense_index.built_with(self.dense_options))
+
+    def _build_scoring(self):
+        with stage("build_scoring"):
+            self.scoring_matrix = ScoringMatrix(
+                self.tfidf_matrix, self.question_matrix, self.question_weight, self.doc_weight
+            )
+        if self.retrieval == "inverted":
+            with stage("build_inverted"):
+                self.inverted_index = InvertedIndex(self.scoring_matrix)
+
+    def start_shards(self):
+        """Start the shard search processes now rather than on the first search."""
+        if self.shards > 1 and self.tfidf_matrix is not None:
+            self.shard_pool
 
-    def build_index(self, documents: List[dict]):
+    @property
+    def shard_pool(self):
+        """The per-shard search processes, started on first use."""
+        with self._shard_lock:
+            if self._shard_pool is None:
+                from backend.sharded_store import ShardPool
+                print(f"Starting {self.shards} search shards...")
+                self._shard_pool = ShardPool(self, self.shards)
+            return self._shard_pool
+
+    def _close_shard_pool(self):
+        with self._shard_lock:
+            pool, self._shard_pool = self._shard_pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def close(self):
         """
-        Build TF-IDF index from a list of document dicts.
-        Each dict must have a 'document' key with the text to embed.
+        Stop the shard search processes, if any. A server process started by
+        multiprocessing (reload child, forked worker) exits without running
+        atexit handlers, so it must do this before exiting.
         """
-        self.documents = documents
-        texts = [doc["document"] for doc in documents]
-        questions = [doc["question"] for doc in documents]
+        self._close_shard_pool()
 
-        print(f"Building TF-IDF index for {len(texts)} documents...")
-        self.tfidf_matrix = self.vectorizer.fit_transform(texts)
-        self.question_matrix = self.question_vectorizer.fit_transform(questions)
+    def shard_rows(self, start: int, end: int) -> Dict:
+        """What a search process needs to build the shard of rows start:end (see from_rows)."""
+        return {
+            "retrieval": self.retrieval,
+            "question_weight": self.question_weight,
+            "doc_weight": self.doc_weight,
+            "tfidf_matrix": _row_window(self.tfidf_matrix, start, end),
+            "question_matrix": (
+                _row_window(self.question_matrix, start, end) if self.question_matrix is not None else None
+            ),
+        }
+
+    @classmethod
+    def from_rows(cls, retrieval: str, question_weight: float, doc_weight: float,
+                  tfidf_matrix: sp.csr_matrix, question_matrix: Optional[sp.csr_matrix]) -> "VectorStore":
+        """
+        An unsharded store over already-vectorized rows, e.g. one shard of a
+        store. It holds no documents or fitted vectorizers: search it with
+        search_rows() on query vectors from the full store (shard-local rows).
+        """
+        part = cls(retrieval=retrieval, question_weight=question_weight, doc_weight=doc_weight)
+        part.tfidf_matrix = tfidf_matrix
+        part.question_matrix = question_matrix
+        part._build_scoring()
+        return part
+
+    def shard(self, start: int, end: int) -> "VectorStore":
+        """An unsharded store over rows start:end (matrix rows are views)."""
+        return VectorStore.from_rows(**self.shard_rows(start, end))
+
+    def _reset_index_state(self):
+        self.doc_hashes = [document_hash(doc) for doc in self.documents]
+        self.kb_hash = kb_hash(self.doc_hashes)
+        self.fitted_count = len(self.documents)
+        self.changes_since_fit = 0
+
+    def build_index(self, documents: Iterable[dict], workers: Optional[int] = None):
+        """
+        Build TF-IDF index from Q&A records (QAPair or dicts).
+        Each record must provide 'question' and 'document' (the text to embed).
+        Accepts any iterable, e.g. markdown_parser.iter_knowledge_base(); the
+        records become the index rows, so they are all held in memory.
+        Tokenizing is spread over `workers` processes (default: one per shard).
+        """
+        self.documents = list(documents)
+
+        print(f"Building TF-IDF index for {len(self.documents)} documents...")
+        self.tfidf_matrix, self.question_matrix = parallel_fit_transform(
+            [(self.vectorizer, "document"), (self.question_vectorizer, "question")],
+            self.documents, workers=self.shards if workers is None else workers,
+        )
+        self._reset_index_state()
 
         # Set index compatibility object
-        self.index = type("Index", (), {"ntotal": len(documents)})()
-
-        print(f"TF-IDF index built with {len(documents)} vectors.")
-
-    def save_index(self):
-        """Persist the TF-IDF vectorizer, matrix, and documents to disk."""
-        os.makedirs(INDEX_DIR, exist_ok=True)
-        with open(INDEX_PATH, "wb") as f:
-            pickle.dump({
-                "vectorizer": self.vectorizer,
-                "tfidf_matrix": self.tfidf_matrix,
-                "question_vectorizer": self.question_vectorizer,
-                "question_matrix": self.question_matrix,
-            }, f)
-        with open(DOCS_PATH, "wb") as f:
-            pickle.dump(self.documents, f)
-        print(f"Index saved to {INDEX_PATH}")
-
-    def load_index(self) -> bool:
-        """Load a previously saved TF-IDF index from disk. Returns True if successful."""
-        if os.path.exists(INDEX_PATH) and os.path.exists(DOCS_PATH):
-            with open(INDEX_PATH, "rb") as f:
+        self.index = type("Index", (), {"ntotal": len(self.documents)})()
+        self._index_changed(refit=True)
+
+        print(f"TF-IDF index built with {len(self.documents)} vectors.")
+
+    def _new_terms(self, documents: List[dict]) -> Tuple[set, int]:
+        """
+        Words of `documents` that the fitted vocabularies do not know (and so
+        would be dropped by transform()), and how many of the documents have no
+        known word in their question at all.
+        """
+        new_terms = set()
+        unreachable = 0
+        fields = [(self.vectorizer, "document"), (self.question_vectorizer, "question")]
+        analyzers = [(vectorizer.build_analyzer(), vectorizer.vocabulary_, field) for vectorizer, field in fields]
+        for doc in documents:
+            for analyze, vocabulary, field in analyzers:
+                words = {term for term in analyze(doc[field]) if " " not in term}
+                unknown = {word for word in words if word not in vocabulary}
+                new_terms |= unknown
+                if field == "question" and words and unknown == words:
+                    unreachable += 1
+        return new_terms, unreachable
+
+    def update_index(self, documents: List[dict], max_drift: float = MAX_DRIFT,
+                     max_tombstones: float = MAX_TOMBSTONES, max_new_terms: float = MAX_NEW_TERMS) -> bool:
+        """
+        Bring the index in line with `documents` without refitting the vectorizers.
+
+        Rows whose content disappeared are tombstoned (zeroed in place) and new or
+        edited documents are vectorized against the frozen vocabulary and appended,
+        so only the changed documents are tokenized. Words the vocabulary does not
+        know are dropped from their vectors, so a document about a new topic could
+        not be found by its own question. Returns False, leaving the index untouched,
+        when the accumulated changes exceed `max_drift` of the last full fit, when
+        the new words exceed `max_new_terms` of the vocabulary, or when a new
+        question has no known word; the caller should then rebuild with build_index().
+        """
+        if self.tfidf_matrix is None:
+            return False
+
+        new_hashes = [document_hash(doc) for doc in documents]
+
+        # Multiset diff between the current rows and the new documents
+        wanted = Counter(new_hashes)
+        kept = Counter()
+        removed_rows = []
+        for row, h in enumerate(self.doc_hashes):
+            if h is None:
+                continue
+            if kept[h] < wanted[h]:
+                kept[h] += 1
+            else:
+                removed_rows.append(row)
+        added = []
+        for doc, h in zip(documents, new_hashes):
+            if kept[h] > 0:
+                kept[h] -= 1
+            else:
+                added.append((doc, h))
+
+        changes = len(removed_rows) + len(added)
+        if self.changes_since_fit + changes > max_drift * max(self.fitted_count, 1):
+            print(f"Index drift too large ({self.changes_since_fit + changes} changes), full rebuild needed.")
+            return False
+
+        new_terms, unreachable = self._new_terms([doc for doc, _ in added])
+        if new_terms:
+            sample = ", ".join(sorted(new_terms)[:10])
+            print(f"{len(new_terms)} new terms outside the fitted vocabulary ({sample}"
+                  f"{', ...' if len(new_terms) > 10 else ''}).")
+        if unreachable or len(new_terms) > max_new_terms * len(self.vectorizer.vocabulary_):
+            reason = f"new questions with no known term: {unreachable}" if unreachable else "vocabulary drift too large"
+            print(f"Index {reason}, full rebuild needed.")
+            return False
+
+        for row in removed_rows:
+            for matrix in (self.tfidf_matrix, self.question_matrix):
+                matrix.data[matrix.indptr[row]:matrix.indptr[row + 1]] = 0
+            self.doc_hashes[row] = None
+
+        if added:
+            new_docs = [doc for doc, _ in added]
+            self.tfidf_matrix = sp.vstack([
+                self.tfidf_matrix,
+                self.vectorizer.transform([doc["document"] for doc in new_docs]),
+            ], format="csr")
+            self.question_matrix = sp.vstack([
+                self.question_matrix,
+                self.question_vectorizer.transform([doc["question"] for doc in new_docs]),
+            ], format="csr")
+            self.documents = list(self.documents) + new_docs
+            self.doc_hashes.extend(h for _, h in added)
+
+        self.changes_since_fit += changes
+        self.kb_hash = kb_hash(new_hashes)
+
+        if self.doc_hashes.count(None) > max_tombstones * len(self.doc_hashes):
+            self.compact()
+
+        self.index = type("Index", (), {"ntotal": self.ntotal})()
+        self._index_changed()
+        print(f"Index updated in place: {len(removed_rows)} removed, {len(added)} added.")
+        return True
+
+    def compact(self):
+        """Drop tombstoned rows from the matrices and document list."""
+        live = [row for row, h in enumerate(self.doc_hashes) if h is not None]
+        self.tfidf_matrix = self.tfidf_matrix[live]
+        self.question_matrix = self.question_matrix[live]
+        self.documents = [self.documents[row] for row in live]
+        self.doc_hashes = [self.doc_hashes[row] for row in live]
+
+    def manifest(self, documents: Optional[Iterable[dict]] = None) -> Dict:
+        """
+        Manifest describing an index over `documents` (default: the indexed rows).
+        `documents` is read once and not kept, so it can be a stream.
+        Its "dense" entry holds the stored options of the dense projection: the
+        configured ones for `documents`, those of the built projection otherwise
+        (None without dense retrieval).
+        """
+        if documents is not None:
+            return build_manifest(
+                [document_hash(doc) for doc in documents],
+                self.vectorizer,
+                self.question_vectorizer,
+                dense=stored_options(self.dense_options) if self.retrieval == "dense" else None,
+            )
+        return build_manifest(
+            self.doc_hashes,
+            self.vectorizer,
+            self.question_vectorizer,
+            kb_digest=self.kb_hash,
+            fitted_count=self.fitted_count,
+            changes_since_fit=self.changes_since_fit,
+            dense=stored_options(self.dense_index.options) if self.dense_index is not None else None,
+        )
+
+    @staticmethod
+    def lock(index_dir: str = INDEX_DIR):
+        """Context manager serializing index rebuilds across processes."""
+        return index_lock(index_dir)
+
+    @staticmethod
+    def read_manifest(index_dir: str = INDEX_DIR) -> Optional[Dict]:
+        """Read the persisted index manifest without mapping the index itself."""
+        return read_index_manifest(index_dir)
+
+    @staticmethod
+    def verify_index(index_dir: str = INDEX_DIR, checksums: bool = True) -> Optional[str]:
+        """
+        Check the persisted files against their checksums (or, without `checksums`,
+        their sizes): None if intact, else the problem.
+        """
+        return verify_index(index_dir, checksums)
+
+    def save_index(self, index_dir: str = INDEX_DIR, build_info: Optional[Dict] = None):
+        """
+        Persist the vectorizers, matrices, and documents as a memory-mappable index
+        directory. `build_info` (e.g. how the index was built) is kept in the manifest.
+        """
+        manifest = self.manifest()
+        manifest["built_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        if build_info:
+            manifest["build"] = build_info
+        write_index(index_dir, self, manifest)
+        print(f"Index saved to {index_dir}")
+
+    def load_index(self, index_dir: str = INDEX_DIR, read_only: bool = False) -> bool:
+        """
+        Map a previously saved index directory. Returns True if successful.
+        A missing or outdated dense projection is refitted and saved into the
+        directory, unless `read_only`, where loading fails instead.
+        """
+        manifest = read_index(index_dir, self)
+        if manifest is None:
+            return False
+        self.doc_hashes = manifest["document_hashes"]
+        self.kb_hash = manifest["kb_hash"]
+        self.fitted_count = manifest["fitted_count"]
+        self.changes_since_fit = manifest["changes_since_fit"]
+        self.index = type("Index", (), {"ntotal": self.ntotal})()
+        dense_dir = os.path.join(index_dir, DENSE_DIR)
+        self.dense_index = DenseIndex.load(dense_dir) if self.retrieval == "dense" else None
+        if read_only and self.retrieval == "dense" and (
+                self._dense_outdated() or self.dense_index.kb_hash != self.kb_hash):
+            print(f"{index_dir} has no dense projection built with {stored_options(self.dense_options)}.")
+            return False
+        if self._index_changed():
+            self.dense_index.save(dense_dir)
+            refresh_checksums(index_dir, dense=stored_options(self.dense_index.options))
+        print(f"Loaded TF-IDF index with {self.ntotal} vectors.")
+        return True
+
+    def load_legacy_index(self) -> bool:
+        """Load an index saved by older versions as pickles. Returns True if successful."""
+        if os.path.exists(LEGACY_INDEX_PATH) and os.path.exists(LEGACY_DOCS_PATH):
+            with open(LEGACY_INDEX_PATH, "rb") as f:
                 data = pickle.load(f)
                 self.vectorizer = data["vectorizer"]
                 self.tfidf_matrix = data["tfidf_matrix"]
                 self.question_vectorizer = data.get("question_vectorizer", self.question_vectorizer)
                 self.question_matrix = data.get("question_matrix")
-            with open(DOCS_PATH, "rb") as f:
+            with open(LEGACY_DOCS_PATH, "rb") as f:
                 self.documents = pickle.load(f)
-            self.index = type("Index", (), {"ntotal": len(self.documents)})()
-            print(f"Loaded TF-IDF index with {len(self.documents)} vectors.")
+            if "doc_hashes" in data:
+                self.doc_hashes = data["doc_hashes"]
+                self.kb_hash = data["kb_hash"]
+                self.fitted_count = data["fitted_count"]
+                self.changes_since_fit = data["changes_since_fit"]
+            else:
+                self._reset_index_state()
+            self.index = type("Index", (), {"ntotal": self.ntotal})()
+            self._index_changed()
+            print(f"Loaded legacy TF-IDF index with {self.ntotal} vectors.")
             return True
         return False
 
+    def convert_legacy_index(self, index_dir: str = INDEX_DIR) -> bool:
+        """
+        One-shot conversion of the legacy pickles into the index directory format.
+        Does nothing if there is no legacy index or the directory already exists.
+        """
+        if read_index_manifest(index_dir) is not None or not self.load_legacy_index():
+            return False
+        self.save_index(index_dir)
+        for path in (LEGACY_INDEX_PATH, LEGACY_DOCS_PATH, LEGACY_MANIFEST_PATH):
+            if os.path.exists(path):
+                os.remove(path)
+        print("Converted legacy pickle index.")
+        return True
+
     def search(self, query: str, top_k: int = 5) -> List[Tuple[dict, float]]:
         """
         Search the vector store for documents similar to the query.
         Uses both document-level and question-level TF-IDF for better matching.
         Returns list of (document_dict, similarity_score) tuples.
         """
+        return self.batch_search([query], top_k=top_k)[0]
+
+    def batch_search(self, queries: List[str], top_k: int = 5) -> List[List[Tuple[dict, float]]]:
+        """
+        Search for several queries in one vectorized pass.
+
+        All queries are transformed as one matrix per vectorizer and scored with
+        a single sparse matrix product, then the top-k of each row is picked with
+        partial selection instead of a full sort. In "inverted" mode only the
+        candidates left after posting-list pruning are scored. With shards, the
+        scoring runs in one process per shard and the results are merged.
+        Returns one list of (document_dict, similarity_score) tuples per query.
+        """
         if self.tfidf_matrix is None:
             raise RuntimeError("Index not built or loaded. Call build_index() or load_index() first.")
+        if not queries:
+            return []
 
-        # Transform query using both vectorizers
-        query_vec = self.vectorizer.transform([query])
-        doc_sim = cosine_similarity(query_vec, self.tfidf_matrix).flatten()
+        return self._search_vectors(*self._transform_queries(queries), top_k)
 
-        # Question-level similarity (higher weight since user queries match questions better)
-        if self.question_matrix is not None:
-            q_vec = self.question_vectorizer.transform([query])
-            q_sim = cosine_similarity(q_vec, self.question_matrix).flatten()
-            # Combine: 60% question match + 40% document match
-            similarities = 0.6 * q_sim + 0.4 * doc_sim
+    def batch_search_variants(self, variants: List[QueryVariant], top_k: int = 5) -> List[List[Tuple[dict, float]]]:
+        """
+        batch_search() for variants from backend.query_analyzer, using their
+        tokens instead of re-analyzing the strings. Variants that are the same
+        after stop-word removal are scored once and share their result list.
+        """
+        if self.tfidf_matrix is None:
+            raise RuntimeError("Index not built or loaded. Call build_index() or load_index() first.")
+        if self.query_vectorizer is None:
+            return self.batch_search([variant.text for variant in variants], top_k=top_k)
+        if not variants:
+            return []
+
+        with stage("transform"):
+            positions: Dict[tuple, int] = {}
+            rows = [positions.setdefault(self.query_vectorizer.key(variant.tokens), len(positions))
+                    for variant in variants]
+            matrices = self.query_vectorizer.transform(list(positions))
+        query_vecs = matrices[0]
+        q_vecs = matrices[1] if len(matrices) > 1 else None
+        results = self._search_vectors(query_vecs, q_vecs, top_k)
+        return [results[row] for row in rows]
+
+    def _search_vectors(self, query_vecs, q_vecs, top_k: int) -> List[List[Tuple[dict, float]]]:
+        if self.shards > 1:
+            hits = self.shard_pool.search(query_vecs, q_vecs, top_k)
         else:
-            similarities = doc_sim
+            hits = self.search_rows(query_vecs, q_vecs, top_k)
+        return [
+            [(self.documents[row], float(score)) for row, score in zip(rows, scores) if score > 0]
+            for rows, scores in hits
+        ]
+
+    def search_rows(self, query_vecs, q_vecs, top_k: int = 5) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Top-k (row indices, scores) of already-vectorized queries, best first,
+        ties broken by row index. May include zero scores.
+        """
+        with stage("transform"):
+            queries = self.scoring_matrix.stack_queries(query_vecs, q_vecs)
+        if self.inverted_index is not None:
+            return self._inverted_search(queries, top_k)
+        if self.dense_index is not None:
+            return self._dense_search(query_vecs, q_vecs, queries, top_k)
 
-        # Get top-k indices sorted by similarity
-        top_indices = np.argsort(similarities)[::-1][:top_k]
+        # One sparse product per block of queries; rows a query does not match score 0
+        # and are never selected, so only the matched rows are ranked
+        hits = []
+        for start in range(0, queries.shape[0], BLOCK_QUERIES):
+            with stage("score"):
+                similarities = self.scoring_matrix.score_block(queries[start:start + BLOCK_QUERIES])
+            with stage("select"):
+                indptr = similarities.indptr
+                for i in range(similarities.shape[0]):
+                    rows = similarities.indices[indptr[i]:indptr[i + 1]]
+                    scores = similarities.data[indptr[i]:indptr[i + 1]]
+                    top = self._top_k_indices(scores, top_k)
+                    hits.append((rows[top], scores[top]))
+        return hits
 
-        results = []
-        for idx in top_indices:
-            score = float(similarities[idx])
-            if score > 0:
-                results.append((self.documents[idx], score))
+    def _transform_queries(self, queries: List[str]):
+        """Vectorize queries for the document and (if present) question matrices."""
+        with stage("transform"):
+            query_vecs = self.vectorizer.transform(queries)
+            q_vecs = None
+            if self.question_matrix is not None:
+                q_vecs = self.question_vectorizer.transform(queries)
+        return query_vecs, q_vecs
 
-        return results
+    def _score_queries(self, queries: List[str]) -> np.ndarray:
+        """Return a dense (len(queries), n_documents) matrix of combined similarities."""
+        return self.scoring_matrix.scores(self.scoring_matrix.stack_queries(*self._transform_queries(queries)))
+
+    def _inverted_search(self, queries: sp.csr_matrix, top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Prune with the inverted index, then rescore the candidates exactly."""
+        hits = []
+        for i in range(queries.shape[0]):
+            query = queries[i]
+            with stage("candidates"):
+                docs = self.inverted_index.candidates(*self.inverted_index.query_terms(query), top_k)
+            # Same products as the brute-force path, only for the candidates
+            with stage("score"):
+                scores = self.scoring_matrix.rescore(query, docs)
+            with stage("select"):
+                top = self._top_k_indices(scores, top_k)
+                hits.append((docs[top], scores[top]))
+        return hits
+
+    def _dense_search(self, query_vecs, q_vecs, queries: sp.csr_matrix,
+                      top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Pick candidates with the low-rank quantized vectors, then rescore them exactly."""
+        rerank = self.dense_index.options["rerank"]
+        with stage("score"):
+            latent = self.dense_index.project_queries(query_vecs, q_vecs, self.question_weight, self.doc_weight)
+            hits = self.dense_index.search(latent, max(top_k, rerank), self._top_k_indices)
+
+        if not rerank:
+            return hits
+        with stage("rerank"):
+            reranked = []
+            for i, (docs, _) in enumerate(hits):
+                order = np.argsort(docs, kind="stable")  # Document order for tie-breaking
+                docs = docs[order]
+                # The dense score only picks the candidates; the confidence is the exact score
+                scores = self.scoring_matrix.rescore(queries[i], docs)
+                top = self._top_k_indices(scores, top_k)
+                reranked.append((docs[top], scores[top]))
+        return reranked
+
+    @staticmethod
+    def _top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+        """Indices of the top_k highest scores, best first, via partial selection."""
+        if top_k >= len(scores):
+            candidates = np.arange(len(scores))
+        else:
+            kth = np.partition(scores, -top_k)[-top_k]
+            # Everything tied with the k-th score competes, so ties at the
+            # cut-off are always resolved the same way
+            candidates = np.flatnonzero(scores >= kth) if kth > 0 else np.flatnonzero(scores > 0)
+        # Best score first; ties broken by document order for stable results
+        order = np.lexsort((candidates, -scores[candidates]))
+        return candidates[order[:top_k]]
 
     def multi_search(self, queries: List[str], top_k: int = 5) -> List[Tuple[dict, float]]:
         """
         Search with multiple queries and merge results, removing duplicates.
         Used for query expansion - search with multiple rephrased queries.
         """
+        return self.merge_results(self.batch_search(queries, top_k=top_k), top_k=top_k)
+
+    @staticmethod
+    def merge_results(result_lists: List[List[Tuple[dict, float]]], top_k: int = 5) -> List[Tuple[dict, float]]:
+        """Merge per-query results, keeping the first hit for each question, best score first."""
         seen = set()
         merged_results = []
 
-        for query in queries:
-            results = self.search(query, top_k=top_k)
+        for results in result_lists:
             for doc, score in results:
                 doc_key = doc["question"]
                 if doc_key not in seen:
@@ -147,22 +658,3 @@ class VectorStore:
         merged_results.sort(key=lambda x: x[1], reverse=True)
         return merged_results[:top_k]
 
-
-if __name__ == "__main__":
-    from markdown_parser import parse_knowledge_base
-
-    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    kb_path = os.path.join(base_dir, "data", "knowledge.md")
-
-    docs = parse_knowledge_base(kb_path)
-    print(f"Loaded {len(docs)} documents")
-
-    store = VectorStore()
-    store.build_index(docs)
-    store.save_index()
-
-    # Test search
-    results = store.search("How do I create a diary entry?", top_k=3)
-    print("\nSearch results for 'How do I create a diary entry?':")
-    for doc, score in results:
-        print(f"  [{score:.4f}] {doc['question']}")
@@ -0,0 +1,153 @@
+"""
+Worker Pool - Runs the CPU-bound RAG pipeline off the asyncio event loop.
+
+Handles:
+- Thread or process executors with a configurable number of workers
+- A bounded queue that rejects new work immediately when full
+- Reporting in-flight work and current queue depth
+- Carrying per-request stage timings (including time spent queued) back to the caller
+
+Worker processes are not forked from the threaded server (see backend.process_context);
+each builds its engine from `engine_options` and loads the already persisted index.
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Callable, Dict, Optional
+
+from backend.metrics import record_stage, record_stages, start_request_timings
+from backend.process_context import process_context
+
+
+class PoolSaturatedError(RuntimeError):
+    """Raised when the pool already holds as much work as it is allowed to queue."""
+
+
+# Engine owned by each worker process in "process" mode
+_process_engine = None
+
+
+def _init_process_worker(engine_options: Optional[Dict] = None):
+    """Process-pool initializer: load the (already persisted) index once per worker."""
+    from backend.rag_engine import RAGEngine
+
+    global _process_engine
+    # Unsharded: the pool already spreads queries over processes, and a worker that
+    # owned search processes would wait for them forever when it exits (a process
+    # started by multiprocessing joins its children before anything stops them)
+    _process_engine = RAGEngine(**dict(engine_options or {}, shards=1))
+    _process_engine.initialize()
+
+
+def _call_process_engine(method: str, args: tuple, submitted: float):
+    # Stage timings are measured here and replayed into the parent's metrics
+    timings = start_request_timings()
+    record_stage("queue", time.monotonic() - submitted)
+    return getattr(_process_engine, method)(*args), timings
+
+
+def _call_thread_engine(fn: Callable, args: tuple, submitted: float):
+    record_stage("queue", time.monotonic() - submitted)
+    return fn(*args)
+
+
+class WorkerPool:
+    """Bounded executor for RAGEngine calls, in threads or worker processes."""
+
+    def __init__(self, engine_getter: Callable, mode: str = "thread",
+                 workers: int = 4, max_queue: int = 32,
+                 engine_options: Optional[Dict] = None):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown worker pool mode: {mode!r} (expected 'thread' or 'process')")
+        self.engine_getter = engine_getter
+        self.engine_options = engine_options  # RAGEngine arguments of each worker process's engine
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self._executor: Optional[object] = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        """Jobs submitted and not yet finished (running + queued)."""
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs waiting for a free worker."""
+        return max(0, self._in_flight - self.workers)
+
+    def _create_executor(self):
+        if self.mode == "process":
+            return ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=process_context(),
+                initializer=_init_process_worker,
+                initargs=(self.engine_options,),
+            )
+        return ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="rag-worker"
+        )
+
+    def start(self):
+        if self._executor is None:
+            self._executor = self._create_executor()
+
+    def restart(self):
+        """Swap in a fresh executor; jobs already submitted finish on the old one."""
+        old = self._executor
+        self._executor = self._create_executor()
+        if old is not None:
+            old.shutdown(wait=False)
+
+    def shutdown(self):
+        """Stop the workers and wait for them (see ShardPool.shutdown for why a process pool must)."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def _release(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+
+    async def run(self, method: str, *args):
+        """
+        Run ``engine.<method>(*args)`` on the pool and await its result.
+        Raises PoolSaturatedError without queuing if the pool is full.
+        """
+        if self._executor is None:
+            raise RuntimeError("Worker pool not started. Call start() first.")
+
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_queue:
+                raise PoolSaturatedError(
+                    f"Worker pool saturated ({self._in_flight} jobs in flight)."
+                )
+            self._in_flight += 1
+
+        submitted = time.monotonic()
+        try:
+            if self.mode == "process":
+                future = self._executor.submit(_call_process_engine, method, args, submitted)
+            else:
+                # Run in a copy of the caller's context so stage timings reach the request
+                context = contextvars.copy_context()
+                future = self._executor.submit(
+                    context.run, _call_thread_engine, getattr(self.engine_getter(), method), args, submitted
+                )
+        except Exception:
+            with self._lock:
+                self._in_flight -= 1
+            raise
+
+        # Count the job until it really finishes, even if the caller goes away
+        future.add_done_callback(self._release)
+        result = await asyncio.wrap_future(future)
+        if self.mode == "process":
+            result, timings = result
+            record_stages(timings)
+        return result
@@ -0,0 +1,287 @@
+"""
+Retrieval Benchmarks - Measures how the RAG index scales with knowledge base size.
+
+For each size, a synthetic KB mimicking data/knowledge.md is generated and the suite reports:
+- build time (parse + fit) and save time
+- load time of the persisted index
+- index size on disk and in RAM (array bytes) plus process peak RSS
+- p50/p95/p99 latency of VectorStore.search, VectorStore.multi_search,
+  RAGEngine.generate_answer and RAGEngine.generate_answers (per question)
+- for retrieval modes other than brute force, how often the top-k matches brute force
+  exactly (agreement) and the share of brute-force top-k documents found (recall)
+
+Results are written as JSON so runs can be compared between commits:
+
+  python -m benchmarks.run_benchmarks --sizes 1000,10000 --out benchmarks/results/mine.json
+  python -m benchmarks.run_benchmarks --sizes 1000,10000 --compare benchmarks/results/mine.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from backend.markdown_parser import iter_knowledge_base
+from backend.rag_engine import RAGEngine
+from backend.vector_store import VectorStore
+from benchmarks.synthetic_kb import KnowledgeBaseProfile, generate_pairs, write_knowledge_base
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Metrics where a higher value is a regression (all of them, currently)
+COMPARED_METRICS = (
+    "build_seconds", "load_seconds", "index_disk_bytes", "index_ram_bytes",
+    "search_p50_ms", "search_p99_ms", "multi_search_p50_ms", "multi_search_p99_ms",
+    "answer_p50_ms", "answer_p99_ms", "batch_per_question_ms",
+)
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    ms = np.asarray(samples) * 1000.0
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+    }
+
+
+def _time_calls(fn, queries: List[str]) -> List[float]:
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        fn(query)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def _dir_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def _index_ram_bytes(store: VectorStore) -> int:
+    total = 0
+    for matrix in (store.tfidf_matrix, store.question_matrix):
+        total += matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+    for extra in (store.scoring_matrix, store.inverted_index, store.dense_index):
+        if extra is not None:
+            total += extra.nbytes
+    return total
+
+
+def _peak_rss_bytes() -> int:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _make_queries(n_queries: int, n_pairs: int, profile: KnowledgeBaseProfile, seed: int) -> List[str]:
+    """Half existing question titles (without their tag), half fresh synthetic questions."""
+    rng = random.Random(seed)
+    wanted = set(rng.sample(range(n_pairs), min(n_pairs, n_queries // 2)))
+    queries = [
+        question.rsplit(" ", 1)[0]
+        for i, (question, _) in enumerate(generate_pairs(n_pairs, profile, seed=0))
+        if i in wanted
+    ]
+    fresh = generate_pairs(n_queries - len(queries), profile, seed=seed + 1)
+    queries += [question.rsplit(" ", 1)[0].lower() for question, _ in fresh]
+    rng.shuffle(queries)
+    return queries
+
+
+def _topk_agreement(store: VectorStore, reference: VectorStore, queries: List[str],
+                    top_k: int = 5) -> Dict[str, float]:
+    """
+    Share of queries whose ranked top-k (documents and scores) equals the
+    reference's, and the mean share of the reference's top-k documents found.
+    """
+    same = 0
+    recall = 0.0
+    for query in queries:
+        got = [(doc["question"], round(score, 9)) for doc, score in store.search(query, top_k)]
+        want = [(doc["question"], round(score, 9)) for doc, score in reference.search(query, top_k)]
+        same += got == want
+        wanted = {question for question, _ in want}
+        recall += len(wanted & {question for question, _ in got}) / len(wanted) if wanted else 1.0
+    return {
+        "topk_agreement": round(same / len(queries), 4),
+        "topk_recall": round(recall / len(queries), 4),
+    }
+
+
+def benchmark_size(n_pairs: int, profile: KnowledgeBaseProfile, work_dir: str,
+                   n_queries: int, seed: int, retrieval: str = "brute") -> Dict:
+    kb_path = os.path.join(work_dir, f"kb_{n_pairs}.md")
+    index_dir = os.path.join(work_dir, f"index_{n_pairs}")
+    if not os.path.exists(kb_path):
+        write_knowledge_base(kb_path, n_pairs, profile, seed=0)
+
+    print(f"[{n_pairs}/{retrieval}] building...")
+    started = time.perf_counter()
+    store = VectorStore(retrieval=retrieval)
+    store.build_index(iter_knowledge_base(kb_path))
+    build_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    store.save_index(index_dir)
+    save_seconds = time.perf_counter() - started
+    del store
+
+    print(f"[{n_pairs}/{retrieval}] loading...")
+    started = time.perf_counter()
+    loaded = VectorStore(retrieval=retrieval)
+    loaded.load_index(index_dir)
+    load_seconds = time.perf_counter() - started
+
+    engine = RAGEngine(kb_path=kb_path, cache_size=0)
+    engine.vector_store = loaded
+    engine.document_count = loaded.ntotal
+    engine.kb_version = "benchmark"
+    engine.is_ready = True
+
+    queries = _make_queries(n_queries, n_pairs, profile, seed)
+    # Warm up code paths and page in the mapped index
+    for query in queries[:5]:
+        engine.generate_answer(query)
+
+    print(f"[{n_pairs}/{retrieval}] querying ({len(queries)} queries)...")
+    search = _percentiles(_time_calls(lambda q: loaded.search(q, top_k=5), queries))
+    multi = _percentiles(_time_calls(lambda q: loaded.multi_search(engine.expand_query(q), top_k=5), queries))
+    answer = _percentiles(_time_calls(engine.generate_answer, queries))
+
+    started = time.perf_counter()
+    engine.generate_answers(queries)
+    batch_per_question_ms = (time.perf_counter() - started) * 1000.0 / len(queries)
+
+    agreement = {"topk_agreement": 1.0, "topk_recall": 1.0}
+    if retrieval != "brute":
+        reference = VectorStore()
+        reference.load_index(index_dir)
+        agreement = _topk_agreement(loaded, reference, queries)
+
+    return {
+        "pairs": n_pairs,
+        "retrieval": retrieval,
+        "build_seconds": round(build_seconds, 4),
+        "save_seconds": round(save_seconds, 4),
+        "load_seconds": round(load_seconds, 4),
+        "index_disk_bytes": _dir_size(index_dir),
+        "index_ram_bytes": _index_ram_bytes(loaded),
+        "peak_rss_bytes": _peak_rss_bytes(),
+        **{f"search_{k}": v for k, v in search.items()},
+        **{f"multi_search_{k}": v for k, v in multi.items()},
+        **{f"answer_{k}": v for k, v in answer.items()},
+        "batch_per_question_ms": round(batch_per_question_ms, 4),
+        **agreement,
+    }
+
+
+def _environment() -> Dict:
+    import scipy
+    import sklearn
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "scikit-learn": sklearn.__version__,
+        "cpu_count": os.cpu_count(),
+        "platform": platform.platform(),
+    }
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> bool:
+    """Print metric changes against a baseline. Returns False if anything regressed beyond tolerance."""
+    previous = {(row["pairs"], row.get("retrieval", "brute")): row for row in baseline["results"]}
+    ok = True
+    for row in results["results"]:
+        base = previous.get((row["pairs"], row["retrieval"]))
+        if base is None:
+            continue
+        print(f"\n{row['pairs']} pairs ({row['retrieval']}) vs baseline {baseline['environment'].get('git_commit')}:")
+        for metric in COMPARED_METRICS:
+            old, new = base.get(metric), row.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            flag = ""
+            if change > tolerance:
+                flag = "  <-- REGRESSION"
+                ok = False
+            print(f"  {metric:24s} {old:>14.4f} -> {new:>14.4f}  ({change:+.1%}){flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark index build/load/query scaling.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="Comma-separated KB sizes, e.g. 1000,10000,100000,1000000")
+    parser.add_argument("--queries", type=int, default=200, help="Queries timed per size")
+    parser.add_argument("--retrieval", default="brute",
+                        help="Comma-separated retrieval modes to benchmark, e.g. brute,inverted")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="Where to write the JSON results (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown before flagging")
+    parser.add_argument("--keep", action="store_true", help="Keep generated KBs and indexes")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    profile = KnowledgeBaseProfile()
+    work_dir = tempfile.mkdtemp(prefix="rag-bench-")
+
+    results = {"environment": _environment(), "results": []}
+    try:
+        for n_pairs in sizes:
+            for retrieval in args.retrieval.split(","):
+                row = benchmark_size(n_pairs, profile, work_dir, args.queries, args.seed, retrieval.strip())
+                results["results"].append(row)
+                print(json.dumps(row, indent=2))
+    finally:
+        if args.keep:
+            print(f"Benchmark files kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    out = args.out or os.path.join(RESULTS_DIR, f"{results['environment']['git_commit'] or 'latest'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Synthetic Knowledge Base - Generates Markdown Q&A files that look like data/knowledge.md.
+
+Handles:
+- Learning question/answer length distributions and word frequencies from a real KB
+- Generating any number of Q&A pairs with the same statistics (deterministic per seed)
+- Writing them as one Markdown file or as several shards, streaming to disk
+
+Run as:  python -m benchmarks.synthetic_kb --pairs 100000 --out /tmp/kb_100k.md
+"""
+
+import argparse
+import os
+import random
+import re
+from collections import Counter
+from typing import Iterator, List, Tuple
+
+from backend.markdown_parser import iter_knowledge_base
+from backend.rag_engine import DEFAULT_KB_PATH
+
+_WORD_RE = re.compile(r"[A-Za-z][A-Za-z']+")
+
+
+class KnowledgeBaseProfile:
+    """Length distributions and vocabulary of a real knowledge base."""
+
+    def __init__(self, source: str = DEFAULT_KB_PATH):
+        self.question_lengths: List[int] = []
+        self.answer_lengths: List[int] = []
+        question_words = Counter()
+        answer_words = Counter()
+
+        for doc in iter_knowledge_base(source):
+            q_words = _WORD_RE.findall(doc["question"])
+            a_words = _WORD_RE.findall(doc["answer"])
+            self.question_lengths.append(max(1, len(q_words)))
+            self.answer_lengths.append(max(3, len(a_words)))
+            question_words.update(w.lower() for w in q_words)
+            answer_words.update(w.lower() for w in a_words)
+
+        self.question_vocab, self.question_weights = self._table(question_words)
+        self.answer_vocab, self.answer_weights = self._table(answer_words + question_words)
+
+    @staticmethod
+    def _table(counts: Counter) -> Tuple[List[str], List[int]]:
+        words = sorted(counts)
+        return words, [counts[w] for w in words]
+
+
+def generate_pairs(n_pairs: int, profile: KnowledgeBaseProfile, seed: int = 0) -> Iterator[Tuple[str, str]]:
+    """Yield `n_pairs` (question, answer) tuples with the profile's statistics."""
+    rng = random.Random(seed)
+    for i in range(n_pairs):
+        q_len = rng.choice(profile.question_lengths)
+        a_len = rng.choice(profile.answer_lengths)
+        q_words = rng.choices(profile.question_vocab, profile.question_weights, k=q_len)
+        a_words = rng.choices(profile.answer_vocab, profile.answer_weights, k=a_len)
+        # A numeric tag keeps questions unique, like distinct feature titles
+        question = " ".join(w.capitalize() for w in q_words) + f" {i}"
+        answer = " ".join(a_words).capitalize() + "."
+        yield question, answer
+
+
+def write_knowledge_base(path: str, n_pairs: int, profile: KnowledgeBaseProfile,
+                         seed: int = 0, shards: int = 1) -> List[str]:
+    """
+    Write a synthetic KB. With shards > 1, `path` is a directory of shard files.
+    Returns the written file paths.
+    """
+    if shards > 1:
+        os.makedirs(path, exist_ok=True)
+        paths = [os.path.join(path, f"shard-{i:04d}.md") for i in range(shards)]
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        paths = [path]
+
+    files = [open(p, "w", encoding="utf-8") for p in paths]
+    try:
+        for f in files:
+            f.write("# Synthetic Knowledge Base\n\n")
+        for i, (question, answer) in enumerate(generate_pairs(n_pairs, profile, seed)):
+            files[i % len(files)].write(
+                f"### Question\n\n{question}\n\n### Answer\n\n{answer}\n\n---\n\n"
+            )
+    finally:
+        for f in files:
+            f.close()
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic knowledge base.")
+    parser.add_argument("--pairs", type=int, default=10000)
+    parser.add_argument("--out", required=True, help="Output .md file (or directory with --shards)")
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--source", default=DEFAULT_KB_PATH, help="Real KB to take statistics from")
+    args = parser.parse_args()
+
+    written = write_knowledge_base(args.out, args.pairs, KnowledgeBaseProfile(args.source), args.seed, args.shards)
+    print(f"Wrote {args.pairs} Q&A pairs to {len(written)} file(s).")
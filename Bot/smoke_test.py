@@ -0,0 +1,75 @@
+"""
+Smoke test of the real entry point: starts the server the way render.yaml does
+(python -m backend), single-process and with forked workers, and checks
+that it becomes healthy and answers /chat. Then checks every index file
+against its checksum (python -m backend.build_index --verify), which the
+server itself does not do on load.
+
+Run from Bot/:  python smoke_test.py
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+STARTUP_TIMEOUT = 120
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def request(port: int, path: str, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data, {"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=10) as response:
+        return response.status, json.load(response)
+
+
+def check(workers: int):
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), RAG_WORKERS=str(workers), RAG_KB_WATCH_INTERVAL="0")
+    server = subprocess.Popen([sys.executable, "-m", "backend"], env=env)
+    try:
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while True:
+            if server.poll() is not None:
+                raise SystemExit(f"workers={workers}: server exited with code {server.returncode}")
+            try:
+                _, health = request(port, "/health")
+                if health["status"] == "healthy":
+                    break
+            except (OSError, urllib.error.URLError, ValueError):
+                pass
+            if time.monotonic() > deadline:
+                raise SystemExit(f"workers={workers}: not healthy after {STARTUP_TIMEOUT}s")
+            time.sleep(0.2)
+
+        status, answer = request(port, "/chat", {"question": "dark mode", "userId": "smoke-test"})
+        if status != 200 or not answer.get("answer"):
+            raise SystemExit(f"workers={workers}: /chat returned {status}: {answer}")
+        print(f"workers={workers}: healthy, /chat answered (confidence {answer['confidence']})")
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def verify_index():
+    if subprocess.run([sys.executable, "-m", "backend.build_index", "--verify"]).returncode != 0:
+        raise SystemExit("index verification failed")
+
+
+if __name__ == "__main__":
+    for workers in (1, 2):
+        check(workers)
+    verify_index()
+    print("Smoke test passed.")
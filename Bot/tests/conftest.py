@@ -0,0 +1,50 @@
+"""Shared fixtures: small synthetic knowledge bases written to a temporary directory."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FEATURES = [
+    "journal", "mood", "diary", "profile", "password", "avatar", "friends", "chat",
+    "notifications", "theme", "backup", "privacy", "reminders", "tags", "calendar",
+    "search", "export", "language", "account", "messages", "photos", "goals",
+    "habits", "streaks", "community", "groups", "drafts", "sharing", "storage", "sync",
+]
+ACTIONS = ["change", "enable"]
+
+
+def qa_pairs():
+    """(question, answer) pairs, two per feature, worded so every pair is distinct."""
+    pairs = []
+    for i, feature in enumerate(FEATURES):
+        other = FEATURES[(i + 7) % len(FEATURES)]
+        for action in ACTIONS:
+            pairs.append((
+                f"How do I {action} my {feature}",
+                f"Open the {feature} settings, choose {action}, and confirm. "
+                f"This also updates your {other} preferences.",
+            ))
+    return pairs
+
+
+def write_kb(path, pairs):
+    """Write `pairs` in the knowledge base markdown format."""
+    records = [f"### Question\n\n{question}\n\n### Answer\n\n{answer}\n" for question, answer in pairs]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("# Test Knowledge Base\n\n" + "\n---\n\n".join(records))
+
+
+@pytest.fixture
+def kb(tmp_path):
+    """Path of a knowledge base file with qa_pairs()."""
+    path = tmp_path / "knowledge.md"
+    write_kb(path, qa_pairs())
+    return str(path)
+
+
+@pytest.fixture
+def index_dir(tmp_path):
+    return str(tmp_path / "index")
@@ -0,0 +1,85 @@
+"""Reloading an edited knowledge base updates the saved index in place, and reverting restores it."""
+
+from backend.engine_reloader import EngineReloader
+from backend.markdown_parser import QAPair
+from backend.rag_engine import RAGEngine
+from backend.vector_store import VectorStore
+
+from conftest import qa_pairs, write_kb
+
+QUERIES = ["change my password", "enable reminders", "backup settings", "export calendar"]
+
+
+def _results(engine):
+    return [
+        [(doc["question"], round(score, 6)) for doc, score in engine.vector_store.search(query, top_k=3)]
+        for query in QUERIES
+    ]
+
+
+def _reloader(kb, index_dir, engines):
+    return EngineReloader(
+        engine_factory=lambda: RAGEngine(kb_path=kb, index_dir=index_dir, cache_size=0),
+        on_swap=engines.append,
+        watch_paths=lambda: [kb],
+    )
+
+
+def test_update_reload_revert_round_trip(kb, index_dir):
+    engines = []
+    reloader = _reloader(kb, index_dir, engines)
+    assert reloader.reload()
+    original = engines[-1]
+    original_results = _results(original)
+
+    # Edit one answer using words the index already knows
+    pairs = qa_pairs()
+    question, _ = pairs[4]
+    pairs[4] = (question, "Open the privacy settings and choose sync to confirm your backup.")
+    write_kb(kb, pairs)
+    assert reloader.reload()
+    edited = engines[-1]
+    assert edited.vector_store.changes_since_fit == 2  # One row tombstoned, one appended
+    assert edited.kb_version != original.kb_version
+    assert edited.document_count == original.document_count
+    [(doc, _)] = edited.vector_store.search(question, top_k=1)
+    assert doc["answer"] == pairs[4][1]
+
+    # The saved index was updated too: a fresh engine reuses it as is
+    reused = RAGEngine(kb_path=kb, index_dir=index_dir, cache_size=0)
+    reused.initialize()
+    assert reused.vector_store.changes_since_fit == 2
+    assert reused.kb_version == edited.kb_version
+
+    # Reverting the edit brings back the original version and results
+    write_kb(kb, qa_pairs())
+    assert reloader.reload()
+    reverted = engines[-1]
+    assert reverted.vector_store.changes_since_fit == 4
+    assert reverted.kb_version == original.kb_version
+    assert reverted.vector_store.ntotal == original.vector_store.ntotal
+    assert _results(reverted) == original_results
+
+
+def test_new_words_force_full_refit(kb, index_dir):
+    RAGEngine(kb_path=kb, index_dir=index_dir).initialize()
+
+    write_kb(kb, qa_pairs() + [("Quantum Teleport", "Quantum teleport moves entries between devices.")])
+    engine = RAGEngine(kb_path=kb, index_dir=index_dir, cache_size=0)
+    engine.initialize()
+    store = engine.vector_store
+    assert store.changes_since_fit == 0  # Refitted, not patched
+    assert "quantum" in store.vectorizer.vocabulary_
+    [(doc, _)] = store.search("how does quantum teleport work", top_k=1)
+    assert doc["question"] == "Quantum Teleport"
+
+
+def test_update_index_refuses_question_without_known_words():
+    documents = [QAPair(question, answer) for question, answer in qa_pairs()]
+    store = VectorStore()
+    store.build_index(documents)
+
+    assert not store.update_index(documents + [QAPair("Quantum Teleport", "Open the journal settings.")])
+    assert store.ntotal == len(documents)  # Left untouched
+    assert store.update_index(documents + [QAPair("Change my journal theme", "Open the theme settings.")])
+    assert store.ntotal == len(documents) + 1
@@ -0,0 +1,63 @@
+"""The server only loads a prebuilt index that matches its knowledge base and settings."""
+
+import os
+
+import pytest
+
+from backend.build_index import build
+from backend.rag_engine import RAGEngine
+
+from conftest import qa_pairs, write_kb
+
+
+def _prebuilt_engine(kb, index_dir, **options):
+    engine = RAGEngine(kb_path=kb, index_dir=index_dir, prebuilt_index=True, cache_size=0, **options)
+    engine.initialize()
+    return engine
+
+
+def test_loads_matching_index(kb, index_dir):
+    build(kb, index_dir, workers=1)
+    engine = _prebuilt_engine(kb, index_dir)
+    assert engine.document_count == len(qa_pairs())
+    [(doc, _)] = engine.vector_store.search("change my password", top_k=1)
+    assert doc["question"] == "How do I change my password"
+
+
+def test_refuses_missing_index(kb, index_dir):
+    with pytest.raises(RuntimeError, match="does not match the knowledge base"):
+        _prebuilt_engine(kb, index_dir)
+
+
+def test_refuses_index_of_another_knowledge_base(kb, index_dir):
+    build(kb, index_dir, workers=1)
+    write_kb(kb, qa_pairs()[:-1])
+    with pytest.raises(RuntimeError, match="does not match the knowledge base"):
+        _prebuilt_engine(kb, index_dir)
+
+
+def test_refuses_index_without_dense_projection(kb, index_dir):
+    build(kb, index_dir, workers=1)
+    with pytest.raises(RuntimeError, match="retrieval without a dense projection"):
+        _prebuilt_engine(kb, index_dir, retrieval="dense")
+    assert not os.path.exists(os.path.join(index_dir, "dense"))  # Nothing was fitted or saved
+
+
+def test_refuses_other_dense_options(kb, index_dir):
+    build(kb, index_dir, workers=1, retrieval="dense", dense_options={"n_components": 16})
+    assert _prebuilt_engine(kb, index_dir, retrieval="dense", dense_options={"n_components": 16}).is_ready
+    with pytest.raises(RuntimeError, match="was built for dense options"):
+        _prebuilt_engine(kb, index_dir, retrieval="dense", dense_options={"n_components": 32})
+
+
+@pytest.mark.parametrize("verify_checksums", [False, True])
+def test_refuses_damaged_index(kb, index_dir, verify_checksums):
+    build(kb, index_dir, workers=1)
+    path = os.path.join(index_dir, "questions.blob")
+    with open(path, "r+b") as f:
+        if verify_checksums:
+            f.write(b"X")  # Same size, different content
+        else:
+            f.truncate(os.path.getsize(path) - 1)
+    with pytest.raises(RuntimeError, match="is damaged"):
+        _prebuilt_engine(kb, index_dir, verify_checksums=verify_checksums)